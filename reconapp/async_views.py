@@ -0,0 +1,230 @@
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Optional
+
+import pandas as pd
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.decorators import method_decorator
+from django.utils.http import content_disposition_header, http_date
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+
+from .exports import open_export, stream_export, EXPORT_FORMATS
+from .jobs import submit_job
+from .metrics import StageMetrics, timed
+from .models import ReconciliationJob, ReconciliationReport
+from .renderers import ORJSONRenderer
+from .serializers import FileUploadSerializer
+from .services import run_reconciliation, aresults_page
+from .uploads import save_upload
+from .views import reconciliation_options, export_validators, page_params, section_querysets, section_link
+
+logger = logging.getLogger(__name__)
+
+# Exports are streamed to the client in chunks of this size
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_async_executor() -> ThreadPoolExecutor:
+    """Return the process-wide pool that runs the reconciliations of the async endpoints off the event loop."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.RECONCILIATION_ASYNC_WORKERS, thread_name_prefix='reconciliation-async'
+            )
+        return _executor
+
+
+def _call_in_thread(function, *args, **kwargs):
+    try:
+        return function(*args, **kwargs)
+    finally:
+        # Pool threads get their own database connection, release it once the call is over
+        close_old_connections()
+
+
+async def run_blocking(function, *args, **kwargs):
+    """
+    _Run CPU-bound work, such as a reconciliation, on the async pool so the event loop keeps serving requests.
+    _With RECONCILIATION_ASYNC_WORKERS set to 0 it runs in the thread of the request's database calls instead.
+    """
+    if settings.RECONCILIATION_ASYNC_WORKERS <= 0:
+        return await sync_to_async(function)(*args, **kwargs)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_async_executor(), partial(_call_in_thread, function, *args, **kwargs))
+
+
+def json_response(data, status: int = 200) -> HttpResponse:
+    return HttpResponse(ORJSONRenderer().render(data), status=status, content_type='application/json')
+
+
+def _uploaded_data(request):
+    """Parse the multipart body, which writes the uploaded files to disk, into the data the serializer takes."""
+    data = request.POST.copy()
+    data.update(request.FILES)
+    return data
+
+
+def _save_uploads(metrics: StageMetrics, source_file, target_file):
+    with metrics.active(), timed('upload_save'):
+        return save_upload(source_file), save_upload(target_file)
+
+
+def _queue_job(source_file_instance, target_file_instance, options: dict) -> ReconciliationJob:
+    job = ReconciliationJob.objects.create(
+        source_file=source_file_instance,
+        target_file=target_file_instance,
+        options=options,
+    )
+    submit_job(job)
+    return job
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncFileUploadAndReconcileView(View):
+    """
+    _The async counterpart of FileUploadAndReconcileView, for ASGI servers, taking the same data and giving the same
+     responses.
+    _The ASGI handler spools the request body to disk as it arrives, without blocking the event loop. Parsing it,
+     saving the files and the database calls then run in threads, and the reconciliation itself on a bounded pool,
+     so one large upload does not hold up the other requests of the worker.
+    """
+
+    async def post(self, request, *args, **kwargs):
+        serializer = FileUploadSerializer(data=await sync_to_async(_uploaded_data)(request))
+        if not await sync_to_async(serializer.is_valid)():
+            return json_response(serializer.errors, status=400)
+
+        options = reconciliation_options(serializer.validated_data)
+        options['baseline_report_id'] = serializer.validated_data.get('baseline_report_id')
+        try:
+            metrics = StageMetrics()
+            source_file_instance, target_file_instance = await sync_to_async(_save_uploads)(
+                metrics, serializer.validated_data['source_file'], serializer.validated_data['target_file']
+            )
+
+            if serializer.validated_data.get('run_in_background', False):
+                job = await sync_to_async(_queue_job)(source_file_instance, target_file_instance, options)
+                return json_response({
+                    'message': 'Reconciliation queued.',
+                    'job_id': job.id,
+                    'status': job.status,
+                }, status=202)
+
+            report, missing_in_source, missing_in_target, discrepancies, summary = await run_blocking(
+                run_reconciliation, source_file_instance, target_file_instance, metrics=metrics, **options
+            )
+            response = {
+                'message': 'Reconciliation successful.',
+                'report_id': report.id,
+                'summary': summary,
+                'metrics': report.metrics_json,
+                'missing_in_target': missing_in_target,
+                'missing_in_source': missing_in_source,
+                'discrepancies': discrepancies,
+            }
+            if report.delta_json is not None:
+                response['delta'] = report.delta_json
+            return json_response(response)
+
+        except FileNotFoundError:
+            return json_response({'error': 'One or both of the uploaded files could not be found.'}, status=400)
+        except pd.errors.EmptyDataError:
+            return json_response({'error': 'One or both of the uploaded files are empty.'}, status=400)
+        except pd.errors.ParserError:
+            return json_response({'error': 'Error parsing one or both of the CSV files. Please ensure they are valid CSV.'}, status=400)
+        except ValueError as e:
+            return json_response({'error': str(e)}, status=400)
+        except Exception:
+            logger.exception("An unexpected error occurred during reconciliation.")
+            return json_response({'error': 'An unexpected error occurred during reconciliation.'}, status=500)
+
+
+async def _file_chunks(export_file):
+    """Read an export in chunks, each in a thread, closing it once it has been sent or the client went away."""
+    try:
+        while chunk := await sync_to_async(export_file.read, thread_sensitive=False)(EXPORT_CHUNK_SIZE):
+            yield chunk
+    finally:
+        await sync_to_async(export_file.close, thread_sensitive=False)()
+
+
+async def _arendered_chunks(first_chunk: bytes, chunks):
+    """
+    _Send an export while stream_export renders it, each chunk in the thread of the request's database calls, which
+     the lazily read results need. The rendering is closed, and its temporary file removed, if the client went away.
+    """
+    try:
+        yield first_chunk
+        while (chunk := await sync_to_async(next)(chunks, None)) is not None:
+            yield chunk
+    finally:
+        await sync_to_async(chunks.close)()
+
+
+class AsyncReconciliationReportDetailView(View):
+    """
+    _The async counterpart of ReconciliationReportDetailView, for ASGI servers.
+    _JSON pages are read with the async ORM. Stored CSV and HTML exports are streamed in chunks, with the same ETag
+     and Last-Modified validators. The others are sent as they are rendered, in a thread, and stored at the same time.
+    """
+
+    async def get(self, request, id, *args, **kwargs):
+        instance = await ReconciliationReport.objects.filter(id=id).afirst()
+        if instance is None:
+            return json_response({'error': 'Reconciliation report not found.'}, status=404)
+
+        format_type = request.GET.get('type', 'json').lower()
+        if format_type in EXPORT_FORMATS:
+            content_type = 'text/csv' if format_type == 'csv' else 'text/html'
+            disposition = content_disposition_header(True, f"Reconciliation_Report_Idno_{instance.id}.{format_type}")
+            try:
+                export_file = await sync_to_async(open_export)(instance, format_type)
+                if export_file is None:
+                    # Not cached yet: send the export as it renders, the first chunk surfaces early errors
+                    chunks = stream_export(instance, format_type)
+                    first_chunk = await sync_to_async(next)(chunks, b'')
+            except Exception as e:
+                logger.error(f"Error generating {format_type.upper()}: {e}")
+                return HttpResponse(f"Error generating {format_type.upper()}: {e}", status=500)
+
+            if export_file is None:
+                response = StreamingHttpResponse(_arendered_chunks(first_chunk, chunks), content_type=content_type)
+                response['Content-Disposition'] = disposition
+                return response
+
+            etag, last_modified = export_validators(instance, format_type, export_file)
+            not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if not_modified is not None:
+                export_file.close()
+                return not_modified
+
+            response = StreamingHttpResponse(_file_chunks(export_file), content_type=content_type)
+            response['Content-Disposition'] = disposition
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+            return response
+
+        try:
+            section, limit, after = page_params(request.GET)
+            pages = {}
+            for name, queryset in section_querysets(instance, request.GET, section):
+                results, next_after = await aresults_page(queryset, after if section else None, limit)
+                pages[name] = {'next': section_link(request.build_absolute_uri(), name, next_after), 'results': results}
+        except ValueError as e:
+            return json_response({'error': str(e)}, status=400)
+
+        if section is not None:
+            return json_response({'section': section, **pages[section]})
+        return json_response({'summary': instance.summary_json or {}, **pages})
@@ -0,0 +1,180 @@
+import json
+import logging
+import os
+import shutil
+import tempfile
+import zipfile
+from typing import Any, Dict, List, Optional
+
+from django.core.files import File
+from django.db import transaction
+
+from .jobs import submit_job
+from .models import ReconciliationBatch, ReconciliationJob, ReconciliationReport
+from .readers import input_format
+from .uploads import save_upload
+
+logger = logging.getLogger(__name__)
+
+# The name of the manifest inside a batch archive, used when the request sends none
+MANIFEST_NAME = 'manifest.json'
+
+
+def read_manifest(manifest: Any) -> List[dict]:
+    """
+    _Check a batch manifest and return its pairs.
+    _A manifest is a list of pairs, [{"source": "bank_a.csv", "target": "ledger_a.csv", "name": "Account A"}], where
+     source and target are the names of uploaded files or of files in the archive. A pair can also name the
+     baseline_report_id it is reconciled incrementally against.
+    """
+    if isinstance(manifest, (str, bytes)):
+        try:
+            manifest = json.loads(manifest)
+        except json.JSONDecodeError:
+            raise ValueError("The manifest must be valid JSON.")
+    if not isinstance(manifest, list) or not manifest:
+        raise ValueError("The manifest must be a list of at least one source/target pair.")
+    pairs = []
+    for index, pair in enumerate(manifest):
+        if not isinstance(pair, dict) or not isinstance(pair.get('source'), str) or not isinstance(pair.get('target'), str):
+            raise ValueError(f"Pair {index} of the manifest must name a 'source' and a 'target' file.")
+        baseline_report_id = pair.get('baseline_report_id')
+        if baseline_report_id is not None and not isinstance(baseline_report_id, int):
+            raise ValueError(f"The baseline_report_id of pair {index} must be an integer.")
+        pairs.append({
+            'name': str(pair.get('name') or f"{pair['source']} vs {pair['target']}")[:255],
+            'source': pair['source'],
+            'target': pair['target'],
+            'baseline_report_id': baseline_report_id,
+        })
+    return pairs
+
+
+def archive_members(archive, directory: str) -> Dict[str, File]:
+    """
+    _Extract the files of a batch archive into a directory and return them by their path in the archive.
+    _Members are copied one at a time to files of their own, so the archive is never held in memory.
+    """
+    try:
+        zipped = zipfile.ZipFile(archive)
+    except zipfile.BadZipFile:
+        raise ValueError("The batch archive must be a zip file.")
+    members = {}
+    with zipped:
+        for index, info in enumerate(zipped.infolist()):
+            if info.is_dir() or os.path.basename(info.filename).startswith('.') or info.filename.startswith('__MACOSX/'):
+                continue
+            path = os.path.join(directory, str(index))
+            with zipped.open(info) as source, open(path, 'wb') as target:
+                shutil.copyfileobj(source, target)
+            members[info.filename] = File(open(path, 'rb'), name=os.path.basename(info.filename))
+    return members
+
+
+def create_batch(files: Dict[str, Any], pairs: List[dict], options: dict) -> ReconciliationBatch:
+    """
+    _Save the files of a batch and queue one job per pair on the job pool, which bounds how many run at once.
+    _A file is looked up by its name, or by its name without directories. Each file is saved once, however many pairs
+     use it, and a file with the same content as a stored one is not written again. Pairs sharing a file then share
+     its parsed copy, which is built by whichever job needs it first.
+    """
+    by_basename = {}
+    for name, uploaded in files.items():
+        by_basename.setdefault(os.path.basename(name), []).append(uploaded)
+
+    def find(name: str):
+        if name in files:
+            return files[name]
+        candidates = by_basename.get(os.path.basename(name), [])
+        if len(candidates) != 1:
+            raise ValueError(f"File '{name}' of the manifest was not uploaded." if not candidates
+                             else f"File name '{name}' of the manifest is ambiguous, give its path in the archive.")
+        return candidates[0]
+
+    for pair in pairs:
+        for side in ['source', 'target']:
+            if not input_format(pair[side]):
+                raise ValueError(f"File '{pair[side]}' of the manifest is not a supported format.")
+            find(pair[side])
+    baseline_ids = {pair['baseline_report_id'] for pair in pairs if pair['baseline_report_id'] is not None}
+    missing = baseline_ids - set(ReconciliationReport.objects.filter(id__in=baseline_ids).values_list('id', flat=True))
+    if missing:
+        raise ValueError(f"No reconciliation report with id {', '.join(str(i) for i in sorted(missing))}.")
+
+    saved = {}
+    with transaction.atomic():
+        batch = ReconciliationBatch.objects.create(options=options)
+        jobs = []
+        for pair in pairs:
+            instances = []
+            for side in ['source', 'target']:
+                uploaded = find(pair[side])
+                if id(uploaded) not in saved:
+                    saved[id(uploaded)] = save_upload(uploaded)
+                instances.append(saved[id(uploaded)])
+            jobs.append(ReconciliationJob.objects.create(
+                batch=batch,
+                name=pair['name'],
+                source_file=instances[0],
+                target_file=instances[1],
+                options={**options, 'baseline_report_id': pair['baseline_report_id']},
+            ))
+    logger.info(f"Queued batch {batch.id} of {len(jobs)} pairs over {len(saved)} files.")
+    for job in jobs:
+        submit_job(job)
+    return batch
+
+
+def create_batch_from_request(
+    files: Optional[List[Any]],
+    archive: Optional[Any],
+    manifest: Optional[Any],
+    options: dict
+) -> ReconciliationBatch:
+    """Create a batch from uploaded files or from a zip archive, whose manifest.json is used when none is sent."""
+    if archive is None:
+        by_name = {uploaded.name: uploaded for uploaded in files or []}
+        if len(by_name) < len(files or []):
+            raise ValueError("The files of a batch must have distinct names.")
+        return create_batch(by_name, read_manifest(manifest), options)
+
+    with tempfile.TemporaryDirectory(prefix='recon_batch_') as directory:
+        members = archive_members(archive, directory)
+        try:
+            if manifest is None:
+                if MANIFEST_NAME not in members:
+                    raise ValueError(f"Send a manifest or include a {MANIFEST_NAME} in the archive.")
+                manifest = members[MANIFEST_NAME].read()
+            members.pop(MANIFEST_NAME, None)
+            return create_batch(members, read_manifest(manifest), options)
+        finally:
+            for member in members.values():
+                member.close()
+
+
+def batch_status(jobs: List[ReconciliationJob]) -> str:
+    """A batch is queued until one of its jobs starts, running until they have all finished, then done."""
+    statuses = {job.status for job in jobs}
+    if statuses <= {ReconciliationJob.STATUS_QUEUED}:
+        return ReconciliationJob.STATUS_QUEUED
+    if statuses & {ReconciliationJob.STATUS_QUEUED, ReconciliationJob.STATUS_RUNNING}:
+        return ReconciliationJob.STATUS_RUNNING
+    return ReconciliationJob.STATUS_DONE
+
+
+def rollup_summary(jobs: List[ReconciliationJob]) -> dict:
+    """
+    _Roll the summaries of the finished pairs up into one: the number of pairs in each status and the total of every
+     count, such as missing_in_target_count, over the reports of the batch.
+    """
+    pairs = {'total': len(jobs)}
+    for job in jobs:
+        pairs[job.status] = pairs.get(job.status, 0) + 1
+    totals: Dict[str, int] = {}
+    for job in jobs:
+        if job.report is None:
+            continue
+        for key, value in (job.report.summary_json or {}).items():
+            if isinstance(value, int) and not isinstance(value, bool):
+                totals[key] = totals.get(key, 0) + value
+    return {'pairs': pairs, **totals}
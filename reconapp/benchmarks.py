@@ -0,0 +1,317 @@
+import json
+import os
+import platform
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+from django.db import transaction
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from .metrics import rss_bytes
+from .utils import ReportFormatter, StreamingReportFormatter, normalize_dataframe, reconcile_data
+
+# Ledger sizes the benchmarks are run at, by the name they are selected with
+BENCHMARK_SIZES = {'10k': 10_000, '1m': 1_000_000, '10m': 10_000_000}
+BENCHMARK_CASES = [
+    'normalize_dataframe',
+    'reconcile_data',
+    'report_formatter_csv',
+    'report_formatter_html',
+    'streaming_export',
+    'http_endpoint',
+]
+# Share of the rows affected by each kind of fault the generator injects
+DEFAULT_RATES = {
+    'missing_rate': 0.01,
+    'duplicate_rate': 0.005,
+    'mismatch_rate': 0.01,
+    'flip_rate': 0.005,
+}
+DATE_FORMAT = '%Y-%m-%d'
+DESCRIPTIONS = [
+    'salary payment', 'supplier invoice', 'bank charges', 'card settlement',
+    'loan repayment', 'interest income', 'cash deposit', 'transfer out',
+]
+SAMPLE_INTERVAL = 0.005  # Seconds between two samples of the resident memory while a case runs
+_MB = 1024 * 1024
+
+
+def _keys(start: int, stop: int) -> np.ndarray:
+    return np.char.add('TXN', np.char.zfill(np.arange(start, stop).astype('U'), 10)).astype(object)
+
+
+def _ledger(keys: np.ndarray, dates: np.ndarray, descriptions: np.ndarray, amounts: np.ndarray, is_debit: np.ndarray) -> pd.DataFrame:
+    return pd.DataFrame({
+        'Txn RefNo': keys,
+        'Txndate': dates,
+        'Description': descriptions,
+        'Debit': np.where(is_debit, amounts, 0.0),
+        'Credit': np.where(is_debit, 0.0, amounts),
+    })
+
+
+def generate_ledgers(
+    rows: int,
+    missing_rate: float = DEFAULT_RATES['missing_rate'],
+    duplicate_rate: float = DEFAULT_RATES['duplicate_rate'],
+    mismatch_rate: float = DEFAULT_RATES['mismatch_rate'],
+    flip_rate: float = DEFAULT_RATES['flip_rate'],
+    seed: int = 0
+) -> tuple[pd.DataFrame, pd.DataFrame, dict]:
+    """
+    _Generate a source and a target ledger that reconcile except for the faults injected at the given rates.
+    _Every rate is a share of the rows: missing_rate drops source rows from the target and adds as many target-only
+     rows, duplicate_rate repeats rows in the source and other rows in the target, mismatch_rate changes the target
+     amount and flip_rate books the target on the same side as the source instead of the opposite one.
+    _The faults hit distinct rows, so the counts reconcile_data should report are exact. They are returned with the
+     ledgers. Descriptions differ only by case and whitespace between the sides, which normalization removes.
+    _The same seed always gives the same ledgers.
+    """
+    rates = {'missing_rate': missing_rate, 'duplicate_rate': duplicate_rate, 'mismatch_rate': mismatch_rate, 'flip_rate': flip_rate}
+    for name, rate in rates.items():
+        if not 0 <= rate <= 1:
+            raise ValueError(f"'{name}' must be between 0 and 1.")
+    missing, duplicates, mismatches, flips = (round(rows * rate) for rate in rates.values())
+    if missing + 2 * duplicates + mismatches + flips > rows:
+        raise ValueError("The fault rates add up to more rows than the ledger has.")
+
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range('2025-01-01', periods=365).strftime(DATE_FORMAT).to_numpy(dtype=object)
+    variants = np.array([variant for text in DESCRIPTIONS for variant in (text, text.upper(), text.title(), f"  {text} ")], dtype=object)
+
+    def descriptions(codes: np.ndarray) -> np.ndarray:
+        return variants[codes * 4 + rng.integers(0, 4, len(codes))]
+
+    description_codes = rng.integers(0, len(DESCRIPTIONS), rows)
+    row_dates = dates[rng.integers(0, len(dates), rows)]
+    amounts = rng.integers(1, 10_000_000, rows) / 100
+    is_debit = rng.random(rows) < 0.5
+    source = _ledger(_keys(0, rows), row_dates, descriptions(description_codes), amounts, is_debit)
+
+    # Each fault takes its own slice of one permutation, so no row carries two faults
+    bounds = np.cumsum([0, missing, duplicates, duplicates, mismatches, flips])
+    missing_rows, source_duplicates, target_duplicates, mismatch_rows, flip_rows = np.split(
+        rng.permutation(rows)[:bounds[-1]], bounds[1:-1]
+    )
+
+    target_amounts = amounts.copy()
+    target_amounts[mismatch_rows] += 1.0
+    target_is_debit = ~is_debit
+    target_is_debit[flip_rows] = is_debit[flip_rows]
+    target = _ledger(source['Txn RefNo'].to_numpy(), row_dates, descriptions(description_codes), target_amounts, target_is_debit)
+
+    extra_codes = rng.integers(0, len(DESCRIPTIONS), missing)
+    target_only = _ledger(
+        _keys(rows, rows + missing), dates[rng.integers(0, len(dates), missing)], descriptions(extra_codes),
+        rng.integers(1, 10_000_000, missing) / 100, rng.random(missing) < 0.5,
+    )
+    kept = np.ones(rows, dtype=bool)
+    kept[missing_rows] = False
+
+    source = pd.concat([source, source.iloc[source_duplicates]], ignore_index=True)
+    target = pd.concat([target[kept], target.iloc[target_duplicates], target_only], ignore_index=True)
+    target = target.iloc[rng.permutation(len(target))].reset_index(drop=True)
+
+    expected = {
+        'missing_in_target_count': missing,
+        'missing_in_source_count': missing,
+        'discrepancy_count': 2 * duplicates + mismatches + flips,
+        'duplicate_in_source_count': duplicates,
+        'duplicate_in_target_count': duplicates,
+    }
+    return source, target, expected
+
+
+@contextmanager
+def peak_rss() -> Iterator[dict]:
+    """
+    _Sample the resident memory of the process in a background thread while the block runs.
+    _The yielded dict holds 'peak_rss_mb' once the block is done. getrusage only knows the peak of the whole process,
+     so sampling is what gives each benchmark its own peak.
+    """
+    result = {'peak_rss_mb': 0.0}
+    peak = [rss_bytes()]
+    done = threading.Event()
+
+    def sample():
+        while not done.wait(SAMPLE_INTERVAL):
+            peak[0] = max(peak[0], rss_bytes())
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    try:
+        yield result
+    finally:
+        done.set()
+        sampler.join()
+        result['peak_rss_mb'] = round(max(peak[0], rss_bytes()) / _MB, 1)
+
+
+def measure(function: Callable[[], object], repeat: int = 1) -> dict:
+    """Run a benchmark repeat times and keep its fastest time and its highest peak memory."""
+    seconds, peak = [], 0.0
+    for _ in range(repeat):
+        with peak_rss() as memory:
+            started = time.perf_counter()
+            function()
+            seconds.append(time.perf_counter() - started)
+        peak = max(peak, memory['peak_rss_mb'])
+    return {'seconds': round(min(seconds), 6), 'peak_rss_mb': peak}
+
+
+def post_reconcile(source_path: str, target_path: str):
+    """
+    _Reconcile two CSV files through the upload endpoint, the way a client would.
+    _The uploads, parsed copies and exports go to a temporary MEDIA_ROOT and the database writes are rolled back, so
+     every run starts cold and the benchmark leaves nothing behind.
+    """
+    with tempfile.TemporaryDirectory() as media_root, \
+            override_settings(MEDIA_ROOT=media_root, ALLOWED_HOSTS=['testserver'],
+                              RECONCILIATION_PARSED_CACHE_DIR=None, RECONCILIATION_EXPORT_CACHE_DIR=None), \
+            transaction.atomic():
+        with open(source_path, 'rb') as source_file, open(target_path, 'rb') as target_file:
+            response = Client().post(reverse('reconcile'), {
+                'source_file': source_file,
+                'target_file': target_file,
+                'date_format': DATE_FORMAT,
+            })
+        transaction.set_rollback(True)
+    if response.status_code != 200:
+        raise RuntimeError(f"The reconcile endpoint answered {response.status_code}: {response.content[:500]!r}")
+
+
+def run_benchmarks(
+    rows: int,
+    cases: Optional[List[str]] = None,
+    repeat: int = 1,
+    seed: int = 0,
+    rates: Optional[Dict[str, float]] = None,
+    string_storage: str = 'object',
+    workers: int = 1
+) -> Dict[str, dict]:
+    """
+    _Time the selected cases on generated ledgers of the given size, returning the seconds and peak memory of each.
+    _The cases run as a pipeline: the normalized frames feed reconcile_data, whose results feed the formatters. A
+     case that is not selected still runs, untimed, when a later case needs its output. The reconciliation result is
+     checked against the injected faults, so a benchmark never times code that reconciles wrongly.
+    """
+    cases = cases or BENCHMARK_CASES
+    unknown = set(cases) - set(BENCHMARK_CASES)
+    if unknown:
+        raise ValueError(f"Unknown benchmark cases: {', '.join(sorted(unknown))}. Expected some of: {', '.join(BENCHMARK_CASES)}")
+    source, target, expected = generate_ledgers(rows, seed=seed, **{**DEFAULT_RATES, **(rates or {})})
+    results = {}
+
+    def normalize():
+        return (
+            normalize_dataframe(source, DATE_FORMAT, date_columns=['Txndate'], string_storage=string_storage),
+            normalize_dataframe(target, DATE_FORMAT, date_columns=['Txndate'], string_storage=string_storage),
+        )
+
+    if 'normalize_dataframe' in cases:
+        results['normalize_dataframe'] = measure(normalize, repeat)
+
+    if any(case != 'normalize_dataframe' for case in cases):
+        normalized_source, normalized_target = normalize()
+
+        def reconcile():
+            return reconcile_data(normalized_source, normalized_target, ['txn refno'], workers=workers)
+
+        if 'reconcile_data' in cases:
+            results['reconcile_data'] = measure(reconcile, repeat)
+        missing_in_source, missing_in_target, discrepancies, summary = reconcile()
+        if {key: summary[key] for key in expected} != expected:
+            raise RuntimeError(f"The reconciliation found {summary}, the generated ledgers hold {expected}.")
+
+        formatter = ReportFormatter(summary, missing_in_source, missing_in_target, discrepancies)
+        if 'report_formatter_csv' in cases:
+            results['report_formatter_csv'] = measure(formatter.to_csv, repeat)
+        if 'report_formatter_html' in cases:
+            results['report_formatter_html'] = measure(formatter.to_html, repeat)
+        if 'streaming_export' in cases:
+            sections = [
+                ("Missing in Source", missing_in_source),
+                ("Missing in Target", missing_in_target),
+                ("Discrepancies", discrepancies),
+            ]
+
+            def export():
+                streaming = StreamingReportFormatter([
+                    (title, list(records[0]) if records else [], records) for title, records in sections
+                ])
+                for _ in streaming.iter_csv():
+                    pass
+                for _ in streaming.iter_html():
+                    pass
+
+            results['streaming_export'] = measure(export, repeat)
+
+    if 'http_endpoint' in cases:
+        with tempfile.TemporaryDirectory() as directory:
+            source_path = os.path.join(directory, 'source.csv')
+            target_path = os.path.join(directory, 'target.csv')
+            source.to_csv(source_path, index=False)
+            target.to_csv(target_path, index=False)
+            results['http_endpoint'] = measure(lambda: post_reconcile(source_path, target_path), repeat)
+
+    return results
+
+
+def environment() -> dict:
+    """Describe where the benchmarks ran, since timings only compare on the same machine and library versions."""
+    return {
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def load_baseline(path: str) -> Optional[dict]:
+    """Read a stored baseline, or return None when there is none yet."""
+    try:
+        with open(path) as baseline_file:
+            return json.load(baseline_file)
+    except FileNotFoundError:
+        return None
+
+
+def save_baseline(path: str, results: Dict[str, Dict[str, dict]]):
+    """Store results as the baseline, keeping the sizes and cases of the previous baseline that were not run again."""
+    baseline = load_baseline(path) or {'results': {}}
+    for size, cases in results.items():
+        baseline['results'].setdefault(size, {}).update(cases)
+    baseline['environment'] = environment()
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w') as baseline_file:
+        json.dump(baseline, baseline_file, indent=2, sort_keys=True)
+
+
+def compare_to_baseline(results: Dict[str, Dict[str, dict]], baseline: dict, tolerance: float = 0.2) -> List[str]:
+    """
+    _Compare results with a baseline and describe every regression: a case that became slower or whose peak memory
+     grew by more than tolerance (0.2 is 20%). Sizes and cases missing from the baseline are not compared.
+    """
+    regressions = []
+    for size, cases in results.items():
+        for case, result in cases.items():
+            reference = baseline.get('results', {}).get(size, {}).get(case)
+            if reference is None:
+                continue
+            for metric in ['seconds', 'peak_rss_mb']:
+                if reference[metric] and result[metric] > reference[metric] * (1 + tolerance):
+                    regressions.append(
+                        f"{case} at {size} rows: {metric} went from {reference[metric]} to {result[metric]} "
+                        f"(+{(result[metric] / reference[metric] - 1):.0%})"
+                    )
+    return regressions
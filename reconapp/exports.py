@@ -0,0 +1,112 @@
+import logging
+import os
+import tempfile
+import time
+from typing import Any, BinaryIO, Iterable, Iterator, List, Optional
+
+from django.conf import settings
+
+from .models import ReconciliationReport, ReconciliationResult
+from .utils import StreamingReportFormatter, evict_least_recently_used
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = ['csv', 'html']
+
+
+def report_sections(report: ReconciliationReport) -> List[tuple[str, List[str], Iterable[Any]]]:
+    """
+    _Describe the sections of a report for StreamingReportFormatter.
+    _The columns of a section are taken from its first record and the records are read lazily from the database in
+     batches of RECONCILIATION_RESULT_BATCH_SIZE, so an export never holds the whole report in memory.
+    """
+    sections = []
+    for title, category in [
+        ("Missing in Source", ReconciliationResult.CATEGORY_MISSING_IN_SOURCE),
+        ("Missing in Target", ReconciliationResult.CATEGORY_MISSING_IN_TARGET),
+        ("Discrepancies", ReconciliationResult.CATEGORY_DISCREPANCY),
+    ]:
+        records = report.results.filter(category=category).order_by('position').values_list('data', flat=True)
+        first = records.first()
+        columns = list(first) if isinstance(first, dict) else []
+        sections.append((title, columns, records.iterator(chunk_size=settings.RECONCILIATION_RESULT_BATCH_SIZE)))
+    return sections
+
+
+def export_dir() -> str:
+    """Return the directory of the rendered export cache, MEDIA_ROOT/report_exports unless configured."""
+    return settings.RECONCILIATION_EXPORT_CACHE_DIR or os.path.join(settings.MEDIA_ROOT, 'report_exports')
+
+
+def export_path(report: ReconciliationReport, format_type: str) -> str:
+    """
+    _Return the cache path of an export, named after the report id and creation time.
+    _An id can be handed out again after the database is reset, or when SQLite reuses the id of the latest report
+     once it is deleted, and the time keeps such a report from being served the export of the previous one.
+    """
+    created = int(report.reconciliation_timestamp.timestamp() * 1_000_000)
+    return os.path.join(export_dir(), f"report_{report.id}_{created:x}.{format_type}")
+
+
+def stream_export(report: ReconciliationReport, format_type: str) -> Iterator[bytes]:
+    """
+    _Render a report export chunk by chunk, writing each chunk into the cache as it is yielded.
+    _The chunks go to a temporary file that is moved into place once the export is complete, so a download served
+     while it renders starts at once, and a concurrent download never sees a partial file. If the export is not
+     consumed to the end, such as when the client goes away, the temporary file is removed and nothing is cached.
+    """
+    formatter = StreamingReportFormatter(report_sections(report))
+    chunks = formatter.iter_csv() if format_type == 'csv' else formatter.iter_html()
+    os.makedirs(export_dir(), exist_ok=True)
+    path = export_path(report, format_type)
+    handle, temp_path = tempfile.mkstemp(dir=export_dir(), suffix='.tmp')
+    try:
+        with os.fdopen(handle, 'wb') as output:
+            for chunk in chunks:
+                data = chunk.encode('utf-8')
+                output.write(data)
+                yield data
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+    evict_exports(keep=path)
+
+
+def render_export(report: ReconciliationReport, format_type: str) -> str:
+    """Render a report export into the cache and return its path."""
+    for _ in stream_export(report, format_type):
+        pass
+    return export_path(report, format_type)
+
+
+def open_export(report: ReconciliationReport, format_type: str) -> Optional[BinaryIO]:
+    """
+    _Open the cached export of a report, or return None when it is not rendered yet, for stream_export to render.
+    _Reports never change once saved, so a cached export is always current. Opening the file also records the access
+     time that eviction goes by, and an open file can still be read if it gets evicted meanwhile.
+    """
+    path = export_path(report, format_type)
+    try:
+        export_file = open(path, 'rb')
+    except FileNotFoundError:
+        return None
+    try:
+        os.utime(path, (time.time(), os.fstat(export_file.fileno()).st_mtime))
+    except FileNotFoundError:
+        pass
+    return export_file
+
+
+def render_exports(report: ReconciliationReport, formats: List[str]):
+    """Fill the cache for a new report in the given formats."""
+    for format_type in formats:
+        try:
+            render_export(report, format_type)
+        except Exception:
+            logger.exception(f"Error rendering the {format_type} export of report {report.id}.")
+
+
+def evict_exports(keep: Optional[str] = None):
+    """Remove the least recently used exports, except keep, until the cache fits RECONCILIATION_EXPORT_CACHE_MAX_MB."""
+    evict_least_recently_used(export_dir(), settings.RECONCILIATION_EXPORT_CACHE_MAX_MB * 1024 * 1024, keep=keep)
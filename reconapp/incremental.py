@@ -0,0 +1,198 @@
+import logging
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from .metrics import timed
+from .utils import (
+    JOIN_KEY_COLUMN, POSITION_STRIDE, _comparable, _positional, keyed_frame, reconcile_partition, reconciliation_columns,
+    restore_join_columns,
+)
+
+logger = logging.getLogger(__name__)
+
+# The sections of a result, in the order reconcile_data returns them
+SECTIONS = ['missing_in_source', 'missing_in_target', 'discrepancies']
+# Join keys are stored on result rows cut to this length, longer keys are always reconciled again
+MAX_STORED_KEY_LENGTH = 255
+
+
+def row_hashes(frame: pd.DataFrame, join_column: str, ignore_columns: Optional[List[str]] = None) -> np.ndarray:
+    """
+    _Hash the content of every row of a normalized frame, leaving out the join column and the ignored columns.
+    _Text hashes by value, so equal rows hash the same whatever the string storage of their text columns.
+    """
+    columns = [col for col in frame.columns if col != join_column and (not ignore_columns or col not in ignore_columns)]
+    return pd.util.hash_pandas_object(frame[columns], index=False).to_numpy()
+
+
+def _key_fingerprints(codes: np.ndarray, hashes: np.ndarray, key_count: int) -> tuple[np.ndarray, np.ndarray]:
+    """Count the rows of every key and add up their hashes, so a key changes when any of its rows does."""
+    present = codes >= 0
+    counts = np.bincount(codes[present], minlength=key_count)
+    fingerprints = np.zeros(key_count, dtype=np.uint64)
+    np.add.at(fingerprints, codes[present], hashes[present])
+    return counts, fingerprints
+
+
+def _difference(records: List[dict], others: List[dict], join_columns: List[str]) -> List[dict]:
+    """Return the records that are not among the others, counting repeated records. Only records of a key are compared."""
+    def key(record: dict) -> tuple:
+        return tuple(record.get(col) for col in join_columns)
+
+    remaining = defaultdict(list)
+    for record in others:
+        remaining[key(record)].append(record)
+    difference = []
+    for record in records:
+        candidates = remaining.get(key(record))
+        if candidates and record in candidates:
+            candidates.remove(record)
+        else:
+            difference.append(record)
+    return difference
+
+
+def _stored_keys(uniques: np.ndarray, frames: List[pd.DataFrame], join_column: str) -> tuple[np.ndarray, np.ndarray]:
+    """
+    _Return the text every key is stored under on the result rows, which services._join_key makes with str(), and
+     whether the key can be looked up by it.
+    _A key cannot be looked up when it is a composite key hash, when it is not text or a number, when its text is cut
+     to MAX_STORED_KEY_LENGTH, or when another key prints the same, like the number 10 and the text '10'. Integer keys
+     mixed with float ones cannot either: they are factorized as floats and no longer print the way they were stored.
+    """
+    if join_column == JOIN_KEY_COLUMN:
+        return np.full(len(uniques), None, dtype=object), np.zeros(len(uniques), dtype=bool)
+    kind = pd.api.types.infer_dtype(uniques, skipna=False)
+    kinds = {frame[join_column].dtype.kind for frame in frames}
+    if kind == 'string':
+        keys = np.asarray(uniques, dtype=object)
+    elif kind == 'integer' or (kind == 'floating' and not kinds & {'i', 'u'}):
+        keys = np.asarray(pd.Index(uniques).astype(str), dtype=object)
+    else:
+        keys = np.array([
+            str(key) if isinstance(key, (str, int, np.integer)) and not isinstance(key, (bool, np.bool_)) else None
+            for key in uniques
+        ], dtype=object)
+    texts = pd.Series(keys, dtype=object)
+    readable = (texts.notna() & (texts.str.len() <= MAX_STORED_KEY_LENGTH) & ~texts.duplicated(keep=False)).to_numpy()
+    return keys, readable
+
+
+def reconcile_incremental(
+    source_df: pd.DataFrame,
+    target_df: pd.DataFrame,
+    baseline_source_df: pd.DataFrame,
+    baseline_target_df: pd.DataFrame,
+    baseline_records: Dict[str, List[tuple[Optional[str], dict]]],
+    join_columns: List[str],
+    ignore_columns: Optional[List[str]] = None,
+    debit_column: str = 'debit',
+    credit_column: str = 'credit',
+    aggregate_duplicates: bool = False
+) -> tuple[List[dict], List[dict], List[dict], dict, dict]:
+    """
+    _Reconcile new versions of a source and a target against the report of their previous versions.
+    _baseline_records holds the (join key, record) pairs of that report for each section, in report order, and the
+     baseline frames are its normalized inputs, read with the same options as the new ones.
+    _Every row is hashed and the hashes are added up per key on each side. A key that occurs at most once per side
+     and whose rows hashed the same in both versions keeps its records from the baseline report. Only the other keys,
+     which were added, removed or modified, and the keys with duplicates or without a value, are reconciled again.
+    _Keys are found among the stored results by their text, so text and numeric keys are reused alike. Composite
+     keys are stored as text that does not hash back to their key, so with several join columns every key is
+     reconciled again, see _stored_keys.
+    _The records are put in the order a full run would give them, from the position of their rows in the new files,
+     so the result is the same as reconcile_data on the new frames.
+    _Also returns the delta against the baseline: the records that appeared and the ones that were resolved, per
+     section, and how many keys were added, removed, modified or reused.
+    """
+    join_column, compare_columns = reconciliation_columns(
+        source_df, target_df, join_columns, ignore_columns, debit_column, credit_column
+    )
+    source_df = _positional(source_df)
+    target_df = _positional(target_df)
+    frames = [_positional(baseline_source_df), _positional(baseline_target_df), source_df, target_df]
+    if join_column == JOIN_KEY_COLUMN:
+        frames = [keyed_frame(frame, join_columns) for frame in frames]
+
+    with timed('change_detection'):
+        # One key index across both versions of both sides
+        keys = [_comparable(frame[join_column]) for frame in frames]
+        codes, uniques = pd.factorize(pd.concat(keys, ignore_index=True))
+        bounds = np.cumsum([0] + [len(frame) for frame in frames])
+        side_codes = [codes[bounds[i]:bounds[i + 1]] for i in range(len(frames))]
+        (old_source_counts, old_source_prints), (old_target_counts, old_target_prints), \
+            (source_counts, source_prints), (target_counts, target_prints) = [
+                _key_fingerprints(side, row_hashes(frame, join_column, ignore_columns), len(uniques))
+                for side, frame in zip(side_codes, frames)
+            ]
+
+        in_baseline = (old_source_counts + old_target_counts) > 0
+        in_new = (source_counts + target_counts) > 0
+        unchanged = (
+            (old_source_counts == source_counts) & (old_target_counts == target_counts)
+            & (old_source_prints == source_prints) & (old_target_prints == target_prints)
+        )
+        # Keys are looked up among the stored results by the text they were stored under
+        stored_keys, readable = _stored_keys(uniques, frames, join_column)
+        key_index = pd.Index(stored_keys[readable], dtype=object)
+        key_codes = np.flatnonzero(readable)
+        reusable = unchanged & (source_counts <= 1) & (target_counts <= 1) & readable
+
+        # Rows without a key have no code and are always reconciled again
+        source_rows = np.flatnonzero(~np.append(reusable, False)[side_codes[2]])
+        target_rows = np.flatnonzero(~np.append(reusable, False)[side_codes[3]])
+
+    logger.info(f"Reconciling {len(source_rows)} source and {len(target_rows)} target rows again, "
+                f"reusing {int(reusable.sum())} unchanged keys from the baseline.")
+    result, orders = reconcile_partition(
+        frames[2].iloc[source_rows], frames[3].iloc[target_rows], join_column, compare_columns, debit_column, credit_column,
+        aggregate_duplicates
+    )
+    if join_column == JOIN_KEY_COLUMN:
+        result = restore_join_columns(result, frames[2], frames[3], source_df, target_df, join_columns)
+
+    with timed('baseline_merge'):
+        # Where the row of each reused key now sits, on each side
+        source_position = np.full(len(uniques), -1, dtype=np.int64)
+        source_position[side_codes[2][side_codes[2] >= 0]] = np.flatnonzero(side_codes[2] >= 0)
+        target_position = np.full(len(uniques), -1, dtype=np.int64)
+        target_position[side_codes[3][side_codes[3] >= 0]] = np.flatnonzero(side_codes[3] >= 0)
+
+        merged, delta = [], {'added': {}, 'resolved': {}}
+        for index, section in enumerate(SECTIONS):
+            stored = baseline_records.get(section, [])
+            stored_codes = np.append(key_codes, -1)[key_index.get_indexer(pd.Index([key for key, _ in stored], dtype=object))]
+            reused = (stored_codes >= 0) & np.append(reusable, False)[stored_codes]
+            reused_codes = stored_codes[reused]
+            if section == 'missing_in_source':
+                positions = target_position[reused_codes]
+            elif section == 'missing_in_target':
+                positions = source_position[reused_codes]
+            else:
+                positions = source_position[reused_codes] + 2 * POSITION_STRIDE
+
+            records = [record for (_, record), keep in zip(stored, reused) if keep] + result[index]
+            order = np.concatenate([positions, orders[index]])
+            merged.append([records[i] for i in np.argsort(order, kind='stable')])
+
+            replaced = [record for (_, record), keep in zip(stored, reused) if not keep]
+            delta['added'][section] = _difference(result[index], replaced, join_columns)
+            delta['resolved'][section] = _difference(replaced, result[index], join_columns)
+
+    missing_in_source, missing_in_target, discrepancies = merged
+    summary = {
+        **result[3],
+        'missing_in_target_count': len(missing_in_target),
+        'missing_in_source_count': len(missing_in_source),
+        'discrepancy_count': len(discrepancies),
+    }
+    delta['keys'] = {
+        'added': int((in_new & ~in_baseline).sum()),
+        'removed': int((in_baseline & ~in_new).sum()),
+        'modified': int((in_new & in_baseline & ~unchanged).sum()),
+        'reused': int(reusable.sum()),
+    }
+    return missing_in_source, missing_in_target, discrepancies, summary, delta
@@ -0,0 +1,79 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import pandas as pd
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .models import ReconciliationJob
+from .services import run_reconciliation
+
+logger = logging.getLogger(__name__)
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Return the process-wide pool that runs the background reconciliation jobs."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.RECONCILIATION_JOB_WORKERS, thread_name_prefix='reconciliation-job'
+            )
+        return _executor
+
+
+def submit_job(job: ReconciliationJob):
+    """
+    _Queue a job on the local worker pool.
+    _With RECONCILIATION_JOB_WORKERS set to 0 the job runs right away in the calling thread instead.
+    """
+    if settings.RECONCILIATION_JOB_WORKERS <= 0:
+        run_job(job.id)
+    else:
+        get_executor().submit(_run_job_in_thread, job.id)
+
+
+def _run_job_in_thread(job_id: int):
+    try:
+        run_job(job_id)
+    finally:
+        # Worker threads get their own database connection, release it once the job is over
+        close_old_connections()
+
+
+def run_job(job_id: int):
+    """Run a queued job and record whether it is done or failed."""
+    job = ReconciliationJob.objects.get(id=job_id)
+    job.status = ReconciliationJob.STATUS_RUNNING
+    job.started_timestamp = timezone.now()
+    job.save(update_fields=['status', 'started_timestamp'])
+
+    try:
+        report, *_ = run_reconciliation(job.source_file, job.target_file, **job.options)
+        job.report = report
+        job.status = ReconciliationJob.STATUS_DONE
+    except FileNotFoundError:
+        job.status = ReconciliationJob.STATUS_FAILED
+        job.error = 'One or both of the uploaded files could not be found.'
+    except pd.errors.EmptyDataError:
+        job.status = ReconciliationJob.STATUS_FAILED
+        job.error = 'One or both of the uploaded files are empty.'
+    except pd.errors.ParserError:
+        job.status = ReconciliationJob.STATUS_FAILED
+        job.error = 'Error parsing one or both of the CSV files. Please ensure they are valid CSV.'
+    except ValueError as e:
+        job.status = ReconciliationJob.STATUS_FAILED
+        job.error = str(e)
+    except Exception:
+        logger.exception(f"An unexpected error occurred during reconciliation job {job_id}.")
+        job.status = ReconciliationJob.STATUS_FAILED
+        job.error = 'An unexpected error occurred during reconciliation.'
+
+    job.finished_timestamp = timezone.now()
+    job.save(update_fields=['report', 'status', 'error', 'finished_timestamp'])
@@ -0,0 +1,73 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from reconapp.benchmarks import (
+    BENCHMARK_CASES, BENCHMARK_SIZES, DEFAULT_RATES, compare_to_baseline, environment, load_baseline, run_benchmarks,
+    save_baseline,
+)
+from reconapp.utils import STRING_STORAGES
+
+
+class Command(BaseCommand):
+    help = (
+        "Time normalization, reconciliation, report exports and the upload endpoint on generated ledgers and compare "
+        "the timings and peak memory with the stored baseline. Fails when a case regressed beyond the tolerance."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', action='append', choices=list(BENCHMARK_SIZES),
+                            help="Ledger size to run, repeat it for several sizes (default: 10k).")
+        parser.add_argument('--case', action='append', choices=BENCHMARK_CASES,
+                            help="Benchmark to run, repeat it for several cases (default: all of them).")
+        parser.add_argument('--repeat', type=int, default=3, help="Runs of each case, the fastest one is kept.")
+        parser.add_argument('--seed', type=int, default=0, help="Seed of the ledger generator.")
+        for name, rate in DEFAULT_RATES.items():
+            parser.add_argument(f"--{name.replace('_', '-')}", dest=name, type=float, default=rate,
+                                help=f"Share of the rows with this fault (default: {rate}).")
+        parser.add_argument('--string-storage', choices=STRING_STORAGES, default=settings.RECONCILIATION_STRING_STORAGE,
+                            help="String storage of the normalized text columns.")
+        parser.add_argument('--workers', type=int, default=1, help="Worker processes used by reconcile_data.")
+        parser.add_argument('--baseline', default=settings.RECONCILIATION_BENCHMARK_BASELINE,
+                            help="Baseline file to compare with, or to write with --update-baseline.")
+        parser.add_argument('--tolerance', type=float, default=settings.RECONCILIATION_BENCHMARK_TOLERANCE,
+                            help="Relative slowdown or memory growth allowed before a case counts as a regression.")
+        parser.add_argument('--update-baseline', action='store_true',
+                            help="Store these results as the baseline instead of comparing with it.")
+        parser.add_argument('--output', help="Also write the results to this JSON file.")
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError("--repeat must be at least 1.")
+        rates = {name: options[name] for name in DEFAULT_RATES}
+        results = {}
+        for size in options['size'] or ['10k']:
+            rows = BENCHMARK_SIZES[size]
+            self.stdout.write(f"Benchmarking {rows} rows...")
+            try:
+                cases = run_benchmarks(rows, options['case'], options['repeat'], options['seed'], rates,
+                                       options['string_storage'], options['workers'])
+            except ValueError as e:
+                raise CommandError(str(e))
+            results[str(rows)] = cases
+            for case, result in cases.items():
+                self.stdout.write(f"  {case:<24} {result['seconds']:>10.3f}s {result['peak_rss_mb']:>10.1f} MB peak RSS")
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump({'environment': environment(), 'results': results}, output, indent=2, sort_keys=True)
+
+        if options['update_baseline']:
+            save_baseline(options['baseline'], results)
+            self.stdout.write(self.style.SUCCESS(f"Baseline stored in {options['baseline']}."))
+            return
+
+        baseline = load_baseline(options['baseline'])
+        if baseline is None:
+            self.stdout.write(f"No baseline at {options['baseline']}, store one with --update-baseline.")
+            return
+        regressions = compare_to_baseline(results, baseline, options['tolerance'])
+        if regressions:
+            raise CommandError("Regressions against the baseline:\n" + "\n".join(regressions))
+        self.stdout.write(self.style.SUCCESS(f"No regression beyond {options['tolerance']:.0%} of the baseline."))
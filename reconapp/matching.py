@@ -0,0 +1,178 @@
+import bisect
+import logging
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+from .metrics import timed
+
+logger = logging.getLogger(__name__)
+
+# Amounts are floats, so a difference this much past the tolerance still counts as within it
+AMOUNT_EPSILON = 1e-9
+NS_PER_DAY = 86_400 * 10**9
+# The direction of a row: a source debit pairs with a target credit and a source credit with a target debit
+DEBIT_SIDE, CREDIT_SIDE, NO_AMOUNT = 0, 1, -1
+
+
+def _side_column(records: List[dict], column: str, suffix: str) -> str:
+    """Return the name of a column in the unmatched records of one side, suffixed when both files have it."""
+    name = f"{column}{suffix}"
+    return name if records and name in records[0] else column
+
+
+def _side_values(records: List[dict], column: str, suffix: str) -> pd.Series:
+    name = _side_column(records, column, suffix)
+    return pd.Series([record.get(name) for record in records], dtype=object)
+
+
+def _amounts(records: List[dict], suffix: str, mirrored: bool, debit_column: str, credit_column: str) -> tuple[np.ndarray, np.ndarray]:
+    """
+    _Return the amount and the direction of every record, the way locate_discrepancies reads them: the debit when it is
+     set and not zero, the credit otherwise. Target rows are mirrored, so that matching directions are equal.
+    """
+    debits = pd.to_numeric(_side_values(records, debit_column, suffix), errors='coerce').to_numpy(dtype=float)
+    credits = pd.to_numeric(_side_values(records, credit_column, suffix), errors='coerce').to_numpy(dtype=float)
+    is_debit = ~np.isnan(debits) & (debits != 0)
+    is_credit = ~is_debit & ~np.isnan(credits) & (credits != 0)
+    debit_side, credit_side = (CREDIT_SIDE, DEBIT_SIDE) if mirrored else (DEBIT_SIDE, CREDIT_SIDE)
+    directions = np.select([is_debit, is_credit], [debit_side, credit_side], default=NO_AMOUNT)
+    return np.where(is_debit, debits, credits), directions
+
+
+def _days(records: List[dict], date_column: str, suffix: str, date_format: Optional[str]) -> np.ndarray:
+    """
+    _Return the day of every record as a number of days since the epoch, or the smallest int64 when it has no date.
+    _Dates converted during normalization are ISO strings in the records. Text dates are read with date_format.
+    """
+    values = _side_values(records, date_column, suffix)
+    dates = pd.to_datetime(values, errors='coerce', format='ISO8601', utc=True)
+    failed = dates.isna() & values.notna()
+    if date_format and failed.any():
+        dates[failed] = pd.to_datetime(values[failed], errors='coerce', format=date_format, utc=True)
+    stamps = dates.dt.tz_convert(None).to_numpy(dtype='datetime64[ns]')
+    return np.where(np.isnat(stamps), np.iinfo(np.int64).min, stamps.view(np.int64) // NS_PER_DAY)
+
+
+def _sweep(
+    source_amounts: List[float],
+    source_days: List[int],
+    target_amounts: List[float],
+    target_days: List[int],
+    amount_tolerance: float,
+    date_window_days: int
+) -> List[tuple[int, int]]:
+    """
+    _Pair the rows of one direction, each source row with the closest unmatched target row by date, then by amount,
+     that is within the amount tolerance and the date window.
+    _Both sides are sorted by amount and swept together. The target rows within the tolerance of the current source
+     amount are kept in a list sorted by (day, amount), where the closest one is found by bisection, so no pair of
+     rows is ever compared unless their amounts are within the tolerance.
+    """
+    source_order = sorted(range(len(source_amounts)), key=source_amounts.__getitem__)
+    target_order = sorted(range(len(target_amounts)), key=target_amounts.__getitem__)
+    tolerance = amount_tolerance + AMOUNT_EPSILON
+    active: List[tuple[int, float, int]] = []
+    matched = set()
+    pairs = []
+    added = expired = 0
+    for source in source_order:
+        amount, day = source_amounts[source], source_days[source]
+        while added < len(target_order) and target_amounts[target_order[added]] <= amount + tolerance:
+            target = target_order[added]
+            bisect.insort(active, (target_days[target], target_amounts[target], target))
+            added += 1
+        while expired < added and target_amounts[target_order[expired]] < amount - tolerance:
+            target = target_order[expired]
+            if target not in matched:
+                del active[bisect.bisect_left(active, (target_days[target], target_amounts[target], target))]
+            expired += 1
+
+        index = bisect.bisect_left(active, (day, amount, -1))
+        candidates = [i for i in (index - 1, index) if 0 <= i < len(active)]
+        if not candidates:
+            continue
+        best = min(candidates, key=lambda i: (abs(active[i][0] - day), abs(active[i][1] - amount)))
+        target_day, _, target = active[best]
+        if abs(target_day - day) <= date_window_days:
+            del active[best]
+            matched.add(target)
+            pairs.append((source, target))
+    return pairs
+
+
+def match_near_misses(
+    missing_in_source: List[dict],
+    missing_in_target: List[dict],
+    join_columns: List[str],
+    amount_tolerance: float = 0.0,
+    date_column: Optional[str] = None,
+    date_window_days: int = 0,
+    date_format: Optional[str] = None,
+    debit_column: str = 'debit',
+    credit_column: str = 'credit'
+) -> tuple[List[dict], List[dict], List[dict]]:
+    """
+    _This is the second pass of a reconciliation, for the rows whose join keys found no match.
+    _A source row missing in the target is paired with a target row missing in the source when their amounts are
+     within amount_tolerance of each other, in opposite directions as double entry requires, and, with a date_column,
+     when their dates are at most date_window_days apart. Each row is paired at most once. Rows without an amount,
+     or without a date when a date column is given, stay unmatched.
+    _Returns the records still missing in source and in target, and a near_match discrepancy for every pair, in the
+     order of the source rows.
+    """
+    if not missing_in_source or not missing_in_target:
+        return missing_in_source, missing_in_target, []
+    if date_column is not None and not (_side_column(missing_in_target, date_column, '_source') in missing_in_target[0]
+                                        and _side_column(missing_in_source, date_column, '_target') in missing_in_source[0]):
+        raise ValueError(f"Date column '{date_column}' not found in both files after normalization.")
+
+    with timed('near_match'):
+        source_amounts, source_directions = _amounts(missing_in_target, '_source', False, debit_column, credit_column)
+        target_amounts, target_directions = _amounts(missing_in_source, '_target', True, debit_column, credit_column)
+        if date_column is not None:
+            source_days = _days(missing_in_target, date_column, '_source', date_format)
+            target_days = _days(missing_in_source, date_column, '_target', date_format)
+        else:
+            source_days = np.zeros(len(missing_in_target), dtype=np.int64)
+            target_days = np.zeros(len(missing_in_source), dtype=np.int64)
+        no_date = np.iinfo(np.int64).min
+
+        pairs = []
+        for direction in (DEBIT_SIDE, CREDIT_SIDE):
+            sources = np.flatnonzero((source_directions == direction) & (source_days != no_date))
+            targets = np.flatnonzero((target_directions == direction) & (target_days != no_date))
+            if sources.size == 0 or targets.size == 0:
+                continue
+            found = _sweep(
+                source_amounts[sources].tolist(), source_days[sources].tolist(),
+                target_amounts[targets].tolist(), target_days[targets].tolist(),
+                amount_tolerance, date_window_days
+            )
+            pairs.extend((int(sources[source]), int(targets[target])) for source, target in found)
+        pairs.sort()
+
+        near_matches = []
+        source_date = _side_column(missing_in_target, date_column or '', '_source')
+        target_date = _side_column(missing_in_source, date_column or '', '_target')
+        for source, target in pairs:
+            source_record, target_record = missing_in_target[source], missing_in_source[target]
+            details = {
+                'target': {col: target_record.get(col) for col in join_columns},
+                'amount': {'source': float(source_amounts[source]), 'target': float(target_amounts[target])},
+            }
+            if date_column is not None:
+                details['date'] = {'source': source_record.get(source_date), 'target': target_record.get(target_date)}
+            near_matches.append({
+                **{col: source_record.get(col) for col in join_columns},
+                'discrepancies': {'near_match': details},
+            })
+
+        matched_sources = {source for source, _ in pairs}
+        matched_targets = {target for _, target in pairs}
+        missing_in_target = [record for i, record in enumerate(missing_in_target) if i not in matched_sources]
+        missing_in_source = [record for i, record in enumerate(missing_in_source) if i not in matched_targets]
+
+    logger.info(f"Paired {len(near_matches)} unmatched rows within the amount tolerance and date window.")
+    return missing_in_source, missing_in_target, near_matches
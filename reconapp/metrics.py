@@ -0,0 +1,107 @@
+import contextvars
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+_MB = 1024 * 1024
+
+_active: contextvars.ContextVar[Optional['StageMetrics']] = contextvars.ContextVar('reconciliation_metrics', default=None)
+
+
+def rss_bytes() -> int:
+    """Return the resident memory of the process, from /proc when available or the peak reported by getrusage."""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        if resource is None:
+            return 0
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class StageMetrics:
+    """
+        _Timing and memory counters for the stages of one reconciliation._
+        _A stage that runs more than once, for each file or each bucket, adds up its time and counts its calls.
+        _Memory is the resident size of the whole process, so with concurrent jobs it is an upper bound.
+    """
+    def __init__(self):
+        self.stages: Dict[str, dict] = {}
+        self.started = time.perf_counter()
+        self.peak_rss = rss_bytes()
+
+    def record(self, name: str, seconds: float, rss_before: int, rss_after: int):
+        stage = self.stages.setdefault(name, {'seconds': 0.0, 'calls': 0, 'rss_delta_mb': 0.0})
+        stage['seconds'] += seconds
+        stage['calls'] += 1
+        stage['rss_delta_mb'] += (rss_after - rss_before) / _MB
+        self.peak_rss = max(self.peak_rss, rss_after)
+
+    @contextmanager
+    def active(self) -> Iterator['StageMetrics']:
+        """Collect the stages timed in this context (thread or task) into these metrics."""
+        token = _active.set(self)
+        try:
+            yield self
+        finally:
+            _active.reset(token)
+
+    def as_dict(self) -> dict:
+        return {
+            'total_seconds': round(time.perf_counter() - self.started, 6),
+            'peak_rss_mb': round(self.peak_rss / _MB, 1),
+            'stages': {
+                name: {
+                    'seconds': round(stage['seconds'], 6),
+                    'calls': stage['calls'],
+                    'rss_delta_mb': round(stage['rss_delta_mb'], 1),
+                }
+                for name, stage in self.stages.items()
+            },
+        }
+
+
+@contextmanager
+def timed(name: str) -> Iterator[None]:
+    """Time a stage into the active metrics. Without active metrics, as in pool worker processes, this does nothing."""
+    metrics = _active.get()
+    if metrics is None:
+        yield
+        return
+    rss_before = rss_bytes()
+    started = time.perf_counter()
+    yield
+    # A stage that raised, like a lookup in the parsed cache that misses, is not recorded
+    metrics.record(name, time.perf_counter() - started, rss_before, rss_bytes())
+
+
+def summarize(runs) -> dict:
+    """Aggregate the metrics of several reconciliations into per-stage totals, means and maxima."""
+    stages: Dict[str, dict] = {}
+    count = 0
+    total_seconds = 0.0
+    for run in runs:
+        if not run:
+            continue
+        count += 1
+        total_seconds += run.get('total_seconds', 0.0)
+        for name, stage in run.get('stages', {}).items():
+            summary = stages.setdefault(name, {'runs': 0, 'total_seconds': 0.0, 'max_seconds': 0.0})
+            summary['runs'] += 1
+            summary['total_seconds'] += stage['seconds']
+            summary['max_seconds'] = max(summary['max_seconds'], stage['seconds'])
+    for summary in stages.values():
+        summary['mean_seconds'] = round(summary['total_seconds'] / summary['runs'], 6)
+        summary['total_seconds'] = round(summary['total_seconds'], 6)
+    return {
+        'reports': count,
+        'mean_total_seconds': round(total_seconds / count, 6) if count else None,
+        'stages': stages,
+    }
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:29
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reconapp', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReconciliationJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('options', models.JSONField(default=dict)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='queued', max_length=16)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('created_timestamp', models.DateTimeField(default=django.utils.timezone.now)),
+                ('started_timestamp', models.DateTimeField(blank=True, null=True)),
+                ('finished_timestamp', models.DateTimeField(blank=True, null=True)),
+                ('report', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='jobs', to='reconapp.reconciliationreport')),
+                ('source_file', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='source_jobs', to='reconapp.uploadedfile')),
+                ('target_file', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='target_jobs', to='reconapp.uploadedfile')),
+            ],
+        ),
+    ]
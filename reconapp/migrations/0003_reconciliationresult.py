@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reconapp', '0002_reconciliationjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReconciliationResult',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('category', models.CharField(choices=[('missing_in_source', 'Missing in Source'), ('missing_in_target', 'Missing in Target'), ('discrepancy', 'Discrepancy')], max_length=32)),
+                ('position', models.PositiveIntegerField()),
+                ('join_key', models.CharField(blank=True, max_length=255, null=True)),
+                ('data', models.JSONField()),
+                ('report', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='results', to='reconapp.reconciliationreport')),
+            ],
+            options={
+                'ordering': ['report', 'category', 'position'],
+                'indexes': [models.Index(fields=['report', 'category', 'position'], name='reconapp_re_report__e795a5_idx'), models.Index(fields=['report', 'category', 'join_key'], name='reconapp_re_report__79363b_idx')],
+            },
+        ),
+    ]
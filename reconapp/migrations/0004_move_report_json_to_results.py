@@ -0,0 +1,65 @@
+import json
+import math
+
+from django.db import migrations
+
+BATCH_SIZE = 1000
+
+SECTIONS = [
+    ('missing_in_source', 'missing_in_source_json'),
+    ('missing_in_target', 'missing_in_target_json'),
+    ('discrepancy', 'discrepancies_json'),
+]
+
+
+def _records(value):
+    # The missing records used to be saved as a JSON string inside the JSONField
+    if isinstance(value, str):
+        value = json.loads(value)
+    return value or []
+
+
+def _join_key(record, join_column):
+    value = record.get(join_column) if isinstance(record, dict) else None
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    return str(value)[:255]
+
+
+def move_json_to_results(apps, schema_editor):
+    ReconciliationReport = apps.get_model('reconapp', 'ReconciliationReport')
+    ReconciliationResult = apps.get_model('reconapp', 'ReconciliationResult')
+    for report in ReconciliationReport.objects.all().iterator():
+        join_column = (report.join_columns or '').split(',')[0]
+        for category, field in SECTIONS:
+            rows = [
+                ReconciliationResult(report=report, category=category, position=position,
+                                     join_key=_join_key(record, join_column), data=record)
+                for position, record in enumerate(_records(getattr(report, field)))
+            ]
+            ReconciliationResult.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+            setattr(report, field, None)
+        report.save(update_fields=[field for _, field in SECTIONS])
+
+
+def move_results_to_json(apps, schema_editor):
+    ReconciliationReport = apps.get_model('reconapp', 'ReconciliationReport')
+    ReconciliationResult = apps.get_model('reconapp', 'ReconciliationResult')
+    for report in ReconciliationReport.objects.all().iterator():
+        for category, field in SECTIONS:
+            records = list(ReconciliationResult.objects.filter(report=report, category=category)
+                           .order_by('position').values_list('data', flat=True))
+            setattr(report, field, records)
+        report.save(update_fields=[field for _, field in SECTIONS])
+    ReconciliationResult.objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reconapp', '0003_reconciliationresult'),
+    ]
+
+    operations = [
+        migrations.RunPython(move_json_to_results, move_results_to_json),
+    ]
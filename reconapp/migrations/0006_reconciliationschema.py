@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:46
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reconapp', '0005_uploadedfile_content_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReconciliationSchema',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('columns', models.JSONField()),
+                ('date_format', models.CharField(blank=True, max_length=50, null=True)),
+                ('created_timestamp', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
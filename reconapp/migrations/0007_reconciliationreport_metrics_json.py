@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reconapp', '0006_reconciliationschema'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reconciliationreport',
+            name='metrics_json',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reconapp', '0007_reconciliationreport_metrics_json'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reconciliationreport',
+            name='baseline_report',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='incremental_reports', to='reconapp.reconciliationreport'),
+        ),
+        migrations.AddField(
+            model_name='reconciliationreport',
+            name='delta_json',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='reconciliationreport',
+            name='options',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
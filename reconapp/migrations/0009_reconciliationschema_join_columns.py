@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reconapp', '0008_reconciliationreport_incremental'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reconciliationschema',
+            name='join_columns',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
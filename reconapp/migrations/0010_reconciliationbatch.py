@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:13
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reconapp', '0009_reconciliationschema_join_columns'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReconciliationBatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('options', models.JSONField(default=dict)),
+                ('created_timestamp', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='reconciliationjob',
+            name='name',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='reconciliationjob',
+            name='batch',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='jobs', to='reconapp.reconciliationbatch'),
+        ),
+    ]
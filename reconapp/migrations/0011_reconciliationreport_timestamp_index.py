@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:18
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reconapp', '0010_reconciliationbatch'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='reconciliationreport',
+            name='reconciliation_timestamp',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+    ]
@@ -4,10 +4,12 @@ from django.utils import timezone
 class UploadedFile(models.Model):
     """_This is the Fileupload model.
        _We simply need the path we will upload the file to, the name of the file and when it was uploaded.
+       _Uploads with the same content hash share one stored file.
     """
     file = models.FileField(upload_to='reconciliation_uploads/')
     upload_timestamp = models.DateTimeField(default=timezone.now)
     original_filename = models.CharField(max_length=255)
+    content_hash = models.CharField(max_length=64, null=True, blank=True, db_index=True) #SHA-256 of the file content
 
     def __str__(self):
         return self.original_filename
@@ -21,13 +23,113 @@ class ReconciliationReport(models.Model):
     """
     source_file = models.ForeignKey(UploadedFile, related_name='source_reports', on_delete=models.SET_NULL, null=True)
     target_file = models.ForeignKey(UploadedFile, related_name='target_reports', on_delete=models.SET_NULL, null=True)
-    reconciliation_timestamp = models.DateTimeField(default=timezone.now)
+    reconciliation_timestamp = models.DateTimeField(default=timezone.now, db_index=True) #Indexed for the report list, which is ordered and filtered on it
     join_columns = models.CharField(max_length=255) #This is the column that will be used to join the source and target files for reconciliation
     ignore_columns = models.CharField(max_length=255, blank=True, null=True)
     summary_json = models.JSONField()
+    metrics_json = models.JSONField(null=True, blank=True) #Time and memory spent in each stage of the reconciliation
+    options = models.JSONField(null=True, blank=True) #The options that shape the results, which an incremental run must repeat
+    baseline_report = models.ForeignKey('self', related_name='incremental_reports', on_delete=models.SET_NULL, null=True, blank=True) #The report an incremental run started from
+    delta_json = models.JSONField(null=True, blank=True) #For an incremental run, the records that appeared or were resolved since the baseline report
+    # The records themselves are stored as ReconciliationResult rows, these fields are only kept for older reports
     missing_in_source_json = models.JSONField(null=True, blank=True)
     missing_in_target_json = models.JSONField(null=True, blank=True)
     discrepancies_json = models.JSONField(null=True, blank=True)
 
     def __str__(self):
-        return f"Report for {self.source_file.original_filename} vs {self.target_file.original_filename} on {self.reconciliation_timestamp}"
\ No newline at end of file
+        return f"Report for {self.source_file.original_filename} vs {self.target_file.original_filename} on {self.reconciliation_timestamp}"
+
+class ReconciliationSchema(models.Model):
+    """
+        _This is the ReconciliationSchema model._
+        _It is a saved parsing profile: the columns to load with their types and the format of the date columns.
+        _It can also name the columns that identify a transaction, for counterparties that need a composite key.
+        _Uploads can refer to it by name instead of sending the schema every time.
+    """
+    name = models.CharField(max_length=100, unique=True)
+    columns = models.JSONField() #Column name mapped to its type: string, float, integer or date
+    date_format = models.CharField(max_length=50, blank=True, null=True)
+    join_columns = models.JSONField(blank=True, null=True) #The columns to join on, the default join column when empty
+    created_timestamp = models.DateTimeField(default=timezone.now)
+
+    def as_schema(self) -> dict:
+        return {'columns': self.columns, 'date_format': self.date_format or None}
+
+    def __str__(self):
+        return self.name
+
+class ReconciliationBatch(models.Model):
+    """
+        _This is the ReconciliationBatch model._
+        _It groups the jobs of many source/target pairs submitted in one request, such as an end-of-day run.
+        _Every pair is a ReconciliationJob, so the batch links to the report of each pair through its jobs.
+    """
+    options = models.JSONField(default=dict) #The reconciliation options shared by every pair of the batch
+    created_timestamp = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"Reconciliation batch {self.id}"
+
+class ReconciliationJob(models.Model):
+    """
+        _This is the ReconciliationJob model._
+        _It tracks a reconciliation that runs in the background after the upload request has returned.
+        _Once the job is done it links to the ReconciliationReport it produced.
+    """
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    source_file = models.ForeignKey(UploadedFile, related_name='source_jobs', on_delete=models.SET_NULL, null=True)
+    target_file = models.ForeignKey(UploadedFile, related_name='target_jobs', on_delete=models.SET_NULL, null=True)
+    options = models.JSONField(default=dict) #The reconciliation options the job was submitted with
+    batch = models.ForeignKey(ReconciliationBatch, related_name='jobs', on_delete=models.CASCADE, null=True, blank=True)
+    name = models.CharField(max_length=255, blank=True, default='') #The name of the pair within its batch
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    report = models.ForeignKey(ReconciliationReport, related_name='jobs', on_delete=models.SET_NULL, null=True, blank=True)
+    error = models.TextField(blank=True, null=True)
+    created_timestamp = models.DateTimeField(default=timezone.now)
+    started_timestamp = models.DateTimeField(null=True, blank=True)
+    finished_timestamp = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Reconciliation job {self.id} ({self.status})"
+
+
+class ReconciliationResult(models.Model):
+    """
+        _This is the ReconciliationResult model._
+        _It holds one record of a reconciliation report: a row missing in source or in target, or a discrepancy.
+        _Rows are keyed by report, category and join key so a report can be read, filtered and counted in the database.
+    """
+    CATEGORY_MISSING_IN_SOURCE = 'missing_in_source'
+    CATEGORY_MISSING_IN_TARGET = 'missing_in_target'
+    CATEGORY_DISCREPANCY = 'discrepancy'
+    CATEGORY_CHOICES = [
+        (CATEGORY_MISSING_IN_SOURCE, 'Missing in Source'),
+        (CATEGORY_MISSING_IN_TARGET, 'Missing in Target'),
+        (CATEGORY_DISCREPANCY, 'Discrepancy'),
+    ]
+
+    report = models.ForeignKey(ReconciliationReport, related_name='results', on_delete=models.CASCADE)
+    category = models.CharField(max_length=32, choices=CATEGORY_CHOICES)
+    position = models.PositiveIntegerField() #The order of the record within its category
+    join_key = models.CharField(max_length=255, null=True, blank=True)
+    data = models.JSONField()
+
+    class Meta:
+        ordering = ['report', 'category', 'position']
+        indexes = [
+            models.Index(fields=['report', 'category', 'position']),
+            models.Index(fields=['report', 'category', 'join_key']),
+        ]
+
+    def __str__(self):
+        return f"{self.get_category_display()} {self.join_key} in report {self.report_id}"
@@ -0,0 +1,191 @@
+import csv
+import gzip
+import io
+import logging
+import os
+import zipfile
+from typing import BinaryIO, List, Optional
+
+import pandas as pd
+
+try:
+    import pyarrow as pa  # type: ignore
+    import pyarrow.feather as feather  # type: ignore
+    import pyarrow.parquet as pq  # type: ignore
+except ImportError:  # pyarrow is only needed for the columnar formats
+    pa = None
+
+try:
+    import zstandard  # type: ignore
+except ImportError:  # zstandard is only needed for .zst uploads
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+CSV_FORMAT = 'csv'
+PARQUET_FORMAT = 'parquet'
+ARROW_FORMAT = 'arrow'
+FEATHER_FORMAT = 'feather'
+
+INPUT_FORMATS = {
+    '.csv': CSV_FORMAT,
+    '.parquet': PARQUET_FORMAT,
+    '.pq': PARQUET_FORMAT,
+    '.arrow': ARROW_FORMAT,
+    '.ipc': ARROW_FORMAT,
+    '.feather': FEATHER_FORMAT,
+}
+COLUMNAR_FORMATS = [PARQUET_FORMAT, ARROW_FORMAT, FEATHER_FORMAT]
+
+# Compressed CSV uploads, by the extension that follows .csv. A .zip archive must hold a single CSV file.
+COMPRESSIONS = {
+    '.gz': 'gzip',
+    '.zst': 'zstd',
+    '.zip': 'zip',
+}
+
+
+def input_compression(filename: str) -> Optional[str]:
+    """Return the compression of a file from its extension, or None when it is not compressed."""
+    return COMPRESSIONS.get(os.path.splitext(filename)[1].lower())
+
+
+def input_format(filename: str) -> Optional[str]:
+    """
+    _Return the input format of a file from its extension, or None when it is not supported.
+    _Compressed files are CSV files: name.csv.gz, name.csv.zst, name.csv.zip or a plain name.zip.
+    """
+    root, extension = os.path.splitext(filename)
+    extension = extension.lower()
+    if extension in COMPRESSIONS:
+        inner = os.path.splitext(root)[1].lower()
+        if inner == '.csv' or (extension == '.zip' and inner == ''):
+            return CSV_FORMAT
+        return None
+    return INPUT_FORMATS.get(extension)
+
+
+def open_decompressed(path: str, compression: Optional[str] = None) -> BinaryIO:
+    """
+    _Open a file for reading, decompressing it on the fly.
+    _The decompressed data is produced as it is read, so it never exists as a whole on disk or in memory.
+    """
+    if compression is None:
+        return open(path, 'rb')
+    if compression == 'gzip':
+        return gzip.open(path, 'rb')
+    if compression == 'zstd':
+        if zstandard is None:
+            raise ValueError("Reading .zst files requires zstandard to be installed.")
+        return zstandard.open(path, 'rb')
+    if compression == 'zip':
+        archive = zipfile.ZipFile(path)
+        members = [info for info in archive.infolist() if not info.is_dir()]
+        if len(members) != 1:
+            archive.close()
+            raise ValueError(f"A zip upload must contain exactly one CSV file, found {len(members)} files.")
+        member = archive.open(members[0])
+        # The member keeps the archive file open until it is closed itself
+        archive.close()
+        return member
+    raise ValueError(f"Unsupported compression '{compression}'.")
+
+
+def projected_columns(
+    columns: List[str],
+    ignore_columns: Optional[List[str]] = None,
+    ignore_case: bool = True,
+    strip_whitespace: bool = True,
+    include_columns: Optional[List[str]] = None
+) -> List[str]:
+    """
+    _Select the columns worth loading: every column except the ignored ones, or only the included ones when given.
+    _Ignored and included columns are given by their normalized name, so the file's column names are normalized the
+     same way before they are compared.
+    """
+    if not ignore_columns and not include_columns:
+        return list(columns)
+    ignored = set(ignore_columns or [])
+    included = set(include_columns) if include_columns else None
+    selected = []
+    for col in columns:
+        name = normalized_column(col, ignore_case, strip_whitespace)
+        if name not in ignored and (included is None or name in included):
+            selected.append(col)
+    return selected
+
+
+def normalized_column(column: str, ignore_case: bool = True, strip_whitespace: bool = True) -> str:
+    """Return a column name the way normalize_dataframe renames it."""
+    column = column.lower() if ignore_case else column
+    return column.strip() if strip_whitespace else column
+
+
+def input_columns(path: str, file_format: str, compression: Optional[str] = None) -> List[str]:
+    """Return the column names of an uploaded file, reading only its header or schema."""
+    if file_format == CSV_FORMAT:
+        # The header line is enough, an empty file has no columns and fails later when it is parsed
+        with open_decompressed(path, compression) as handle:
+            return next(csv.reader(io.TextIOWrapper(handle, encoding='utf-8-sig', newline='')), [])
+    if file_format not in COLUMNAR_FORMATS:
+        raise ValueError(f"Unsupported input format '{file_format}'.")
+    if pa is None:
+        raise ValueError("Reading Parquet, Arrow and Feather files requires pyarrow to be installed.")
+    if file_format == PARQUET_FORMAT:
+        return pq.read_schema(path, memory_map=True).names
+    if file_format == FEATHER_FORMAT:
+        return feather.read_table(path, memory_map=True).column_names
+    source = pa.memory_map(path, 'r')
+    try:
+        return pa.ipc.open_file(source).schema.names
+    except pa.ArrowInvalid:
+        source.seek(0)
+        return pa.ipc.open_stream(source).schema.names
+    finally:
+        source.close()
+
+
+def _read_arrow_table(path: str, file_format: str, ignore_columns, ignore_case, strip_whitespace, include_columns):
+    if file_format == PARQUET_FORMAT:
+        schema = pq.read_schema(path, memory_map=True)
+        columns = projected_columns(schema.names, ignore_columns, ignore_case, strip_whitespace, include_columns)
+        return pq.read_table(path, columns=columns, memory_map=True)
+    if file_format == FEATHER_FORMAT:
+        table = feather.read_table(path, memory_map=True)
+    else:
+        source = pa.memory_map(path, 'r')
+        try:
+            table = pa.ipc.open_file(source).read_all()
+        except pa.ArrowInvalid:
+            # Arrow IPC streams have no footer, read them as a stream instead
+            source.seek(0)
+            table = pa.ipc.open_stream(source).read_all()
+    # Selecting columns of a memory-mapped table does not read the others
+    return table.select(projected_columns(table.column_names, ignore_columns, ignore_case, strip_whitespace, include_columns))
+
+
+def read_input(
+    path: str,
+    file_format: str,
+    ignore_columns: Optional[List[str]] = None,
+    ignore_case: bool = True,
+    strip_whitespace: bool = True,
+    compression: Optional[str] = None,
+    include_columns: Optional[List[str]] = None
+) -> pd.DataFrame:
+    """
+    _Read an uploaded file into a DataFrame.
+    _CSV files are parsed as a whole, decompressed while they are parsed when compressed. Parquet, Arrow IPC and Feather files are memory-mapped and only the columns
+     that take part in the reconciliation are loaded, so ignored columns (or columns not included) are never read.
+    """
+    if file_format == CSV_FORMAT:
+        with open_decompressed(path, compression) as handle:
+            return pd.read_csv(handle)
+    if file_format not in COLUMNAR_FORMATS:
+        raise ValueError(f"Unsupported input format '{file_format}'.")
+    if pa is None:
+        raise ValueError("Reading Parquet, Arrow and Feather files requires pyarrow to be installed.")
+
+    table = _read_arrow_table(path, file_format, ignore_columns, ignore_case, strip_whitespace, include_columns)
+    logger.info(f"Loaded {table.num_columns} columns and {table.num_rows} rows from the {file_format} file.")
+    return table.to_pandas(split_blocks=True, self_destruct=True)
@@ -0,0 +1,55 @@
+import datetime
+import decimal
+
+import numpy as np
+import pandas as pd
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson  # type: ignore
+except ImportError:  # without orjson the DRF JSON renderer and parser are used
+    orjson = None
+
+
+def _default(obj):
+    """Serialize what orjson does not handle natively: pandas values, Decimals and anything with isoformat."""
+    if obj is pd.NA or obj is pd.NaT:
+        return None
+    if isinstance(obj, (pd.Timestamp, datetime.date, datetime.time)):
+        return obj.isoformat()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, decimal.Decimal):
+        return float(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+        _JSON renderer backed by orjson, which serializes numpy arrays and scalars natively and NaN/inf as null.
+        _It falls back to the DRF renderer when orjson is not installed.
+    """
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b''
+        option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(data, default=_default, option=option)
+
+
+class ORJSONParser(JSONParser):
+    """JSON parser backed by orjson, falling back to the DRF parser when orjson is not installed."""
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if orjson is None:
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
@@ -0,0 +1,215 @@
+import logging
+from typing import Any, Dict, Iterator, List, Optional
+
+import pandas as pd
+
+from .metrics import timed
+from .readers import CSV_FORMAT, input_columns, open_decompressed
+
+try:
+    import pyarrow as pa  # type: ignore
+    import pyarrow.csv as pa_csv  # type: ignore
+except ImportError:  # pyarrow is only needed for the pyarrow CSV engine
+    pa = None
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_TYPES = ['string', 'float', 'integer', 'date']
+CSV_ENGINES = ['c', 'pyarrow']
+
+# How the declared types are parsed: strings and dates are read as text, numbers straight into their dtype
+PANDAS_DTYPES = {'string': 'object', 'float': 'float64', 'integer': 'Int64', 'date': 'object'}
+NUMERIC_TYPES = ['float', 'integer']
+
+
+def validate_schema(schema: Any) -> dict:
+    """
+    _Check a reconciliation schema and return it in its canonical form.
+    _A schema declares the columns to load with their types, {"columns": {"Txn RefNo": "string", "Debit": "float"}},
+     and optionally the format of its date columns, {"date_format": "%Y-%m-%d"}.
+    """
+    if not isinstance(schema, dict):
+        raise ValueError("The schema must be an object with a 'columns' mapping.")
+    columns = schema.get('columns')
+    if not isinstance(columns, dict) or not columns:
+        raise ValueError("The schema must declare at least one column in 'columns'.")
+    for name, column_type in columns.items():
+        if column_type not in SCHEMA_TYPES:
+            raise ValueError(f"Unknown type '{column_type}' for column '{name}'. Expected one of: {', '.join(SCHEMA_TYPES)}")
+    unknown = set(schema) - {'columns', 'date_format'}
+    if unknown:
+        raise ValueError(f"Unknown schema keys: {', '.join(sorted(unknown))}")
+    date_format = schema.get('date_format') or None
+    if date_format is not None and not isinstance(date_format, str):
+        raise ValueError("The schema 'date_format' must be a string.")
+    return {'columns': dict(columns), 'date_format': date_format}
+
+
+def resolve_columns(header: List[str], schema: dict, ignore_case: bool = True, strip_whitespace: bool = True) -> Dict[str, str]:
+    """Map the columns of a file to their declared type, matching names the way normalization would."""
+    def key(name: str) -> str:
+        name = name.lower() if ignore_case else name
+        return name.strip() if strip_whitespace else name
+
+    declared = {key(name): column_type for name, column_type in schema['columns'].items()}
+    columns = {name: declared[key(name)] for name in header if key(name) in declared}
+    found = {key(name) for name in columns}
+    missing = [name for name in schema['columns'] if key(name) not in found]
+    if missing:
+        raise ValueError(f"Schema columns not found in the file: {', '.join(missing)}")
+    return columns
+
+
+def _typed_dtypes(columns: Dict[str, str]) -> Dict[str, str]:
+    return {name: PANDAS_DTYPES[column_type] for name, column_type in columns.items()}
+
+
+def _lenient_dtypes(columns: Dict[str, str]) -> Dict[str, str]:
+    """Read the numeric columns as text, so every value can be coerced on its own."""
+    return {name: 'object' if column_type in NUMERIC_TYPES else PANDAS_DTYPES[column_type]
+            for name, column_type in columns.items()}
+
+
+def _read_typed(path: str, columns: Dict[str, str], compression: Optional[str], engine: str) -> pd.DataFrame:
+    """Parse the declared columns straight into their dtypes, which raises on the first value that does not fit."""
+    with open_decompressed(path, compression) as handle:
+        if engine == 'pyarrow':
+            arrow_types = {'string': pa.string(), 'float': pa.float64(), 'integer': pa.int64(), 'date': pa.string()}
+            table = pa_csv.read_csv(handle, convert_options=pa_csv.ConvertOptions(
+                column_types={name: arrow_types[column_type] for name, column_type in columns.items()},
+                include_columns=list(columns),
+                strings_can_be_null=True,
+            ))
+            dataframe = table.to_pandas(split_blocks=True, self_destruct=True)
+            for name, column_type in columns.items():
+                if column_type == 'integer':
+                    dataframe[name] = dataframe[name].astype('Int64')
+            return dataframe
+        return pd.read_csv(handle, usecols=list(columns), dtype=_typed_dtypes(columns))
+
+
+def _read_text(path: str, columns: Dict[str, str], compression: Optional[str], engine: str) -> pd.DataFrame:
+    """Parse the declared columns with the numbers and dates as text, which no value can fail."""
+    with open_decompressed(path, compression) as handle:
+        if engine == 'pyarrow':
+            table = pa_csv.read_csv(handle, convert_options=pa_csv.ConvertOptions(
+                column_types={name: pa.string() for name in columns},
+                include_columns=list(columns),
+                strings_can_be_null=True,
+            ))
+            return table.to_pandas(split_blocks=True, self_destruct=True)
+        return pd.read_csv(handle, usecols=list(columns), dtype=_lenient_dtypes(columns))
+
+
+def coerce_columns(dataframe: pd.DataFrame, columns: Dict[str, str], date_format: Optional[str] = None) -> Dict[str, int]:
+    """
+    _Convert the declared numeric and date columns of a frame in place and count the values that fail to convert.
+    _A value fails when it is present in the file but becomes missing once converted.
+    """
+    failures = {}
+    for name, column_type in columns.items():
+        values = dataframe[name]
+        if column_type in NUMERIC_TYPES:
+            if pd.api.types.is_numeric_dtype(values.dtype):
+                continue
+            converted = pd.to_numeric(values, errors='coerce')
+            if column_type == 'integer':
+                converted = converted.where(converted % 1 == 0).astype('Int64')
+        elif column_type == 'date':
+            if pd.api.types.is_datetime64_any_dtype(values.dtype):
+                continue
+            converted = pd.to_datetime(values.str.strip(), format=date_format, errors='coerce')
+        else:
+            continue
+        failed = int((values.notna() & converted.isna()).sum())
+        if failed:
+            failures[name] = failed
+        dataframe[name] = converted
+    return failures
+
+
+def read_csv_with_schema(
+    path: str,
+    schema: dict,
+    compression: Optional[str] = None,
+    ignore_case: bool = True,
+    strip_whitespace: bool = True,
+    engine: str = 'c',
+    date_format: Optional[str] = None
+) -> tuple[pd.DataFrame, Dict[str, int]]:
+    """
+    _Read a CSV file as its schema declares: only the declared columns, each parsed into its declared type.
+    _The numbers are parsed straight into their dtypes by the C or pyarrow engine, and the dates are then converted
+     from text. A value that does not fit its type makes the typed parse raise, as every value either converts or
+     is one of the missing markers both parses share. Only then is the file read again with the numbers as text,
+     to coerce them and count the values that failed per column, as the chunked reader does.
+    _Returns the frame and those counts. Date columns use the schema's date_format, or date_format otherwise.
+    """
+    if engine not in CSV_ENGINES:
+        raise ValueError(f"Unknown CSV engine '{engine}'. Expected one of: {', '.join(CSV_ENGINES)}")
+    if engine == 'pyarrow' and pa is None:
+        raise ValueError("The pyarrow CSV engine requires pyarrow to be installed.")
+    columns = resolve_columns(input_columns(path, CSV_FORMAT, compression), schema, ignore_case, strip_whitespace)
+    date_format = schema.get('date_format') or date_format
+
+    with timed('parse'):
+        try:
+            dataframe = _read_typed(path, columns, compression, engine)
+        except (ValueError, TypeError) as e:
+            logger.info(f"Some values do not fit their declared type ({e}), coercing them instead.")
+            dataframe = _read_text(path, columns, compression, engine)
+    with timed('numeric_coercion'):
+        failures = coerce_columns(dataframe, columns, date_format)
+    if failures:
+        logger.warning(f"Values that failed to convert to their declared type: {failures}")
+    return dataframe, failures
+
+
+def read_csv_chunks_with_schema(
+    path: str,
+    schema: dict,
+    chunk_rows: int,
+    compression: Optional[str] = None,
+    ignore_case: bool = True,
+    strip_whitespace: bool = True,
+    date_format: Optional[str] = None
+) -> Iterator[tuple[pd.DataFrame, Dict[str, int]]]:
+    """
+    _Read a CSV file in chunks as its schema declares, coercing each chunk and counting its failed values.
+    _The chunks are parsed into their dtypes until one holds a value that does not fit. The file is then read again
+     with the numbers as text, and coerced from the first row the typed chunks did not give.
+    """
+    columns = resolve_columns(input_columns(path, CSV_FORMAT, compression), schema, ignore_case, strip_whitespace)
+    date_format = schema.get('date_format') or date_format
+    given = 0
+    for lenient in [False, True]:
+        dtypes = _lenient_dtypes(columns) if lenient else _typed_dtypes(columns)
+        skip, given = given, 0
+        with open_decompressed(path, compression) as handle, \
+                pd.read_csv(handle, usecols=list(columns), dtype=dtypes, chunksize=chunk_rows) as reader:
+            while True:
+                try:
+                    with timed('parse'):
+                        chunk = next(reader, None)
+                except (ValueError, TypeError) as e:
+                    if lenient:
+                        raise
+                    logger.info(f"Some values do not fit their declared type ({e}), coercing them instead.")
+                    break
+                if chunk is None:
+                    return
+                given += len(chunk)
+                if skip:
+                    # Rows are counted rather than skipped by line number, which quoted line breaks would shift
+                    chunk, skip = chunk.iloc[skip:], max(skip - len(chunk), 0)
+                    if chunk.empty:
+                        continue
+                with timed('numeric_coercion'):
+                    failures = coerce_columns(chunk, columns, date_format)
+                yield chunk, failures
+
+
+def add_failures(total: Dict[str, int], failures: Dict[str, int]):
+    """Add the failure counts of one chunk to the running totals of a file."""
+    for name, count in failures.items():
+        total[name] = total.get(name, 0) + count
@@ -1,27 +1,104 @@
+import json
 from rest_framework import serializers
-from .models import  ReconciliationReport
+from .models import  ReconciliationReport, ReconciliationJob, ReconciliationSchema, ReconciliationBatch
+from .schemas import validate_schema as check_schema
+from .readers import INPUT_FORMATS, COMPRESSIONS, input_format
+from .batches import batch_status, rollup_summary
 
-class FileUploadSerializer(serializers.Serializer):
-    source_file = serializers.FileField(help_text="Upload the source CSV file.")
-    target_file = serializers.FileField(help_text="Upload the target CSV file.")
+class ReconciliationOptionsSerializer(serializers.Serializer):
+    """The reconciliation options shared by single uploads and batches."""
     date_format = serializers.CharField(required=False, allow_blank=True,
                                        help_text="Optional date format string (e.g., '%Y-%m-%d').")
     ignore_case = serializers.BooleanField(default=True, help_text="Ignore case sensitivity during comparison.")
     strip_whitespace = serializers.BooleanField(default=True, help_text="Remove leading/trailing spaces.")
     ignore_columns = serializers.CharField(required=False, allow_blank=True,
                                            help_text="Optional comma-separated list of columns to ignore during discrepancy checks.")
+    join_columns = serializers.CharField(required=False, allow_blank=True,
+                                         help_text="Optional comma-separated list of the columns that identify a transaction, e.g. 'Account,Value Date,Reference'. Defaults to Txn RefNo.")
+    date_columns = serializers.CharField(required=False, allow_blank=True,
+                                         help_text="Optional comma-separated list of date columns. Without it, only columns where every value of both files matches date_format are parsed as dates.")
+    schema = serializers.CharField(required=False, allow_blank=True,
+                                   help_text='Optional JSON schema, e.g. {"columns": {"Txn RefNo": "string", "Debit": "float", "Credit": "float"}}. Only the declared columns are loaded.')
+    schema_name = serializers.CharField(required=False, allow_blank=True,
+                                        help_text="Optional name of a saved schema, used when no schema is sent.")
+    amount_tolerance = serializers.FloatField(required=False, allow_null=True, min_value=0,
+                                              help_text="Optional tolerance to pair the rows left unmatched by their keys on amounts that differ by at most this much.")
+    date_window_days = serializers.IntegerField(required=False, allow_null=True, min_value=0,
+                                                help_text="Optional number of days the dates of a near-match pair can be apart, compared on match_date_column.")
+    match_date_column = serializers.CharField(required=False, allow_blank=True,
+                                              help_text="The date column compared with date_window_days, e.g. 'Txn Date'.")
+    aggregate_duplicates = serializers.BooleanField(default=False,
+                                                    help_text="Match keys with several rows on either side, such as split or batched payments, on their debit and credit totals instead of flagging them as duplicates.")
+    streaming = serializers.BooleanField(default=False,
+                                         help_text="Read the files in chunks and reconcile them bucket by bucket within the memory budget.")
 
-    
     def validate_ignore_columns(self, value):
         return [col.strip() for col in value.split(',')] if value else []
+
+    def validate_date_columns(self, value):
+        return [col.strip() for col in value.split(',')] if value else []
+
+    def validate_join_columns(self, value):
+        return [col.strip() for col in value.split(',') if col.strip()] if value else []
     
+    def validate_schema(self, value):
+        if not value:
+            return None
+        try:
+            return check_schema(json.loads(value))
+        except json.JSONDecodeError:
+            raise serializers.ValidationError("The schema must be valid JSON.")
+        except ValueError as e:
+            raise serializers.ValidationError(str(e))
+
     def validate(self, data):
+        if not data.get('schema') and data.get('schema_name'):
+            saved = ReconciliationSchema.objects.filter(name=data['schema_name']).first()
+            if saved is None:
+                raise serializers.ValidationError(f"No saved schema named '{data['schema_name']}'.")
+            data['schema'] = saved.as_schema()
+            if not data.get('join_columns') and saved.join_columns:
+                data['join_columns'] = saved.join_columns
+        return data
+
+class FileUploadSerializer(ReconciliationOptionsSerializer):
+    source_file = serializers.FileField(help_text="Upload the source CSV (optionally gzip, zstd or zip compressed), Parquet, Arrow IPC or Feather file.")
+    target_file = serializers.FileField(help_text="Upload the target CSV (optionally gzip, zstd or zip compressed), Parquet, Arrow IPC or Feather file.")
+    baseline_report_id = serializers.IntegerField(required=False, allow_null=True,
+                                                  help_text="Optional id of a previous report of the same accounts. Only the keys whose rows changed since that report are reconciled again.")
+    run_in_background = serializers.BooleanField(default=False,
+                                                 help_text="Return a job id straight away and reconcile in the background.")
+
+    def validate_baseline_report_id(self, value):
+        if value is not None and not ReconciliationReport.objects.filter(id=value).exists():
+            raise serializers.ValidationError(f"No reconciliation report with id {value}.")
+        return value
+
+    def validate(self, data):
+        data = super().validate(data)
         source_file = data.get('source_file')
         target_file = data.get('target_file')
-        if source_file and not source_file.name.endswith('.csv'):
-            raise serializers.ValidationError("Source file must be a CSV file.")
-        if target_file and not target_file.name.endswith('.csv'):
-            raise serializers.ValidationError("Target file must be a CSV file.")
+        supported = ', '.join(list(INPUT_FORMATS) + [f'.csv{extension}' for extension in COMPRESSIONS])
+        if source_file and not input_format(source_file.name):
+            raise serializers.ValidationError(f"Source file must be one of: {supported}.")
+        if target_file and not input_format(target_file.name):
+            raise serializers.ValidationError(f"Target file must be one of: {supported}.")
+        return data
+
+class BatchUploadSerializer(ReconciliationOptionsSerializer):
+    files = serializers.ListField(child=serializers.FileField(), required=False,
+                                  help_text="The files of every pair, named as the manifest refers to them.")
+    archive = serializers.FileField(required=False,
+                                    help_text="A zip archive of the files, with a manifest.json unless the manifest is sent.")
+    manifest = serializers.CharField(required=False, allow_blank=True,
+                                     help_text='JSON list of the pairs, e.g. [{"source": "bank_a.csv", "target": "ledger_a.csv", "name": "Account A"}].')
+
+    def validate(self, data):
+        data = super().validate(data)
+        if bool(data.get('files')) == bool(data.get('archive')):
+            raise serializers.ValidationError("Send either the files of the batch or an archive of them.")
+        if data.get('files') and not data.get('manifest'):
+            raise serializers.ValidationError("A manifest is needed to pair the uploaded files.")
         return data
 
 class ReconciliationReportSerializer(serializers.ModelSerializer):
@@ -32,4 +109,64 @@ class ReconciliationReportSerializer(serializers.ModelSerializer):
         model = ReconciliationReport
         fields = '__all__'
         read_only_fields = ['reconciliation_timestamp', 'source_file', 'target_file', 'summary_json',
-                            'missing_in_source_json', 'missing_in_target_json', 'discrepancies_json']
\ No newline at end of file
+                            'missing_in_source_json', 'missing_in_target_json', 'discrepancies_json']
+
+class ReconciliationReportListSerializer(serializers.ModelSerializer):
+    """The columns of the report list, without the records, which are only loaded for a single report."""
+    source_file_name = serializers.CharField(source='source_file.original_filename', read_only=True, default=None)
+    target_file_name = serializers.CharField(source='target_file.original_filename', read_only=True, default=None)
+
+    class Meta:
+        model = ReconciliationReport
+        fields = ['id', 'reconciliation_timestamp', 'source_file', 'source_file_name', 'target_file', 'target_file_name',
+                  'join_columns', 'ignore_columns', 'summary_json', 'baseline_report']
+        read_only_fields = fields
+
+class ReconciliationJobSerializer(serializers.ModelSerializer):
+    job_id = serializers.IntegerField(source='id', read_only=True)
+    report_id = serializers.PrimaryKeyRelatedField(source='report', read_only=True)
+
+    class Meta:
+        model = ReconciliationJob
+        fields = ['job_id', 'name', 'status', 'report_id', 'error', 'created_timestamp', 'started_timestamp', 'finished_timestamp']
+
+class ReconciliationBatchSerializer(serializers.ModelSerializer):
+    batch_id = serializers.IntegerField(source='id', read_only=True)
+    status = serializers.SerializerMethodField()
+    summary = serializers.SerializerMethodField()
+    pairs = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ReconciliationBatch
+        fields = ['batch_id', 'status', 'summary', 'pairs', 'options', 'created_timestamp']
+
+    def _jobs(self, batch):
+        # The view prefetches the jobs with their reports, so every field reads them from the same query
+        return list(batch.jobs.all())
+
+    def get_status(self, batch):
+        return batch_status(self._jobs(batch))
+
+    def get_summary(self, batch):
+        return rollup_summary(self._jobs(batch))
+
+    def get_pairs(self, batch):
+        return ReconciliationJobSerializer(self._jobs(batch), many=True).data
+
+class ReconciliationSchemaSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ReconciliationSchema
+        fields = ['id', 'name', 'columns', 'date_format', 'join_columns', 'created_timestamp']
+        read_only_fields = ['created_timestamp']
+
+    def validate_join_columns(self, value):
+        if value is not None and (not isinstance(value, list) or not all(isinstance(col, str) and col.strip() for col in value)):
+            raise serializers.ValidationError("join_columns must be a list of column names.")
+        return value or None
+
+    def validate(self, data):
+        try:
+            check_schema({'columns': data.get('columns'), 'date_format': data.get('date_format')})
+        except ValueError as e:
+            raise serializers.ValidationError(str(e))
+        return data
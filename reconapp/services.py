@@ -0,0 +1,455 @@
+import logging
+import math
+from itertools import islice
+from typing import Any, Iterable, List, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, FloatField, When
+from django.db.models.functions import Cast
+
+from .metrics import StageMetrics, timed
+from .models import UploadedFile, ReconciliationReport, ReconciliationResult
+from .streaming import reconcile_csv_streaming, estimate_csv_bytes, IN_MEMORY_EXPANSION
+from .utils import reconcile_data, detect_date_columns, parse_date_columns
+from .incremental import reconcile_incremental
+from .matching import match_near_misses
+from .uploads import load_prepared_dataframe, reconciled_columns, file_format_of, compression_of
+from .readers import CSV_FORMAT
+from .exports import render_exports
+
+logger = logging.getLogger(__name__)
+
+REQUIRED_COLUMNS = ['Txn RefNo', 'Debit', 'Credit']
+NUMERIC_COLUMNS = ['Debit', 'Credit']
+JOIN_COLUMNS = ['txn refno']  # The column we join the two data sources on, unless the request or its schema names others
+OPTION_DEFAULTS = {'near_match': None, 'aggregate_duplicates': False}  # The value of the options a report can predate
+
+
+def run_reconciliation(
+    source_file_instance: UploadedFile,
+    target_file_instance: UploadedFile,
+    date_format: Optional[str] = None,
+    ignore_case: bool = True,
+    strip_whitespace: bool = True,
+    ignore_columns: Optional[List[str]] = None,
+    streaming: bool = False,
+    date_columns: Optional[List[str]] = None,
+    schema: Optional[dict] = None,
+    metrics: Optional[StageMetrics] = None,
+    baseline_report_id: Optional[int] = None,
+    join_columns: Optional[List[str]] = None,
+    amount_tolerance: Optional[float] = None,
+    date_window_days: Optional[int] = None,
+    match_date_column: Optional[str] = None,
+    aggregate_duplicates: bool = False
+) -> tuple[ReconciliationReport, List[dict], List[dict], List[dict], dict]:
+    """
+    _This is the reconciliation pipeline for two saved uploads, shared by the upload view and the background jobs.
+    _It reads and normalizes both files, reconciles them and saves the ReconciliationReport.
+    _It returns the report together with the cleaned missing records, the discrepancies and the summary.
+    _With a schema, the files are parsed as it declares and the summary reports the values that failed to convert.
+    _join_columns names the columns that identify a transaction, JOIN_COLUMNS by default. Several columns are joined
+     on as one composite key.
+    _With a baseline_report_id, only the keys that changed since that report are reconciled again. The report then
+     also holds the delta against its baseline, and the summary counts the changed keys and records.
+    _With an amount_tolerance or a date_window_days, the rows left unmatched by their keys are paired again by amount
+     and, on match_date_column, by date. The pairs are reported as near_match discrepancies.
+    _With aggregate_duplicates, keys with several rows on either side are matched on their debit and credit totals.
+    _The time and memory of every stage are saved on the report as metrics_json. Pass metrics to add the stages
+     timed before this call, such as saving the uploads.
+    """
+    metrics = metrics or StageMetrics()
+    with metrics.active():
+        report, missing_in_source, missing_in_target, discrepancies, summary = _run_reconciliation(
+            source_file_instance, target_file_instance, date_format, ignore_case, strip_whitespace,
+            ignore_columns, streaming, date_columns, schema, baseline_report_id, join_columns,
+            amount_tolerance, date_window_days, match_date_column, aggregate_duplicates
+        )
+    report.metrics_json = metrics.as_dict()
+    ReconciliationReport.objects.filter(pk=report.pk).update(metrics_json=report.metrics_json)
+    logger.info(f"Reconciliation report {report.id} took {report.metrics_json['total_seconds']:.3f}s.")
+    return report, missing_in_source, missing_in_target, discrepancies, summary
+
+
+def _run_reconciliation(
+    source_file_instance: UploadedFile,
+    target_file_instance: UploadedFile,
+    date_format: Optional[str],
+    ignore_case: bool,
+    strip_whitespace: bool,
+    ignore_columns: Optional[List[str]],
+    streaming: bool,
+    date_columns: Optional[List[str]],
+    schema: Optional[dict],
+    baseline_report_id: Optional[int],
+    join_columns: Optional[List[str]],
+    amount_tolerance: Optional[float],
+    date_window_days: Optional[int],
+    match_date_column: Optional[str],
+    aggregate_duplicates: bool
+) -> tuple[ReconciliationReport, List[dict], List[dict], List[dict], dict]:
+    required_columns = REQUIRED_COLUMNS
+    if join_columns:
+        # Join columns are named like the normalized columns they refer to
+        join_columns = [col.lower() if ignore_case else col for col in join_columns]
+        join_columns = [col.strip() for col in join_columns] if strip_whitespace else join_columns
+        required_columns = [*join_columns, *NUMERIC_COLUMNS]
+    else:
+        join_columns = JOIN_COLUMNS
+    near_match = None
+    if amount_tolerance is not None or date_window_days is not None:
+        if date_window_days is not None and not match_date_column:
+            raise ValueError("A date window needs the date column to compare (match_date_column).")
+        if match_date_column:
+            match_date_column = match_date_column.lower() if ignore_case else match_date_column
+            match_date_column = match_date_column.strip() if strip_whitespace else match_date_column
+        near_match = {
+            'amount_tolerance': amount_tolerance or 0.0,
+            'date_column': match_date_column or None,
+            'date_window_days': date_window_days or 0,
+        }
+    options = {
+        'join_columns': join_columns,
+        'date_format': date_format,
+        'ignore_case': ignore_case,
+        'strip_whitespace': strip_whitespace,
+        'ignore_columns': ignore_columns,
+        'date_columns': date_columns,
+        'schema': schema,
+        'near_match': near_match,
+        'aggregate_duplicates': aggregate_duplicates,
+    }
+    if near_match is not None and baseline_report_id:
+        # Near matches pair rows across keys, which an incremental run could not reuse key by key
+        raise ValueError("Near-match pairing is not available for incremental runs.")
+    baseline = load_baseline_report(baseline_report_id, options) if baseline_report_id else None
+    delta = None
+    source_path = source_file_instance.file.path
+    target_path = target_file_instance.file.path
+    memory_budget = settings.RECONCILIATION_MEMORY_BUDGET_MB * 1024 * 1024
+    string_storage = settings.RECONCILIATION_STRING_STORAGE
+    source_compression = compression_of(source_file_instance)
+    target_compression = compression_of(target_file_instance)
+    file_size = estimate_csv_bytes(source_path, source_compression) + estimate_csv_bytes(target_path, target_compression)
+    logger.info(f"Join Columns: {join_columns}")
+    logger.info(f"Ignore Columns Received: {ignore_columns}")
+
+    # Only CSV files can be read in chunks, columnar files are memory-mapped and projected instead
+    csv_inputs = file_format_of(source_file_instance) == CSV_FORMAT and file_format_of(target_file_instance) == CSV_FORMAT
+
+    # Columnar files only load the key columns and the columns both files have, CSV files are always parsed whole
+    include_columns = None
+    if schema is None and not csv_inputs:
+        key_columns = [*join_columns, 'debit', 'credit']
+        if near_match is not None and near_match['date_column']:
+            key_columns.append(near_match['date_column'])
+        include_columns = reconciled_columns(source_file_instance, target_file_instance, key_columns,
+                                             ignore_columns, ignore_case, strip_whitespace)
+
+    # An incremental run compares the rows of both versions, so it always reads the files as a whole
+    if baseline is None and csv_inputs and (streaming or file_size * IN_MEMORY_EXPANSION > memory_budget):
+        # Reconcile out of core, bucket by bucket, within the configured memory budget
+        missing_in_source, missing_in_target, discrepancies, summary = reconcile_csv_streaming(
+            source_path,
+            target_path,
+            join_columns=join_columns,
+            required_columns=required_columns,
+            numeric_columns=NUMERIC_COLUMNS,
+            memory_budget=memory_budget,
+            ignore_columns=ignore_columns,
+            date_format=date_format,
+            ignore_case=ignore_case,
+            strip_whitespace=strip_whitespace,
+            debit_column='debit',
+            credit_column='credit',
+            spill_dir=settings.RECONCILIATION_SPILL_DIR,
+            workers=settings.RECONCILIATION_WORKERS,
+            source_compression=source_compression,
+            target_compression=target_compression,
+            date_columns=date_columns,
+            string_storage=string_storage,
+            schema=schema,
+            aggregate_duplicates=aggregate_duplicates
+        )
+    else:
+        # Without declared date columns, the date columns are detected across both files once they are read
+        detect_dates = bool(date_format) and not date_columns and schema is None
+        read_date_format = None if detect_dates else date_format
+
+        # Read, validate, convert amounts to numbers and normalize the data, or reuse the parsed copy of known files
+        normalized_source_df = load_prepared_dataframe(source_file_instance, required_columns, NUMERIC_COLUMNS, read_date_format, ignore_case, strip_whitespace, ignore_columns, date_columns, string_storage, schema, include_columns)
+        normalized_target_df = load_prepared_dataframe(target_file_instance, required_columns, NUMERIC_COLUMNS, read_date_format, ignore_case, strip_whitespace, ignore_columns, date_columns, string_storage, schema, include_columns)
+        detected = []
+        if detect_dates:
+            with timed('normalization'):
+                detected = detect_date_columns([normalized_source_df, normalized_target_df], date_format)
+                parse_date_columns(normalized_source_df, detected, date_format)
+                parse_date_columns(normalized_target_df, detected, date_format)
+
+        logger.info(f"Source DataFrame Columns (Normalized): {normalized_source_df.columns.tolist()}")
+        logger.info(f"Target DataFrame Columns (Normalized): {normalized_target_df.columns.tolist()}")
+
+        if baseline is not None:
+            # Reconcile again only the keys whose rows changed since the baseline report, its parsed inputs are cached.
+            # They get the date columns of the current files, so unchanged rows hash the same as a full run reads them
+            baseline_source_df, baseline_target_df = [
+                parse_date_columns(
+                    load_prepared_dataframe(file_instance, required_columns, NUMERIC_COLUMNS, read_date_format, ignore_case, strip_whitespace, ignore_columns, date_columns, string_storage, schema, include_columns),
+                    detected, date_format
+                )
+                for file_instance in (baseline.source_file, baseline.target_file)
+            ]
+            missing_in_source, missing_in_target, discrepancies, summary, delta = reconcile_incremental(
+                normalized_source_df,
+                normalized_target_df,
+                baseline_source_df,
+                baseline_target_df,
+                baseline_records(baseline),
+                join_columns=join_columns,
+                ignore_columns=ignore_columns,
+                debit_column='debit',
+                credit_column='credit',
+                aggregate_duplicates=aggregate_duplicates
+            )
+            summary['incremental'] = {
+                'baseline_report_id': baseline.id,
+                'keys': delta['keys'],
+                'added_records': {section: len(records) for section, records in delta['added'].items()},
+                'resolved_records': {section: len(records) for section, records in delta['resolved'].items()},
+            }
+        else:
+            # Perform reconciliation, in parallel partitions when the files are large enough
+            row_count = len(normalized_source_df) + len(normalized_target_df)
+            workers = settings.RECONCILIATION_WORKERS if row_count >= settings.RECONCILIATION_PARALLEL_MIN_ROWS else 1
+            missing_in_source, missing_in_target, discrepancies, summary = reconcile_data(
+                normalized_source_df,
+                normalized_target_df,
+                join_columns=join_columns,
+                ignore_columns=ignore_columns,
+                debit_column='debit',
+                credit_column='credit',
+                workers=workers,
+                aggregate_duplicates=aggregate_duplicates
+            )
+        if schema is not None:
+            summary['coercion_failures'] = {
+                'source': normalized_source_df.attrs.get('coercion_failures', {}),
+                'target': normalized_target_df.attrs.get('coercion_failures', {}),
+            }
+
+    if near_match is not None:
+        # Pair the rows that no key matched within the amount tolerance and the date window
+        missing_in_source, missing_in_target, near_matches = match_near_misses(
+            missing_in_source,
+            missing_in_target,
+            join_columns,
+            near_match['amount_tolerance'],
+            near_match['date_column'],
+            near_match['date_window_days'],
+            date_format=date_format,
+            debit_column='debit',
+            credit_column='credit'
+        )
+        discrepancies = discrepancies + near_matches
+        summary.update({
+            'missing_in_target_count': len(missing_in_target),
+            'missing_in_source_count': len(missing_in_source),
+            'discrepancy_count': len(discrepancies),
+            'near_match_count': len(near_matches),
+        })
+
+    logger.info(f"Found {len(missing_in_source)} records missing in source, {len(missing_in_target)} missing in target "
+                f"and {len(discrepancies)} discrepancies.")
+    if settings.DEBUG:
+        # Logging whole results is expensive on large files, so it is only done while debugging
+        logger.debug(f"Content of missing_in_source: {missing_in_source}")
+
+    # Save reconciliation report and its records
+    with timed('db_persist'), transaction.atomic():
+        report = ReconciliationReport.objects.create(
+            source_file=source_file_instance,
+            target_file=target_file_instance,
+            join_columns=','.join(join_columns),
+            ignore_columns=','.join(ignore_columns) if ignore_columns else None,
+            summary_json=summary,
+            options=options,
+            baseline_report=baseline,
+            delta_json=delta,
+        )
+        store_results(report, join_columns, missing_in_source, missing_in_target, discrepancies)
+
+    # Render the configured download formats now, so the first download is served from the cache
+    if settings.RECONCILIATION_EAGER_EXPORT_FORMATS:
+        with timed('export_render'):
+            render_exports(report, settings.RECONCILIATION_EAGER_EXPORT_FORMATS)
+
+    return report, missing_in_source, missing_in_target, discrepancies, summary
+
+
+def load_baseline_report(report_id: int, options: dict) -> ReconciliationReport:
+    """
+    _Fetch the report an incremental run starts from and check that it can be used.
+    _Its records were produced with its own options, so they are only valid when the new run repeats them.
+    """
+    report = ReconciliationReport.objects.select_related('source_file', 'target_file').filter(id=report_id).first()
+    if report is None:
+        raise ValueError(f"Baseline report {report_id} not found.")
+    if report.source_file is None or report.target_file is None:
+        raise ValueError(f"The files of baseline report {report_id} are no longer available.")
+    if report.options is None:
+        raise ValueError(f"Baseline report {report_id} was saved before incremental reconciliation was supported.")
+    # Options added since the baseline was saved were not set on it, so they had their default value
+    changed = sorted(name for name in options if report.options.get(name, OPTION_DEFAULTS.get(name)) != options[name])
+    if changed:
+        raise ValueError(f"Baseline report {report_id} was reconciled with different options: {', '.join(changed)}.")
+    return report
+
+
+def baseline_records(report: ReconciliationReport) -> dict:
+    """Read the (join key, record) pairs of each section of a report, in report order."""
+    categories = {category: section for section, category in REPORT_SECTIONS.items()}
+    records = {section: [] for section in REPORT_SECTIONS}
+    rows = report.results.order_by('category', 'position').values_list('category', 'join_key', 'data')
+    for category, join_key, data in rows.iterator(chunk_size=settings.RECONCILIATION_RESULT_BATCH_SIZE):
+        records[categories[category]].append((join_key, data))
+    return records
+
+
+def _join_key(record: dict, join_columns: List[str]) -> Optional[str]:
+    """Return the key of a record as text, with the values of a composite key separated by '|'."""
+    values = [record.get(col) for col in join_columns]
+    values = [None if value is None or (isinstance(value, float) and math.isnan(value)) else value for value in values]
+    if all(value is None for value in values):
+        return None
+    return '|'.join('' if value is None else str(value) for value in values)[:255]
+
+
+def _result_rows(report: ReconciliationReport, category: str, records: List[dict], join_columns: List[str]) -> Iterable[ReconciliationResult]:
+    for position, record in enumerate(records):
+        yield ReconciliationResult(
+            report=report,
+            category=category,
+            position=position,
+            join_key=_join_key(record, join_columns),
+            data=record,
+        )
+
+
+def store_results(
+    report: ReconciliationReport,
+    join_columns: List[str],
+    missing_in_source: List[dict],
+    missing_in_target: List[dict],
+    discrepancies: List[dict]
+):
+    """Save the records of a report as ReconciliationResult rows, in batches of RECONCILIATION_RESULT_BATCH_SIZE."""
+    batch_size = settings.RECONCILIATION_RESULT_BATCH_SIZE
+    for category, records in [
+        (ReconciliationResult.CATEGORY_MISSING_IN_SOURCE, missing_in_source),
+        (ReconciliationResult.CATEGORY_MISSING_IN_TARGET, missing_in_target),
+        (ReconciliationResult.CATEGORY_DISCREPANCY, discrepancies),
+    ]:
+        rows = _result_rows(report, category, records, join_columns)
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            ReconciliationResult.objects.bulk_create(batch, batch_size=batch_size)
+
+
+# The sections of a report as they are named in the API, mapped to their result category
+REPORT_SECTIONS = {
+    'missing_in_source': ReconciliationResult.CATEGORY_MISSING_IN_SOURCE,
+    'missing_in_target': ReconciliationResult.CATEGORY_MISSING_IN_TARGET,
+    'discrepancies': ReconciliationResult.CATEGORY_DISCREPANCY,
+}
+DISCREPANCY_TYPES = [
+    'amount_mismatch',
+    'debit_credit_mismatch',
+    'duplicate_in_source',
+    'duplicate_in_target',
+    'other_discrepancies',
+    'near_match',
+    'aggregate_mismatch',
+]
+
+
+def filter_results(
+    report: ReconciliationReport,
+    category: str,
+    discrepancy_type: Optional[str] = None,
+    column: Optional[str] = None,
+    key_from: Optional[str] = None,
+    key_to: Optional[str] = None
+):
+    """
+    _Return the result rows of one category of a report, filtered in the database.
+    _The discrepancy type and column filters only apply to discrepancies: a type keeps the records that have that
+     check, and a column keeps the records where that column differs. The key range is inclusive on both ends.
+    _Keys are stored as text, so the range compares them as text, unless its bounds are numbers: the range then
+     keeps the numeric keys within it by value, so 2 to 9 holds 2 and 9 but not 10.
+    """
+    if discrepancy_type is not None and discrepancy_type not in DISCREPANCY_TYPES:
+        raise ValueError(f"Unknown discrepancy type '{discrepancy_type}'. Expected one of: {', '.join(DISCREPANCY_TYPES)}")
+
+    queryset = report.results.filter(category=category)
+    if category == ReconciliationResult.CATEGORY_DISCREPANCY:
+        if discrepancy_type:
+            queryset = queryset.filter(data__discrepancies__has_key=discrepancy_type)
+        if column:
+            queryset = queryset.filter(data__discrepancies__other_discrepancies__has_key=column)
+    bounds = [bound for bound in (key_from, key_to) if bound is not None]
+    if bounds and all(_number(bound) is not None for bound in bounds):
+        # Only keys that read as numbers are cast, the CASE keeps the database from casting the others
+        queryset = queryset.annotate(numeric_key=Case(
+            When(join_key__regex=NUMERIC_KEY_PATTERN, then=Cast('join_key', FloatField())),
+            default=None, output_field=FloatField(),
+        ))
+        if key_from is not None:
+            queryset = queryset.filter(numeric_key__gte=_number(key_from))
+        if key_to is not None:
+            queryset = queryset.filter(numeric_key__lte=_number(key_to))
+        return queryset
+    if key_from is not None:
+        queryset = queryset.filter(join_key__gte=key_from)
+    if key_to is not None:
+        queryset = queryset.filter(join_key__lte=key_to)
+    return queryset
+
+
+# Stored join keys that the numeric key range compares by value
+NUMERIC_KEY_PATTERN = r'^-?[0-9]+(\.[0-9]+)?$'
+
+
+def _number(value: str) -> Optional[float]:
+    try:
+        number = float(value)
+    except ValueError:
+        return None
+    return number if math.isfinite(number) else None
+
+
+def results_page(queryset, after: Optional[int] = None, limit: int = 100) -> tuple[List[Any], Optional[int]]:
+    """
+    _Return one keyset page of result records and the cursor of the next page.
+    _Pages are seeked on the record position instead of using an offset, so every page costs the same no matter
+     how deep into the report it is. The cursor is None on the last page.
+    """
+    if after is not None:
+        queryset = queryset.filter(position__gt=after)
+    rows = list(queryset.order_by('position').values_list('position', 'data')[:limit + 1])
+    return _page(rows, limit)
+
+
+async def aresults_page(queryset, after: Optional[int] = None, limit: int = 100) -> tuple[List[Any], Optional[int]]:
+    """results_page for async views, reading the page through the async ORM."""
+    if after is not None:
+        queryset = queryset.filter(position__gt=after)
+    rows = [row async for row in queryset.order_by('position').values_list('position', 'data')[:limit + 1]]
+    return _page(rows, limit)
+
+
+def _page(rows: List[tuple[int, Any]], limit: int) -> tuple[List[Any], Optional[int]]:
+    next_after = rows[limit - 1][0] if len(rows) > limit else None
+    return [data for _, data in rows[:limit]], next_after
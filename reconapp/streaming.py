@@ -0,0 +1,213 @@
+import logging
+import math
+import os
+import pickle
+import tempfile
+from typing import List, Dict, Optional, Iterator
+
+import pandas as pd
+
+from .metrics import timed
+from .readers import open_decompressed
+from .schemas import read_csv_chunks_with_schema, add_failures
+from .utils import (prepare_dataframe, reconcile_ordered, merge_partitions, bucket_of, join_key_values,
+                    scan_date_columns, parse_date_columns)
+
+logger = logging.getLogger(__name__)
+
+# Rough ratio between the size of a CSV file on disk and the DataFrame pandas builds from it
+IN_MEMORY_EXPANSION = 8
+# Rough ratio between the size of a compressed CSV file and the CSV text it holds
+COMPRESSION_RATIO = 8
+# Share of the memory budget a single chunk read from a CSV file may use
+CHUNK_BUDGET_SHARE = 0.25
+SAMPLE_BYTES = 64 * 1024
+
+
+def estimate_csv_bytes(path: str, compression: Optional[str] = None) -> int:
+    """Estimate the size of the CSV text in a file, which is larger than the file itself when it is compressed."""
+    return os.path.getsize(path) * (COMPRESSION_RATIO if compression else 1)
+
+
+def estimate_row_bytes(path: str, compression: Optional[str] = None) -> int:
+    """Estimate the average size of a CSV row from the first bytes of the (decompressed) file."""
+    with open_decompressed(path, compression) as handle:
+        sample = handle.read(SAMPLE_BYTES)
+    lines = sample.count(b'\n')
+    return max(1, len(sample) // max(1, lines))
+
+
+def plan_partitions(
+    paths: List[str],
+    memory_budget: int,
+    compressions: Optional[List[Optional[str]]] = None
+) -> tuple[int, int]:
+    """
+    _Work out how many spill buckets and how many rows per chunk keep the run within the memory budget.
+    _A bucket holds the rows of both files for its keys, so the files are split into as many buckets as
+     needed for one bucket to fit the budget once loaded.
+    """
+    compressions = compressions or [None] * len(paths)
+    total_bytes = sum(estimate_csv_bytes(path, compression) for path, compression in zip(paths, compressions))
+    bucket_count = max(1, math.ceil(total_bytes * IN_MEMORY_EXPANSION / memory_budget))
+    row_bytes = max(estimate_row_bytes(path, compression) for path, compression in zip(paths, compressions))
+    chunk_rows = max(1, int(memory_budget * CHUNK_BUDGET_SHARE) // (row_bytes * IN_MEMORY_EXPANSION))
+    return bucket_count, chunk_rows
+
+
+class SpillBuckets:
+    """
+        _On-disk buckets for the rows of one file.
+        _Every chunk is split by bucket and each part is appended to that bucket's file as a pickled DataFrame,
+         which keeps the dtypes produced by normalization and the position of every row in the file as its index.
+    """
+    def __init__(self, directory: str, name: str, bucket_count: int):
+        self.paths = [os.path.join(directory, f"{name}_{bucket}.pkl") for bucket in range(bucket_count)]
+        self.template: Optional[pd.DataFrame] = None
+
+    def spill(self, chunk: pd.DataFrame, buckets: pd.Series):
+        if self.template is None:
+            self.template = chunk.iloc[:0]
+        for bucket, part in chunk.groupby(buckets, sort=False):
+            with open(self.paths[bucket], 'ab') as handle:
+                pickle.dump(part, handle, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def load(self, bucket: int) -> pd.DataFrame:
+        parts = []
+        if os.path.exists(self.paths[bucket]):
+            with open(self.paths[bucket], 'rb') as handle:
+                while True:
+                    try:
+                        parts.append(pickle.load(handle))
+                    except EOFError:
+                        break
+        if not parts:
+            return self.template
+        return pd.concat(parts)
+
+
+def read_prepared_chunks(
+    path: str,
+    chunk_rows: int,
+    required_columns: List[str],
+    numeric_columns: List[str],
+    date_format: Optional[str] = None,
+    ignore_case: bool = True,
+    strip_whitespace: bool = True,
+    compression: Optional[str] = None,
+    date_columns: Optional[List[str]] = None,
+    string_storage: str = 'object',
+    schema: Optional[dict] = None,
+    failures: Optional[Dict[str, int]] = None
+) -> Iterator[pd.DataFrame]:
+    """
+    _Read a CSV file in chunks of bounded size and validate, coerce and normalize each chunk.
+    _With a schema, the chunks are read as it declares and the values that fail to convert are counted in failures.
+    """
+    if schema is not None:
+        for chunk, chunk_failures in read_csv_chunks_with_schema(path, schema, chunk_rows, compression,
+                                                                 ignore_case, strip_whitespace, date_format):
+            if failures is not None:
+                add_failures(failures, chunk_failures)
+            yield prepare_dataframe(chunk, required_columns, numeric_columns, None, ignore_case, strip_whitespace,
+                                    None, string_storage)
+        return
+    with open_decompressed(path, compression) as handle, pd.read_csv(handle, chunksize=chunk_rows) as reader:
+        while True:
+            with timed('parse'):
+                chunk = next(reader, None)
+            if chunk is None:
+                return
+            yield prepare_dataframe(chunk, required_columns, numeric_columns, date_format, ignore_case, strip_whitespace,
+                                    date_columns, string_storage)
+
+
+def reconcile_csv_streaming(
+    source_path: str,
+    target_path: str,
+    join_columns: List[str],
+    required_columns: List[str],
+    numeric_columns: List[str],
+    memory_budget: int,
+    ignore_columns: Optional[List[str]] = None,
+    date_format: Optional[str] = None,
+    ignore_case: bool = True,
+    strip_whitespace: bool = True,
+    debit_column: str = 'debit',
+    credit_column: str = 'credit',
+    spill_dir: Optional[str] = None,
+    workers: int = 1,
+    source_compression: Optional[str] = None,
+    target_compression: Optional[str] = None,
+    date_columns: Optional[List[str]] = None,
+    string_storage: str = 'object',
+    schema: Optional[dict] = None,
+    aggregate_duplicates: bool = False
+) -> tuple[List[dict], List[dict], List[dict], dict]:
+    """
+    _This is the out-of-core variant of reading both files and calling reconcile_data.
+    _Both files are read in chunks and every row is spilled to a bucket chosen by a hash of its join key.
+     Rows sharing a key always land in the same bucket, so reconciling the buckets one at a time and
+     combining the results gives the same records as reconciling the whole files. Rows keep their position in
+     the file through the buckets, and the combined records are put back in the order reconcile_data gives them.
+    _Peak memory is bounded by the memory budget (in bytes) rather than by the size of the files.
+     Compressed files are decompressed as the chunks are read.
+    _With a schema, the summary also counts the values of each file that failed to convert, as coercion_failures.
+    _With a date_format but no date_columns, the chunks of both files are scanned as they are spilled, and the text
+     columns where every value is a date are parsed bucket by bucket, so every chunk gets the same decision.
+    """
+    if not join_columns:
+        raise ValueError("Join columns (unique transaction number) must be specified.")
+    bucket_count, chunk_rows = plan_partitions([source_path, target_path], memory_budget,
+                                               [source_compression, target_compression])
+    logger.info(f"Streaming reconciliation with {bucket_count} buckets of at most {chunk_rows} rows per chunk.")
+
+    detect_dates = bool(date_format) and not date_columns and schema is None
+    seen_columns, undated_columns = set(), set()
+
+    with tempfile.TemporaryDirectory(prefix='recon_spill_', dir=spill_dir) as directory:
+        sides: Dict[str, SpillBuckets] = {}
+        failures: Dict[str, Dict[str, int]] = {'source': {}, 'target': {}}
+        for name, path, compression in [('source', source_path, source_compression),
+                                        ('target', target_path, target_compression)]:
+            sides[name] = SpillBuckets(directory, name, bucket_count)
+            position = 0
+            for chunk in read_prepared_chunks(path, chunk_rows, required_columns, numeric_columns,
+                                              None if detect_dates else date_format, ignore_case,
+                                              strip_whitespace, compression, date_columns, string_storage, schema,
+                                              failures[name]):
+                chunk.index = pd.RangeIndex(position, position + len(chunk))
+                position += len(chunk)
+                for join_column in join_columns:
+                    if join_column not in chunk.columns:
+                        raise ValueError(f"Required column '{join_column}' not found in both DataFrames after normalization.")
+                if detect_dates:
+                    scan_date_columns(chunk, date_format, seen_columns, undated_columns)
+                with timed('spill'):
+                    sides[name].spill(chunk, bucket_of(join_key_values(chunk, join_columns), bucket_count))
+
+        detected = sorted(seen_columns - undated_columns)
+        results = []
+        for bucket in range(bucket_count):
+            with timed('spill_load'):
+                source_bucket = sides['source'].load(bucket)
+                target_bucket = sides['target'].load(bucket)
+            if detected:
+                with timed('normalization'):
+                    parse_date_columns(source_bucket, detected, date_format)
+                    parse_date_columns(target_bucket, detected, date_format)
+            results.append(reconcile_ordered(
+                source_bucket,
+                target_bucket,
+                join_columns=join_columns,
+                ignore_columns=ignore_columns,
+                debit_column=debit_column,
+                credit_column=credit_column,
+                workers=workers,
+                aggregate_duplicates=aggregate_duplicates
+            ))
+
+    (missing_in_source, missing_in_target, discrepancies, summary), _ = merge_partitions(results)
+    if schema is not None:
+        summary['coercion_failures'] = failures
+    return missing_in_source, missing_in_target, discrepancies, summary
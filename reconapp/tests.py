@@ -1,12 +1,27 @@
-from django.test import TestCase, Client
+from django.test import TestCase, Client, AsyncClient, override_settings
 from rest_framework import status
 from django.urls import reverse
 import pandas as pd
-from io import StringIO
-from .utils import normalize_dataframe, reconcile_data
-from .views import validate_file_columns
-from .serializers import FileUploadSerializer
-from .models import UploadedFile, ReconciliationReport
+from io import StringIO, BytesIO
+from .utils import normalize_dataframe, reconcile_data, json_records, validate_file_columns
+from .streaming import reconcile_csv_streaming
+from .exports import export_path
+from .readers import read_input
+from .schemas import read_csv_with_schema, read_csv_chunks_with_schema
+from .renderers import ORJSONRenderer, ORJSONParser
+from .benchmarks import generate_ledgers, run_benchmarks, compare_to_baseline
+from .matching import match_near_misses
+import numpy as np
+import tempfile
+import os
+import gzip
+import zipfile
+import pyarrow.csv as pa_csv
+from unittest import mock
+from .models import UploadedFile, ReconciliationReport, ReconciliationJob, ReconciliationResult, ReconciliationSchema
+import json
+from datetime import timedelta
+from django.utils import timezone
 
 class UtilityFunctionTests(TestCase):
     def test_normalize_dataframe_lowercase(self):
@@ -16,6 +31,35 @@ class UtilityFunctionTests(TestCase):
         normalized_df = normalize_dataframe(df)
         self.assertEqual(list(normalized_df.columns), ['column a'])
 
+    def test_normalize_dataframe_dates_and_string_storage(self):
+        # Test that only date columns are parsed and that repetitive text becomes categorical
+        df = pd.DataFrame({'Date': ['2024-01-02', None, '2024-01-03', '2024-01-04'], 'Memo': [' A', 'a ', ' A', '2024-01-02']})
+        normalized = normalize_dataframe(df, date_fmt='%Y-%m-%d', string_storage='category')
+        self.assertTrue(pd.api.types.is_datetime64_any_dtype(normalized['date']))
+        self.assertEqual(normalized['memo'].tolist(), ['a', 'a', 'a', '2024-01-02'])
+        self.assertIsInstance(normalized['memo'].dtype, pd.CategoricalDtype)
+        declared = normalize_dataframe(df, date_fmt='%Y-%m-%d', date_columns=['Memo'])
+        self.assertEqual(declared['date'].isna().tolist(), [False, True, False, False])
+        self.assertEqual(declared['date'].dtype, object)
+        self.assertEqual(declared['memo'].isna().tolist(), [True, True, True, False])
+        self.assertEqual(df.columns.tolist(), ['Date', 'Memo'])
+
+    def test_json_records_and_renderer(self):
+        # Test the column-wise JSON cleanup and the JSON renderer and parser round trip
+        df = pd.DataFrame({
+            'amount': [1.5, np.nan, np.inf],
+            'date': pd.to_datetime(['2024-01-01', None, '2024-01-02']),
+            'memo': pd.Categorical(['a', None, 'a']),
+        })
+        records = json_records(df)
+        self.assertEqual(records[0], {'amount': 1.5, 'date': '2024-01-01T00:00:00', 'memo': 'a'})
+        self.assertEqual(records[1], {'amount': None, 'date': None, 'memo': None})
+        self.assertIsNone(records[2]['amount'])
+
+        content = ORJSONRenderer().render({'count': np.int64(2), 'value': np.float64('nan'), 'rows': records})
+        parsed = ORJSONParser().parse(BytesIO(content))
+        self.assertEqual(parsed, {'count': 2, 'value': None, 'rows': records})
+
     def test_validate_file_columns_success(self):
         # Test case for successful validation
         data = {'Txn RefNo': [1], 'Debit': [10.0], 'Credit': [0.0]}
@@ -30,13 +74,213 @@ class UtilityFunctionTests(TestCase):
     def test_reconcile_data_no_discrepancies(self):
         # Test case for reconciliation with no discrepancies
         source_data = {'txn refno': [1], 'debit': [10.0], 'credit': [0.0]}
-        target_data = {'txn refno': [1], 'debit': [10.0], 'credit': [0.0]}
+        target_data = {'txn refno': [1], 'debit': [0.0], 'credit': [10.0]}
         source_df = pd.DataFrame(source_data)
         target_df = pd.DataFrame(target_data)
         missing_source, missing_target, discrepancies, summary = reconcile_data(source_df, target_df, join_columns=['txn refno'])
         self.assertEqual(len(discrepancies), 0)
-       
 
+    def test_reconcile_data_reports_only_differing_rows(self):
+        # Test case for debit/credit, amount and other column discrepancies on matched rows
+        source_data = {'txn refno': [1, 2, 3], 'debit': [10.0, 0.0, 5.0], 'credit': [0.0, 20.0, 0.0], 'description': ['a', 'b', 'c']}
+        target_data = {'txn refno': [1, 2, 3], 'debit': [0.0, 20.0, 5.0], 'credit': [10.0, 0.0, 0.0], 'description': ['a', 'x', 'c']}
+        source_df = pd.DataFrame(source_data)
+        target_df = pd.DataFrame(target_data)
+        missing_source, missing_target, discrepancies, summary = reconcile_data(source_df, target_df, join_columns=['txn refno'])
+        self.assertEqual(discrepancies, [
+            {'txn refno': 2, 'discrepancies': {'other_discrepancies': {'description': {'source': 'b', 'target': 'x'}}}},
+            {'txn refno': 3, 'discrepancies': {
+                'debit_credit_mismatch': 'Source is Debit, Target is not Credit',
+            }},
+        ])
+
+    def test_reconcile_data_duplicate_occurrences(self):
+        # Test case for duplicate detection with occurrence counts on each side
+        source_df = pd.DataFrame({'txn refno': [1, 1, 1, 2], 'debit': [10.0, 10.0, 10.0, 5.0], 'credit': [0.0, 0.0, 0.0, 0.0]})
+        target_df = pd.DataFrame({'txn refno': [1, 2, 2], 'debit': [0.0, 0.0, 0.0], 'credit': [10.0, 5.0, 5.0]})
+        missing_source, missing_target, discrepancies, summary = reconcile_data(source_df, target_df, join_columns=['txn refno'])
+        self.assertEqual(discrepancies[:2], [
+            {'txn refno': 1, 'discrepancies': {'duplicate_in_source': True, 'occurrences': {'source': 3, 'target': 1}}},
+            {'txn refno': 2, 'discrepancies': {'duplicate_in_target': True, 'occurrences': {'source': 1, 'target': 2}}},
+        ])
+        self.assertEqual(summary['duplicate_in_source_count'], 1)
+        self.assertEqual(summary['duplicate_in_target_count'], 1)
+
+    def test_reconcile_data_missing_records(self):
+        # Test case for records missing on either side
+        source_df = pd.DataFrame({'txn refno': ['a', 'b'], 'debit': [10.0, 5.0], 'credit': [0.0, 0.0]})
+        target_df = pd.DataFrame({'txn refno': ['a', 'c'], 'debit': [0.0, 0.0], 'credit': [10.0, 7.0]})
+        missing_source, missing_target, discrepancies, summary = reconcile_data(source_df, target_df, join_columns=['txn refno'])
+        self.assertEqual([record['txn refno'] for record in missing_target], ['b'])
+        self.assertEqual([record['txn refno'] for record in missing_source], ['c'])
+        self.assertEqual(list(missing_target[0]), ['txn refno', 'debit_source', 'credit_source', 'debit_target', 'credit_target'])
+        self.assertEqual(missing_source[0]['credit_target'], 7.0)
+        self.assertEqual(len(discrepancies), 0)
+
+    def test_reconcile_csv_streaming_matches_in_memory(self):
+        # Test case for bucketed out-of-core reconciliation giving the same records as the in-memory path
+        source_csv = "Txn RefNo,Debit,Credit\n" + "".join(f"T{i},{i}.0,0.0\n" for i in range(50)) + "T0,0.0,0.0\n"
+        target_csv = "Txn RefNo,Debit,Credit\n" + "".join(f"T{i},0.0,{i if i % 7 else i + 1}.0\n" for i in range(5, 60))
+        with tempfile.TemporaryDirectory() as directory:
+            source_path = os.path.join(directory, 'source.csv')
+            target_path = os.path.join(directory, 'target.csv')
+            with open(source_path, 'w') as handle:
+                handle.write(source_csv)
+            with open(target_path, 'w') as handle:
+                handle.write(target_csv)
+            streamed = reconcile_csv_streaming(
+                source_path, target_path, join_columns=['txn refno'], required_columns=['Txn RefNo', 'Debit', 'Credit'],
+                numeric_columns=['Debit', 'Credit'], memory_budget=4096
+            )
+        in_memory = reconcile_data(
+            normalize_dataframe(pd.read_csv(StringIO(source_csv))), normalize_dataframe(pd.read_csv(StringIO(target_csv))),
+            join_columns=['txn refno']
+        )
+        self.assertEqual(repr(streamed), repr(in_memory))
+
+    def test_reconcile_csv_streaming_numeric_keys_with_blank_reference(self):
+        # Test case for integer source keys and target keys read as floats because of a blank reference
+        source_csv = "Txn RefNo,Debit,Credit\n" + "".join(f"{i},{i}.0,0.0\n" for i in range(150))
+        target_csv = "Txn RefNo,Debit,Credit\n,1.0,0.0\n" + "".join(f"{i},{i}.0,0.0\n" for i in range(150) if i != 7)
+        with tempfile.TemporaryDirectory() as directory:
+            source_path = os.path.join(directory, 'source.csv')
+            target_path = os.path.join(directory, 'target.csv')
+            with open(source_path, 'w') as handle:
+                handle.write(source_csv)
+            with open(target_path, 'w') as handle:
+                handle.write(target_csv)
+            streamed = reconcile_csv_streaming(
+                source_path, target_path, join_columns=['txn refno'], required_columns=['Txn RefNo', 'Debit', 'Credit'],
+                numeric_columns=['Debit', 'Credit'], memory_budget=4096
+            )
+        in_memory = reconcile_data(
+            normalize_dataframe(pd.read_csv(StringIO(source_csv))), normalize_dataframe(pd.read_csv(StringIO(target_csv))),
+            join_columns=['txn refno']
+        )
+        self.assertEqual(len(streamed[1]), 1)
+        self.assertEqual(repr(streamed), repr(in_memory))
+
+    def test_reconcile_data_parallel_matches_serial(self):
+        # Test case for the process pool mode returning exactly the serial result
+        source_df = pd.DataFrame({
+            'txn refno': [f"T{i % 40}" for i in range(60)],
+            'debit': [float(i % 3) for i in range(60)],
+            'credit': [float(i % 2) for i in range(60)],
+            'description': [f"d{i % 5}" for i in range(60)],
+        })
+        target_df = pd.DataFrame({
+            'txn refno': [f"T{i % 50}" for i in range(10, 70)],
+            'debit': [float(i % 2) for i in range(60)],
+            'credit': [float(i % 3) for i in range(60)],
+            'description': [f"d{i % 4}" for i in range(60)],
+        })
+        serial = reconcile_data(source_df, target_df, join_columns=['txn refno'])
+        parallel = reconcile_data(source_df, target_df, join_columns=['txn refno'], workers=3)
+        self.assertEqual(repr(parallel), repr(serial))
+
+    def test_reconcile_data_parallel_mixed_numeric_keys(self):
+        # Test case for partitioning integer source keys and float target keys with a missing one the same way
+        source_df = pd.DataFrame({'txn refno': list(range(150)), 'debit': [1.0] * 150, 'credit': [0.0] * 150})
+        target_df = pd.DataFrame({
+            'txn refno': [float(i) for i in range(150) if i != 3] + [np.nan],
+            'debit': [1.0] * 150,
+            'credit': [0.0] * 150,
+        })
+        serial = reconcile_data(source_df, target_df, join_columns=['txn refno'])
+        parallel = reconcile_data(source_df, target_df, join_columns=['txn refno'], workers=4)
+        self.assertEqual(len(parallel[1]), 1)
+        self.assertEqual(repr(parallel), repr(serial))
+
+    def test_reconcile_data_composite_join_columns(self):
+        # Test case for a key made of several columns, where a reference alone repeats across accounts
+        source_df = pd.DataFrame({
+            'account': ['a1', 'a2', 'a1', 'a3'],
+            'reference': ['r1', 'r1', 'r2', 'r9'],
+            'debit': [10.0, 0.0, 5.0, 1.0],
+            'credit': [0.0, 20.0, 0.0, 0.0],
+        })
+        target_df = pd.DataFrame({
+            'account': ['a2', 'a1', 'a1', 'a1'],
+            'reference': ['r1', 'r1', 'r2', 'r2'],
+            'debit': [20.0, 0.0, 0.0, 0.0],
+            'credit': [0.0, 10.0, 7.0, 7.0],
+        })
+        missing_source, missing_target, discrepancies, summary = reconcile_data(source_df, target_df, join_columns=['account', 'reference'])
+        self.assertEqual(missing_source, [])
+        self.assertEqual(missing_target, [{'account': 'a3', 'reference': 'r9', 'debit_source': 1.0, 'credit_source': 0.0, 'debit_target': None, 'credit_target': None}])
+        self.assertEqual(summary['duplicate_in_target_count'], 1)
+        self.assertEqual(discrepancies[0], {'account': 'a1', 'reference': 'r2', 'discrepancies': {'duplicate_in_target': True, 'occurrences': {'source': 1, 'target': 2}}})
+        self.assertEqual([record['discrepancies']['amount_mismatch'] for record in discrepancies[1:]], [{'source': 5.0, 'target': 7.0}] * 2)
+        self.assertEqual(repr(reconcile_data(source_df, target_df, join_columns=['account', 'reference'], workers=2)), repr((missing_source, missing_target, discrepancies, summary)))
+
+    def test_reconcile_data_aggregates_split_payments(self):
+        # Test case for keys with several rows matched on their totals: one settlement against three payments, and a batch that does not add up
+        source_df = pd.DataFrame({
+            'txn refno': ['s1', 'b1', 's1', 'x1', 's1', 'b1', 'u1', 'u1'],
+            'debit': [100.0, 10.0, 100.0, 5.0, 100.0, 0.0, 1.0, 1.0],
+            'credit': [0.0, 0.0, 0.0, 0.0, 0.0, 4.0, 0.0, 0.0],
+        })
+        target_df = pd.DataFrame({
+            'txn refno': ['b1', 's1', 'x1', 'b1'],
+            'debit': [4.0, 0.0, 0.0, 0.0],
+            'credit': [0.0, 300.0, 5.0, 7.0],
+        })
+        missing_source, missing_target, discrepancies, summary = reconcile_data(source_df, target_df, join_columns=['txn refno'], aggregate_duplicates=True)
+        self.assertEqual(missing_source, [])
+        self.assertEqual([record['txn refno'] for record in missing_target], ['u1', 'u1'])
+        self.assertEqual(discrepancies, [
+            {'txn refno': 'b1', 'discrepancies': {'aggregate_mismatch': {'source': {'debit': 10.0, 'credit': 4.0, 'rows': 2}, 'target': {'debit': 4.0, 'credit': 7.0, 'rows': 2}}}},
+            {'txn refno': 'u1', 'discrepancies': {'duplicate_in_source': True, 'occurrences': {'source': 2, 'target': 0}}},
+        ])
+        self.assertEqual((summary['aggregated_key_count'], summary['aggregate_mismatch_count'], summary['duplicate_in_source_count']), (2, 1, 1))
+        self.assertEqual(repr(reconcile_data(source_df, target_df, join_columns=['txn refno'], aggregate_duplicates=True, workers=2)), repr((missing_source, missing_target, discrepancies, summary)))
+
+    def test_match_near_misses_within_tolerance_and_window(self):
+        # Test case for unmatched rows paired by amount within the tolerance, in opposite directions and within the date window
+        source_df = pd.DataFrame({
+            'txn refno': ['s1', 's2', 's3', 's4'],
+            'debit': [100.0, 0.0, 50.0, 70.0],
+            'credit': [0.0, 30.0, 0.0, 0.0],
+            'txn date': pd.to_datetime(['2024-01-01', '2024-01-05', '2024-01-10', '2024-01-01']),
+        })
+        target_df = pd.DataFrame({
+            'txn refno': ['t1', 't2', 't3', 't4', 't5'],
+            'debit': [0.0, 30.0, 0.0, 70.0, 0.0],
+            'credit': [100.01, 0.0, 50.0, 0.0, 99.99],
+            'txn date': pd.to_datetime(['2024-01-02', '2024-01-05', '2024-02-10', '2024-01-01', '2024-01-01']),
+        })
+        missing_source, missing_target, _, _ = reconcile_data(source_df, target_df, join_columns=['txn refno'])
+        remaining_source, remaining_target, near_matches = match_near_misses(
+            missing_source, missing_target, ['txn refno'], amount_tolerance=0.01, date_column='txn date', date_window_days=2
+        )
+        # s1 takes the closest date, s3 is a month away from t3, and t4 is a debit like s4
+        self.assertEqual([(r['txn refno'], r['discrepancies']['near_match']['target']['txn refno']) for r in near_matches], [('s1', 't5'), ('s2', 't2')])
+        self.assertEqual(near_matches[0]['discrepancies']['near_match']['amount'], {'source': 100.0, 'target': 99.99})
+        self.assertEqual(near_matches[0]['discrepancies']['near_match']['date'], {'source': '2024-01-01T00:00:00', 'target': '2024-01-01T00:00:00'})
+        self.assertEqual([r['txn refno'] for r in remaining_target], ['s3', 's4'])
+        self.assertEqual([r['txn refno'] for r in remaining_source], ['t1', 't3', 't4'])
+        _, _, exact = match_near_misses(missing_source, missing_target, ['txn refno'])
+        self.assertEqual([r['txn refno'] for r in exact], ['s2', 's3'])
+
+    def test_benchmark_ledgers_and_baseline_comparison(self):
+        # Test case for the generated ledgers being reproducible, reconciling to the injected faults and regressions being caught
+        source, target, expected = generate_ledgers(2000, seed=7)
+        again, _, _ = generate_ledgers(2000, seed=7)
+        pd.testing.assert_frame_equal(source, again)
+        self.assertEqual(expected['missing_in_target_count'], 20)
+        self.assertEqual(expected['discrepancy_count'], 2 * 10 + 20 + 10)
+        results = {'2000': run_benchmarks(2000, cases=['reconcile_data', 'http_endpoint'], seed=7)}
+        self.assertEqual(set(results['2000']), {'reconcile_data', 'http_endpoint'})
+        self.assertEqual(ReconciliationReport.objects.count(), 0)
+        baseline = {'results': {'2000': {'reconcile_data': {'seconds': results['2000']['reconcile_data']['seconds'] / 2, 'peak_rss_mb': 1e9}}}}
+        regressions = compare_to_baseline(results, baseline, tolerance=0.2)
+        self.assertEqual(len(regressions), 1)
+        self.assertIn('reconcile_data at 2000 rows: seconds', regressions[0])
+        with self.assertRaises(ValueError):
+            generate_ledgers(100, missing_rate=0.5, duplicate_rate=0.3)
+
+
+@override_settings(RECONCILIATION_PARSED_CACHE_DIR=tempfile.mkdtemp())
 class FileUploadAndReconcileViewTests(TestCase):
     def setUp(self):
         self.client = Client()
@@ -57,6 +301,516 @@ class FileUploadAndReconcileViewTests(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertIn('message', response.data)
 
+    def test_file_upload_records_stage_metrics(self):
+        # Test that stage timings are returned, stored on the report and aggregated by the metrics endpoint
+        source_file = StringIO("Txn RefNo,Debit,Credit\n1,10.0,0.0\n2,5.0,0.0")
+        target_file = StringIO("Txn RefNo,Debit,Credit\n1,0.0,10.0")
+        source_file.name = 'source.csv'
+        target_file.name = 'target.csv'
+
+        response = self.client.post(self.reconcile_url, {'source_file': source_file, 'target_file': target_file}, format='multipart')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        stages = response.data['metrics']['stages']
+        for stage in ['upload_save', 'merge', 'duplicate_detection', 'discrepancy_scan', 'serialization', 'db_persist']:
+            self.assertIn(stage, stages)
+        # Files parsed by an earlier test come from the parsed cache instead
+        self.assertEqual(stages.get('parse', {}).get('calls', 0) + stages.get('parsed_cache_load', {}).get('calls', 0), 2)
+        report = ReconciliationReport.objects.get(id=response.data['report_id'])
+        self.assertEqual(report.metrics_json, response.data['metrics'])
+
+        aggregate = self.client.get(reverse('reconciliation-metrics')).data
+        self.assertEqual(aggregate['reports'], 1)
+        self.assertEqual(aggregate['stages']['merge']['runs'], 1)
+
+    def test_file_upload_streaming(self):
+        # Test file upload reconciled in streaming mode
+        source_file = StringIO("Txn RefNo,Debit,Credit\n1,10.0,0.0\n2,5.0,0.0")
+        target_file = StringIO("Txn RefNo,Debit,Credit\n1,0.0,10.0")
+        source_file.name = 'source.csv'
+        target_file.name = 'target.csv'
+
+        post_data = {'source_file': source_file, 'target_file': target_file, 'streaming': True}
+        response = self.client.post(self.reconcile_url, post_data, format='multipart')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['summary']['missing_in_target_count'], 1)
+        self.assertEqual(response.data['summary']['discrepancy_count'], 0)
+
+    @override_settings(RECONCILIATION_JOB_WORKERS=0)
+    def test_file_upload_background_job(self):
+        # Test file upload queued as a job and polled until it has a report
+        source_file = StringIO("Txn RefNo,Debit,Credit\n1,10.0,0.0")
+        target_file = StringIO("Txn RefNo,Debit,Credit\n1,0.0,10.0")
+        source_file.name = 'source.csv'
+        target_file.name = 'target.csv'
+
+        post_data = {'source_file': source_file, 'target_file': target_file, 'run_in_background': True}
+        response = self.client.post(self.reconcile_url, post_data, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+
+        job_response = self.client.get(reverse('reconciliation-job-detail', kwargs={'id': response.data['job_id']}))
+        self.assertEqual(job_response.status_code, status.HTTP_200_OK)
+        self.assertEqual(job_response.data['status'], ReconciliationJob.STATUS_DONE)
+        self.assertTrue(ReconciliationReport.objects.filter(id=job_response.data['report_id']).exists())
+
+    @override_settings(RECONCILIATION_JOB_WORKERS=0)
+    def test_file_upload_background_job_failure(self):
+        # Test a background job that fails on missing columns
+        source_file = StringIO("RefNo,Amount\n1,10.0")
+        target_file = StringIO("Txn RefNo,Debit,Credit\n1,0.0,10.0")
+        source_file.name = 'source.csv'
+        target_file.name = 'target.csv'
+
+        post_data = {'source_file': source_file, 'target_file': target_file, 'run_in_background': True}
+        response = self.client.post(self.reconcile_url, post_data, format='multipart')
+
+        job = ReconciliationJob.objects.get(id=response.data['job_id'])
+        self.assertEqual(job.status, ReconciliationJob.STATUS_FAILED)
+        self.assertIn('Missing required columns', job.error)
+
+    def test_file_upload_stores_result_rows(self):
+        # Test that the report records are stored as rows and read back by the report endpoint
+        source_file = StringIO("Txn RefNo,Debit,Credit\n1,10.0,0.0\n2,5.0,0.0")
+        target_file = StringIO("Txn RefNo,Debit,Credit\n1,10.0,0.0\n3,0.0,5.0")
+        source_file.name = 'source.csv'
+        target_file.name = 'target.csv'
+
+        response = self.client.post(self.reconcile_url, {'source_file': source_file, 'target_file': target_file}, format='multipart')
+        report = ReconciliationReport.objects.get(id=response.data['report_id'])
+
+        self.assertIsNone(report.missing_in_source_json)
+        self.assertEqual(report.results.filter(category=ReconciliationResult.CATEGORY_MISSING_IN_TARGET).get().join_key, '2')
+        self.assertEqual(report.results.filter(category=ReconciliationResult.CATEGORY_MISSING_IN_SOURCE).get().join_key, '3')
+        self.assertEqual(report.results.filter(category=ReconciliationResult.CATEGORY_DISCREPANCY).count(), 1)
+
+        detail = self.client.get(reverse('reconciliation-report-detail', kwargs={'id': report.id}))
+        self.assertEqual(detail.data['missing_in_target']['results'], response.data['missing_in_target'])
+        self.assertEqual(detail.data['discrepancies']['results'], response.data['discrepancies'])
+
+    def test_report_detail_pagination_and_filters(self):
+        # Test keyset pages of one section and the discrepancy type and key range filters
+        source_file = StringIO("Txn RefNo,Debit,Credit\n" + "".join(f"T{i},10.0,0.0\n" for i in range(5)))
+        target_file = StringIO("Txn RefNo,Debit,Credit\n" + "".join(f"T{i},0.0,{10 if i % 2 else 20}.0\n" for i in range(5)))
+        source_file.name = 'source.csv'
+        target_file.name = 'target.csv'
+        response = self.client.post(self.reconcile_url, {'source_file': source_file, 'target_file': target_file}, format='multipart')
+        detail_url = reverse('reconciliation-report-detail', kwargs={'id': response.data['report_id']})
+
+        first_page = self.client.get(detail_url, {'section': 'discrepancies', 'limit': 2})
+        self.assertEqual([record['txn refno'] for record in first_page.data['results']], ['t0', 't2'])
+        second_page = self.client.get(first_page.data['next'])
+        self.assertEqual([record['txn refno'] for record in second_page.data['results']], ['t4'])
+        self.assertIsNone(second_page.data['next'])
+
+        filtered = self.client.get(detail_url, {'section': 'discrepancies', 'discrepancy_type': 'amount_mismatch', 'key_from': 't1', 'key_to': 't3'})
+        self.assertEqual([record['txn refno'] for record in filtered.data['results']], ['t2'])
+
+        invalid = self.client.get(detail_url, {'discrepancy_type': 'unknown'})
+        self.assertEqual(invalid.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_report_key_range_compares_numeric_keys_by_value(self):
+        # Test a numeric key range compares by value, where as text 1 to 9 would also hold 10, 20 and 100
+        keys = [2, 9, 10, 20, 100]
+        source_file = StringIO("Txn RefNo,Debit,Credit\n" + "".join(f"{key},10.0,0.0\n" for key in keys))
+        target_file = StringIO("Txn RefNo,Debit,Credit\n1,0.0,10.0")
+        source_file.name = 'source.csv'
+        target_file.name = 'target.csv'
+        response = self.client.post(self.reconcile_url, {'source_file': source_file, 'target_file': target_file}, format='multipart')
+        detail_url = reverse('reconciliation-report-detail', kwargs={'id': response.data['report_id']})
+
+        filtered = self.client.get(detail_url, {'section': 'missing_in_target', 'key_from': '1', 'key_to': '9'})
+        self.assertEqual([record['txn refno'] for record in filtered.data['results']], [2, 9])
+        filtered = self.client.get(detail_url, {'section': 'missing_in_target', 'key_from': '10'})
+        self.assertEqual([record['txn refno'] for record in filtered.data['results']], [10, 20, 100])
+
+    @override_settings(RECONCILIATION_EXPORT_CACHE_DIR=tempfile.mkdtemp())
+    def test_report_download_streams_csv_and_html(self):
+        # Test the CSV and HTML downloads are streamed section by section
+        source_file = StringIO("Txn RefNo,Debit,Credit\n1,10.0,0.0\n2,5.0,0.0")
+        target_file = StringIO("Txn RefNo,Debit,Credit\n1,0.0,10.0")
+        source_file.name = 'source.csv'
+        target_file.name = 'target.csv'
+        response = self.client.post(self.reconcile_url, {'source_file': source_file, 'target_file': target_file}, format='multipart')
+        detail_url = reverse('reconciliation-report-detail', kwargs={'id': response.data['report_id']})
+
+        csv_response = self.client.get(detail_url, {'type': 'csv'})
+        self.assertTrue(csv_response.streaming)
+        self.assertEqual(b''.join(csv_response.streaming_content).decode(), (
+            "Section,txn refno,debit_source,credit_source,debit_target,credit_target\n"
+            "Missing in Target,2,5.0,0.0,,\n"
+        ))
+
+        html_response = self.client.get(detail_url, {'type': 'html'})
+        self.assertTrue(html_response.streaming)
+        html_content = b''.join(html_response.streaming_content).decode()
+        self.assertIn('<h3>Missing in Target</h3>', html_content)
+        self.assertNotIn('<h3>Discrepancies</h3>', html_content)
+
+    @override_settings(RECONCILIATION_EXPORT_CACHE_DIR=tempfile.mkdtemp())
+    def test_report_download_is_cached_with_validators(self):
+        # Test that a repeated download is served from the export cache and honours If-None-Match
+        source_file = StringIO("Txn RefNo,Debit,Credit\n1,10.0,0.0\n2,5.0,0.0")
+        target_file = StringIO("Txn RefNo,Debit,Credit\n1,0.0,10.0")
+        source_file.name = 'source.csv'
+        target_file.name = 'target.csv'
+        response = self.client.post(self.reconcile_url, {'source_file': source_file, 'target_file': target_file}, format='multipart')
+        report_id = response.data['report_id']
+        detail_url = reverse('reconciliation-report-detail', kwargs={'id': report_id})
+
+        # The first download is sent while it renders, and only stored once it is complete
+        cached_path = export_path(ReconciliationReport.objects.get(id=report_id), 'csv')
+        cold = self.client.get(detail_url, {'type': 'csv'})
+        self.assertNotIn('ETag', cold)
+        self.assertFalse(os.path.exists(cached_path))
+        first_content = b''.join(cold.streaming_content)
+        self.assertTrue(os.path.exists(cached_path))
+
+        # A download the client gives up on leaves neither a partial export nor its temporary file behind
+        abandoned = self.client.get(detail_url, {'type': 'html'})
+        abandoned.close()
+        self.assertEqual(os.listdir(os.path.dirname(cached_path)), [os.path.basename(cached_path)])
+
+        ReconciliationResult.objects.filter(report_id=report_id).delete()
+        first = self.client.get(detail_url, {'type': 'csv'})
+        self.assertIn('ETag', first)
+        self.assertIn('Last-Modified', first)
+        self.assertEqual(b''.join(first.streaming_content), first_content)
+
+        not_modified = self.client.get(detail_url, {'type': 'csv'}, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # A later report given the same id, as after a database reset, is not served the cached export
+        ReconciliationReport.objects.filter(id=report_id).update(reconciliation_timestamp=timezone.now() + timedelta(days=1))
+        reused = self.client.get(detail_url, {'type': 'csv'}, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(reused.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(b''.join(reused.streaming_content), first_content)
+
+    def test_file_upload_reuses_stored_file_and_parsed_copy(self):
+        # Test that uploading the same content twice stores it once and parses it once
+        def upload(name):
+            source_file = StringIO("Txn RefNo,Debit,Credit\n1,10.0,0.0")
+            target_file = StringIO("Txn RefNo,Debit,Credit\n1,0.0,10.0")
+            source_file.name = name
+            target_file.name = 'target.csv'
+            return self.client.post(self.reconcile_url, {'source_file': source_file, 'target_file': target_file}, format='multipart')
+
+        first = ReconciliationReport.objects.get(id=upload('source.csv').data['report_id'])
+        self.assertEqual(len(first.source_file.content_hash), 64)
+        with mock.patch('reconapp.uploads.pd.read_csv') as read_csv:
+            second = ReconciliationReport.objects.get(id=upload('statement.csv').data['report_id'])
+        read_csv.assert_not_called()
+        self.assertEqual(second.source_file.file.name, first.source_file.file.name)
+        self.assertEqual(second.source_file.original_filename, 'statement.csv')
+        self.assertEqual(second.summary_json, first.summary_json)
+
+    def test_file_upload_incremental_against_baseline_report(self):
+        # Test that an incremental run returns the same report as a full run, plus the delta against its baseline
+        source, target, _ = generate_ledgers(500, seed=3)
+        changed_source = source.drop(index=[0, 1])
+        changed_source.loc[10, 'Debit'] += 5.0
+        changed_target = pd.concat([target, target.iloc[[20]]], ignore_index=True)
+
+        def upload(source_df, target_df, **options):
+            source_file = StringIO(source_df.to_csv(index=False))
+            target_file = StringIO(target_df.to_csv(index=False))
+            source_file.name = 'source.csv'
+            target_file.name = 'target.csv'
+            return self.client.post(self.reconcile_url, {'source_file': source_file, 'target_file': target_file, **options}, format='multipart')
+
+        baseline = upload(source, target, date_format='%Y-%m-%d')
+        full = upload(changed_source, changed_target, date_format='%Y-%m-%d')
+        incremental = upload(changed_source, changed_target, date_format='%Y-%m-%d', baseline_report_id=baseline.data['report_id'])
+        self.assertEqual(incremental.status_code, status.HTTP_200_OK)
+        for section in ['missing_in_source', 'missing_in_target', 'discrepancies']:
+            self.assertEqual(incremental.data[section], full.data[section])
+        self.assertEqual(incremental.data['summary']['discrepancy_count'], full.data['summary']['discrepancy_count'])
+        self.assertGreater(incremental.data['summary']['incremental']['keys']['reused'], 400)
+        self.assertEqual(incremental.data['summary']['incremental']['keys']['removed'], 0)
+        self.assertEqual(len(incremental.data['delta']['added']['missing_in_source']), 2)
+        report = ReconciliationReport.objects.get(id=incremental.data['report_id'])
+        self.assertEqual(report.baseline_report_id, baseline.data['report_id'])
+        self.assertEqual(report.results.count(), ReconciliationReport.objects.get(id=full.data['report_id']).results.count())
+
+        different = upload(changed_source, changed_target, baseline_report_id=baseline.data['report_id'])
+        self.assertEqual(different.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('date_format', different.data['error'])
+
+    def test_file_upload_incremental_reuses_numeric_keys(self):
+        # Test that integer refnos are found among the stored results, and that keys turned into floats are not reused
+        source = "Txn RefNo,Debit,Credit\n" + "".join(f"{i},{i}.0,0.0\n" for i in range(1, 41))
+        target = "Txn RefNo,Debit,Credit\n" + "".join(f"{i},0.0,{i + (i % 5 == 0)}.0\n" for i in range(3, 45))
+
+        def upload(source_csv, target_csv, **options):
+            source_file = StringIO(source_csv)
+            target_file = StringIO(target_csv)
+            source_file.name = 'source.csv'
+            target_file.name = 'target.csv'
+            return self.client.post(self.reconcile_url, {'source_file': source_file, 'target_file': target_file, **options}, format='multipart')
+
+        baseline = upload(source, target)
+        self.assertEqual(baseline.data['summary']['discrepancy_count'], 8)
+        for changed_target, reused in [(target.replace("\n7,0.0,7.0", "\n7,0.0,9.0"), 43), (target + ",0.0,1.0\n", 0)]:
+            full = upload(source, changed_target)
+            incremental = upload(source, changed_target, baseline_report_id=baseline.data['report_id'])
+            for section in ['missing_in_source', 'missing_in_target', 'discrepancies']:
+                self.assertEqual(incremental.data[section], full.data[section])
+            self.assertEqual(incremental.data['summary']['incremental']['keys']['reused'], reused)
+
+    def test_file_upload_join_columns_from_saved_schema(self):
+        # Test that a saved schema can name composite join columns, which replace the default Txn RefNo
+        saved = self.client.post(reverse('reconciliation-schema-list'), json.dumps({
+            'name': 'counterparty',
+            'columns': {'Account': 'string', 'Reference': 'string', 'Debit': 'float', 'Credit': 'float'},
+            'join_columns': ['Account', 'Reference'],
+        }), content_type='application/json')
+        self.assertEqual(saved.status_code, status.HTTP_201_CREATED)
+        source_file = StringIO("Account,Reference,Debit,Credit\nA1,R1,10.0,0.0\nA2,R1,0.0,5.0")
+        target_file = StringIO("Account,Reference,Debit,Credit\nA1,R1,0.0,10.0\nA2,R2,5.0,0.0")
+        source_file.name = 'source.csv'
+        target_file.name = 'target.csv'
+
+        response = self.client.post(self.reconcile_url, {'source_file': source_file, 'target_file': target_file, 'schema_name': 'counterparty'}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['summary']['discrepancy_count'], 0)
+        self.assertEqual([(r['account'], r['reference']) for r in response.data['missing_in_target']], [('a2', 'r1')])
+        report = ReconciliationReport.objects.get(id=response.data['report_id'])
+        self.assertEqual(report.join_columns, 'account,reference')
+        self.assertEqual(list(report.results.values_list('join_key', flat=True)), ['a2|r2', 'a2|r1'])
+
+    def test_file_upload_near_match_pairing(self):
+        # Test that rows with different references are paired by amount and date, and that incremental runs refuse it
+        source_file = StringIO("Txn RefNo,Debit,Credit,Txn Date\n1,10.0,0.0,2024-01-01\nA7,25.0,0.0,2024-01-03")
+        target_file = StringIO("Txn RefNo,Debit,Credit,Txn Date\n1,0.0,10.0,2024-01-01\nB9,0.0,25.005,2024-01-04")
+        source_file.name = 'source.csv'
+        target_file.name = 'target.csv'
+        post_data = {'source_file': source_file, 'target_file': target_file, 'date_format': '%Y-%m-%d',
+                     'amount_tolerance': 0.01, 'date_window_days': 1, 'match_date_column': 'Txn Date'}
+        response = self.client.post(self.reconcile_url, post_data, format='multipart')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['summary']['near_match_count'], 1)
+        self.assertEqual(response.data['summary']['missing_in_source_count'], 0)
+        self.assertEqual(response.data['missing_in_target'], [])
+        self.assertEqual(response.data['discrepancies'][0]['discrepancies']['near_match']['target'], {'txn refno': 'b9'})
+        detail_url = reverse('reconciliation-report-detail', kwargs={'id': response.data['report_id']})
+        filtered = self.client.get(detail_url, {'section': 'discrepancies', 'discrepancy_type': 'near_match'})
+        self.assertEqual([record['txn refno'] for record in filtered.data['results']], ['a7'])
+
+        source_file.seek(0)
+        target_file.seek(0)
+        response = self.client.post(self.reconcile_url, {**post_data, 'baseline_report_id': response.data['report_id']}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(RECONCILIATION_JOB_WORKERS=0)
+    def test_batch_reconciles_pairs_from_files_and_archive(self):
+        # Test a batch of pairs sharing a target file, then the same batch from an archive with its manifest
+        def files():
+            uploads = {name: StringIO(data) for name, data in [
+                ('bank_a.csv', "Txn RefNo,Debit,Credit\n1,10.0,0.0\n2,5.0,0.0"),
+                ('bank_b.csv', "Txn RefNo,Debit,Credit\n1,10.0,0.0"),
+                ('ledger.csv', "Txn RefNo,Debit,Credit\n1,0.0,10.0"),
+            ]}
+            for name, upload in uploads.items():
+                upload.name = name
+            return list(uploads.values())
+        manifest = [{'source': 'bank_a.csv', 'target': 'ledger.csv', 'name': 'A'}, {'source': 'bank_b.csv', 'target': 'ledger.csv'}]
+
+        response = self.client.post(reverse('reconciliation-batch'), {'files': files(), 'manifest': json.dumps(manifest)}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        batch = self.client.get(reverse('reconciliation-batch-detail', kwargs={'id': response.data['batch_id']})).data
+        self.assertEqual(batch['status'], ReconciliationJob.STATUS_DONE)
+        self.assertEqual([pair['name'] for pair in batch['pairs']], ['A', 'bank_b.csv vs ledger.csv'])
+        self.assertEqual(batch['summary']['pairs'], {'total': 2, 'done': 2})
+        self.assertEqual(batch['summary']['missing_in_target_count'], 1)
+        jobs = ReconciliationJob.objects.filter(batch_id=batch['batch_id'])
+        self.assertEqual(len({job.target_file_id for job in jobs}), 1)
+        self.assertEqual({job.report_id for job in jobs}, {pair['report_id'] for pair in batch['pairs']})
+
+        archive = BytesIO()
+        with zipfile.ZipFile(archive, 'w') as zipped:
+            zipped.writestr('manifest.json', json.dumps(manifest))
+            for upload in files():
+                zipped.writestr(f"eod/{upload.name}", upload.getvalue())
+        archive.name = 'eod.zip'
+        archive.seek(0)
+        response = self.client.post(reverse('reconciliation-batch'), {'archive': archive}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['summary']['discrepancy_count'], 0)
+        self.assertEqual(response.data['summary']['pairs']['done'], 2)
+
+        response = self.client.post(reverse('reconciliation-batch'), {'files': files(), 'manifest': json.dumps([{'source': 'bank_c.csv', 'target': 'ledger.csv'}])}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(RECONCILIATION_ASYNC_WORKERS=0, RECONCILIATION_EXPORT_CACHE_DIR=tempfile.mkdtemp())
+    async def test_async_reconcile_and_report(self):
+        # Test the async endpoints give the responses of the sync ones, with the export streamed
+        client = AsyncClient()
+        source_file = StringIO("Txn RefNo,Debit,Credit\n1,10.0,0.0\n2,5.0,0.0\n3,7.0,0.0")
+        target_file = StringIO("Txn RefNo,Debit,Credit\n1,0.0,10.0\n3,0.0,8.0")
+        source_file.name = 'source.csv'
+        target_file.name = 'target.csv'
+        response = await client.post(reverse('reconcile-async'), {'source_file': source_file, 'target_file': target_file})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = json.loads(response.content)
+        self.assertEqual(data['summary']['missing_in_target_count'], 1)
+        self.assertEqual(data['summary']['discrepancy_count'], 1)
+
+        url = reverse('reconciliation-report-detail-async', kwargs={'id': data['report_id']})
+        page = json.loads((await client.get(url, {'section': 'missing_in_target', 'limit': 1})).content)
+        self.assertEqual(page['results'], data['missing_in_target'])
+        self.assertIsNone(page['next'])
+        self.assertEqual((await client.get(url, {'limit': 0})).status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = await client.get(url, {'type': 'csv'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        content = b''.join([chunk async for chunk in response.streaming_content])
+        self.assertIn(b'Missing in Target', content)
+        response = await client.get(url, {'type': 'csv'})
+        self.assertEqual(b''.join([chunk async for chunk in response.streaming_content]), content)
+        response = await client.get(url, {'type': 'csv'}, headers={'If-None-Match': response['ETag']})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual((await client.get(reverse('reconciliation-report-detail-async', kwargs={'id': 0}))).status_code, 404)
+
+    def test_file_upload_keeps_one_sided_csv_columns(self):
+        # Test that CSV files are parsed whole, so a column only one file has stays in its records
+        source_file = StringIO("Txn RefNo,Debit,Credit,Memo,Branch,Notes\n1,10.0,0.0,a,x,n1\n2,5.0,0.0,b,y,n2")
+        target_file = StringIO("Txn RefNo,Debit,Credit,Memo,Branch\n1,0.0,10.0,c,x")
+        source_file.name = 'source.csv'
+        target_file.name = 'target.csv'
+        with mock.patch('reconapp.readers.pd.read_csv', wraps=pd.read_csv) as read_csv:
+            response = self.client.post(self.reconcile_url, {'source_file': source_file, 'target_file': target_file,
+                                                             'ignore_columns': 'memo'}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('usecols', read_csv.call_args.kwargs)
+        self.assertEqual(response.data['missing_in_target'][0]['notes'], 'n2')
+        self.assertEqual(response.data['summary']['discrepancy_count'], 0)
+
+    def test_file_upload_parquet_and_feather(self):
+        # Test columnar uploads, with the ignored column left out of the read
+        source_df = pd.DataFrame({'Txn RefNo': [1, 2], 'Debit': [10.0, 5.0], 'Credit': [0.0, 0.0], 'Memo': ['a', 'b']})
+        target_df = pd.DataFrame({'Txn RefNo': [1], 'Debit': [0.0], 'Credit': [10.0], 'Memo': ['c']})
+        source_file = BytesIO()
+        target_file = BytesIO()
+        source_df.to_parquet(source_file)
+        target_df.to_feather(target_file)
+        source_file.seek(0)
+        target_file.seek(0)
+        source_file.name = 'source.parquet'
+        target_file.name = 'target.feather'
+
+        post_data = {'source_file': source_file, 'target_file': target_file, 'ignore_columns': 'memo'}
+        response = self.client.post(self.reconcile_url, post_data, format='multipart')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['summary']['missing_in_target_count'], 1)
+        self.assertEqual(response.data['summary']['discrepancy_count'], 0)
+        self.assertNotIn('memo', response.data['missing_in_target'][0])
+        report = ReconciliationReport.objects.get(id=response.data['report_id'])
+        loaded = read_input(report.source_file.file.path, 'parquet', ignore_columns=['memo'])
+        self.assertEqual(loaded.columns.tolist(), ['Txn RefNo', 'Debit', 'Credit'])
+
+    def test_file_upload_compressed(self):
+        # Test gzip and zip uploads, reconciled in memory and in streaming mode
+        source_file = BytesIO(gzip.compress(b"Txn RefNo,Debit,Credit\n1,10.0,0.0\n2,5.0,0.0"))
+        target_file = BytesIO()
+        with zipfile.ZipFile(target_file, 'w', zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr('target.csv', "Txn RefNo,Debit,Credit\n1,0.0,10.0")
+        source_file.name = 'source.csv.gz'
+        target_file.name = 'target.zip'
+
+        for streaming in [False, True]:
+            source_file.seek(0)
+            target_file.seek(0)
+            post_data = {'source_file': source_file, 'target_file': target_file, 'streaming': streaming}
+            response = self.client.post(self.reconcile_url, post_data, format='multipart')
+
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.data['summary']['missing_in_target_count'], 1)
+            self.assertEqual(response.data['summary']['discrepancy_count'], 0)
+
+    def test_file_upload_detects_date_columns_across_both_files(self):
+        # Test that a value which is not a date in one file leaves the column as text in both, in memory and streaming
+        rows = [(i, f"2024-01-{i % 28 + 1:02d}") for i in range(40)]
+        source_file = StringIO("Txn RefNo,Debit,Credit,Value Date\n" + "".join(f"{i},1.0,0.0,{day}\n" for i, day in rows))
+        target_file = StringIO("Txn RefNo,Debit,Credit,Value Date\n" + "".join(
+            f"{i},0.0,1.0,{'pending' if i == 5 else day}\n" for i, day in rows))
+        source_file.name = 'source.csv'
+        target_file.name = 'target.csv'
+
+        for streaming in [False, True]:
+            source_file.seek(0)
+            target_file.seek(0)
+            post_data = {'source_file': source_file, 'target_file': target_file, 'date_format': '%Y-%m-%d',
+                         'streaming': streaming}
+            response = self.client.post(self.reconcile_url, post_data, format='multipart')
+
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.data['summary']['discrepancy_count'], 1)
+            self.assertEqual(response.data['discrepancies'][0]['txn refno'], 5)
+
+    def test_file_upload_with_schema_reports_coercion_failures(self):
+        # Test parsing with a declared schema, in memory and in streaming mode, with a saved schema
+        schema = {'columns': {'Txn RefNo': 'string', 'Debit': 'float', 'Credit': 'float'}}
+        ReconciliationSchema.objects.create(name='ledger', columns=schema['columns'])
+
+        for options in [{'schema': json.dumps(schema)}, {'schema': json.dumps(schema), 'streaming': True}, {'schema_name': 'ledger'}]:
+            source_file = StringIO("Txn RefNo,Debit,Credit,Memo\n001,10.0,,a\n002,oops,0.0,b")
+            target_file = StringIO("Txn RefNo,Debit,Credit,Memo\n001,0.0,10.0,c\n002,0.0,5.0,d")
+            source_file.name = 'source.csv'
+            target_file.name = 'target.csv'
+
+            post_data = {'source_file': source_file, 'target_file': target_file, **options}
+            response = self.client.post(self.reconcile_url, post_data, format='multipart')
+
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.data['summary']['coercion_failures'], {'source': {'Debit': 1}, 'target': {}})
+            self.assertEqual(response.data['summary']['discrepancy_count'], 1)
+            self.assertEqual(response.data['discrepancies'][0]['txn refno'], '002')
+
+    def test_read_csv_with_schema_parses_typed_then_coerces_dirty_files(self):
+        # Test a clean file is parsed once into its dtypes and a dirty one is read again as text, by both engines
+        schema = {'columns': {'Txn RefNo': 'string', 'Debit': 'float', 'Count': 'integer', 'Day': 'date'}, 'date_format': '%Y-%m-%d'}
+        clean = "Txn RefNo,Debit,Count,Day\n001,10.5,1,2024-01-02\n002,,2,someday\n003,1,3,\n"
+        dirty = "Txn RefNo,Debit,Count,Day\n001,10.5,1,2024-01-02\n002,oops,2.5,someday\n003,,3,\n"
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'source.csv')
+            for content, reads, expected in [(clean, 1, {'Day': 1}), (dirty, 2, {'Debit': 1, 'Count': 1, 'Day': 1})]:
+                with open(path, 'w') as handle:
+                    handle.write(content)
+                for engine in ['c', 'pyarrow']:
+                    target = 'reconapp.schemas.pd.read_csv' if engine == 'c' else 'reconapp.schemas.pa_csv.read_csv'
+                    with mock.patch(target, wraps=pd.read_csv if engine == 'c' else pa_csv.read_csv) as read_csv:
+                        dataframe, failures = read_csv_with_schema(path, schema, engine=engine)
+                    self.assertEqual(read_csv.call_count, reads)
+                    self.assertEqual(failures, expected)
+                    self.assertEqual(dataframe['Txn RefNo'].tolist(), ['001', '002', '003'])
+                    self.assertEqual(str(dataframe['Count'].dtype), 'Int64')
+                    self.assertTrue(pd.api.types.is_datetime64_any_dtype(dataframe['Day']))
+                chunks = list(read_csv_chunks_with_schema(path, schema, 2))
+                self.assertEqual(sum(len(chunk) for chunk, _ in chunks), 3)
+                self.assertEqual([chunk['Debit'].dtype for chunk, _ in chunks], [np.float64, np.float64])
+
+    def test_file_upload_rejects_invalid_schema(self):
+        # Test that unknown column types and unknown saved schemas are rejected
+        for options in [{'schema': '{"columns": {"Debit": "money"}}'}, {'schema_name': 'missing'}]:
+            source_file = StringIO("Txn RefNo,Debit,Credit\n1,10.0,0.0")
+            target_file = StringIO("Txn RefNo,Debit,Credit\n1,0.0,10.0")
+            source_file.name = 'source.csv'
+            target_file.name = 'target.csv'
+            response = self.client.post(self.reconcile_url, {'source_file': source_file, 'target_file': target_file, **options}, format='multipart')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_file_upload_rejects_unknown_format(self):
+        # Test that files without a supported extension are rejected
+        source_file = StringIO("Txn RefNo,Debit,Credit\n1,10.0,0.0")
+        target_file = StringIO("Txn RefNo,Debit,Credit\n1,0.0,10.0")
+        source_file.name = 'source.xlsx'
+        target_file.name = 'target.csv'
+
+        response = self.client.post(self.reconcile_url, {'source_file': source_file, 'target_file': target_file}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_file_upload_missing_columns(self):
         # Test file upload with missing required columns
         source_data = "RefNo,Amount\n1,10.0"
@@ -94,4 +848,30 @@ class ReconciliationReportModelTests(TestCase):
             summary_json={'matched': 10, 'discrepancies': 2}
         )
         self.assertEqual(report.source_file.original_filename, 'source.csv')
-        self.assertEqual(report.summary_json['matched'], 10)
\ No newline at end of file
+        self.assertEqual(report.summary_json['matched'], 10)
+       def test_report_list_is_paginated_and_filtered(self):
+        # Test the list loads no records, reads the file names in one query and pages newest first
+        ledger = UploadedFile.objects.create(file='dummy_ledger.csv', original_filename='ledger.csv')
+        for day in range(1, 6):
+            source = UploadedFile.objects.create(file=f'dummy_bank_{day}.csv', original_filename=f'bank_{day}.csv')
+            ReconciliationReport.objects.create(
+                source_file=source, target_file=ledger, join_columns='txn refno', summary_json={'day': day},
+                reconciliation_timestamp=pd.Timestamp(f'2024-01-0{day} 12:00', tz='UTC'),
+                discrepancies_json=[{'txn refno': '1'}],
+            )
+        url = reverse('reportlist')
+        with self.assertNumQueries(1):
+            response = self.client.get(url, {'limit': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([report['summary_json']['day'] for report in response.data['results']], [5, 4])
+        self.assertEqual(response.data['results'][0]['source_file_name'], 'bank_5.csv')
+        self.assertNotIn('discrepancies_json', response.data['results'][0])
+        response = self.client.get(response.data['next'])
+        self.assertEqual([report['summary_json']['day'] for report in response.data['results']], [3, 2])
+
+        response = self.client.get(url, {'date_from': '2024-01-02', 'date_to': '2024-01-04'})
+        self.assertEqual([report['summary_json']['day'] for report in response.data['results']], [4, 3, 2])
+        response = self.client.get(url, {'filename': 'BANK_1'})
+        self.assertEqual([report['summary_json']['day'] for report in response.data['results']], [1])
+        self.assertEqual(len(self.client.get(url, {'filename': 'ledger'}).data['results']), 5)
+        self.assertEqual(self.client.get(url, {'date_from': 'yesterday'}).status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,250 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+
+import pandas as pd
+from django.conf import settings
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+
+from .metrics import timed
+from .models import UploadedFile
+from .readers import CSV_FORMAT, COLUMNAR_FORMATS, input_format, input_compression, input_columns, normalized_column, read_input
+from .schemas import read_csv_with_schema, resolve_columns, coerce_columns
+from .utils import prepare_dataframe, evict_least_recently_used
+
+logger = logging.getLogger(__name__)
+
+
+class ContentHashMixin:
+    """
+        _Upload handler mixin that computes the SHA-256 of a file while its chunks stream in.
+        _The hex digest is set as content_hash on the uploaded file, so the upload never has to be read twice.
+    """
+    def new_file(self, *args, **kwargs):
+        self.content_hash = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        if getattr(self, 'activated', True):
+            self.content_hash.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        uploaded = super().file_complete(file_size)
+        if uploaded is not None:
+            uploaded.content_hash = self.content_hash.hexdigest()
+        return uploaded
+
+
+class ContentHashMemoryFileUploadHandler(ContentHashMixin, MemoryFileUploadHandler):
+    pass
+
+
+class ContentHashTemporaryFileUploadHandler(ContentHashMixin, TemporaryFileUploadHandler):
+    pass
+
+
+def content_hash_of(uploaded) -> str:
+    """Return the content hash computed by the upload handlers, hashing the file only if it was not set."""
+    content_hash = getattr(uploaded, 'content_hash', None)
+    if content_hash is None:
+        digest = hashlib.sha256()
+        for chunk in uploaded.chunks():
+            digest.update(chunk)
+        uploaded.seek(0)
+        content_hash = digest.hexdigest()
+    return content_hash
+
+
+def save_upload(uploaded) -> UploadedFile:
+    """
+    _Save an uploaded file once per content hash.
+    _When a file with the same content is already stored, the new UploadedFile points at that copy and nothing is
+     written to disk. Every upload still gets its own row, which keeps its original filename.
+    """
+    content_hash = content_hash_of(uploaded)
+    stored = UploadedFile.objects.filter(content_hash=content_hash).exclude(file='').order_by('id').first()
+    if stored is not None and stored.file.storage.exists(stored.file.name):
+        return UploadedFile.objects.create(
+            file=stored.file.name,
+            original_filename=uploaded.name,
+            content_hash=content_hash
+        )
+    return UploadedFile.objects.create(
+        file=uploaded,
+        original_filename=uploaded.name,
+        content_hash=content_hash
+    )
+
+
+def parsed_cache_dir() -> str:
+    """Return the directory of the parsed upload cache, MEDIA_ROOT/parsed_uploads unless configured."""
+    return settings.RECONCILIATION_PARSED_CACHE_DIR or os.path.join(settings.MEDIA_ROOT, 'parsed_uploads')
+
+
+def parsed_cache_path(content_hash: str, options: dict) -> str:
+    """The cached copy depends on the content and on every option that changes how it is parsed and normalized."""
+    options_key = hashlib.sha256(json.dumps(options, sort_keys=True).encode()).hexdigest()[:16]
+    return os.path.join(parsed_cache_dir(), f"{content_hash}_{options_key}.pkl")
+
+
+# One lock per parsed copy being built, with the number of threads using it, so that pairs sharing a file parse it once
+_parse_locks: Dict[str, tuple[threading.Lock, int]] = {}
+_parse_locks_guard = threading.Lock()
+
+
+@contextmanager
+def _parse_lock(path: str) -> Iterator[None]:
+    """Hold the lock of a parsed copy while it is looked up in the cache or built, dropping it once unused."""
+    with _parse_locks_guard:
+        lock, users = _parse_locks.get(path, (None, 0))
+        lock = lock or threading.Lock()
+        _parse_locks[path] = (lock, users + 1)
+    try:
+        with lock:
+            yield
+    finally:
+        with _parse_locks_guard:
+            lock, users = _parse_locks[path]
+            if users == 1:
+                del _parse_locks[path]
+            else:
+                _parse_locks[path] = (lock, users - 1)
+
+
+def file_format_of(file_instance: UploadedFile) -> str:
+    """Return the input format of an upload from its original filename, CSV when it has no known extension."""
+    return input_format(file_instance.original_filename or file_instance.file.name) or CSV_FORMAT
+
+
+def compression_of(file_instance: UploadedFile) -> Optional[str]:
+    """Return the compression of an upload from its original filename."""
+    return input_compression(file_instance.original_filename or file_instance.file.name)
+
+
+def reconciled_columns(
+    source_file_instance: UploadedFile,
+    target_file_instance: UploadedFile,
+    key_columns: List[str],
+    ignore_columns: Optional[List[str]] = None,
+    ignore_case: bool = True,
+    strip_whitespace: bool = True
+) -> List[str]:
+    """
+    _Return the normalized names of the columns a reconciliation of two uploads uses: the key_columns (join, amount
+     and date columns), even when ignored, and the other columns found in both files, which are compared.
+    _Columns only one file has are never compared, so they are left out of the read. Only the headers of the files
+     are read to find them.
+    """
+    source_columns, target_columns = [
+        {normalized_column(col, ignore_case, strip_whitespace)
+         for col in input_columns(file_instance.file.path, file_format_of(file_instance), compression_of(file_instance))}
+        for file_instance in (source_file_instance, target_file_instance)
+    ]
+    shared = (source_columns & target_columns) - set(ignore_columns or [])
+    return sorted(shared | set(key_columns))
+
+
+def load_prepared_dataframe(
+    file_instance: UploadedFile,
+    required_columns: List[str],
+    numeric_columns: List[str],
+    date_format: Optional[str] = None,
+    ignore_case: bool = True,
+    strip_whitespace: bool = True,
+    ignore_columns: Optional[List[str]] = None,
+    date_columns: Optional[List[str]] = None,
+    string_storage: str = 'object',
+    schema: Optional[dict] = None,
+    include_columns: Optional[List[str]] = None
+) -> pd.DataFrame:
+    """
+    _Read, validate, coerce and normalize an uploaded file, reusing the cached result for known content.
+    _With include_columns, normalized names such as the ones reconciled_columns picks, columnar files only load those
+     columns. CSV files are always parsed whole, so their records keep the columns only one file has.
+    _With a schema, only the declared columns are read, in their declared types, and the counts of values that failed
+     to convert are kept in the frame's attrs as coercion_failures.
+    _The normalized frame is cached as a pickle, which keeps its columns and dtypes as they are in memory and loads
+     without parsing any text.
+    """
+    file_format = file_format_of(file_instance)
+    projection = include_columns if file_format in COLUMNAR_FORMATS and schema is None else None
+
+    def read():
+        path, compression = file_instance.file.path, compression_of(file_instance)
+        if schema is None:
+            with timed('parse'):
+                dataframe = read_input(path, file_format, None, ignore_case, strip_whitespace, compression,
+                                       projection)
+            return prepare_dataframe(dataframe, required_columns, numeric_columns, date_format, ignore_case,
+                                     strip_whitespace, date_columns, string_storage)
+
+        if file_format == CSV_FORMAT:
+            dataframe, failures = read_csv_with_schema(path, schema, compression, ignore_case, strip_whitespace,
+                                                       settings.RECONCILIATION_CSV_ENGINE, date_format)
+        else:
+            declared = [col.lower() if ignore_case else col for col in schema['columns']]
+            declared = [col.strip() for col in declared] if strip_whitespace else declared
+            with timed('parse'):
+                dataframe = read_input(path, file_format, None, ignore_case, strip_whitespace, include_columns=declared)
+            columns = resolve_columns(dataframe.columns.tolist(), schema, ignore_case, strip_whitespace)
+            with timed('numeric_coercion'):
+                failures = coerce_columns(dataframe, columns, schema['date_format'] or date_format)
+        # The schema already parsed the dates, so normalization leaves them alone
+        dataframe = prepare_dataframe(dataframe, required_columns, numeric_columns, None, ignore_case,
+                                      strip_whitespace, None, string_storage)
+        dataframe.attrs['coercion_failures'] = failures
+        return dataframe
+
+    if not file_instance.content_hash:
+        return read()
+
+    options = {
+        'required_columns': required_columns,
+        'numeric_columns': numeric_columns,
+        'date_format': date_format,
+        'ignore_case': ignore_case,
+        'strip_whitespace': strip_whitespace,
+        'date_columns': date_columns,
+        'string_storage': string_storage,
+    }
+    if schema is not None:
+        options['schema'] = schema
+    if projection:
+        # Only columnar files are projected, so CSV files share one cached copy whatever columns are compared
+        options['include_columns'] = sorted(projection)
+    path = parsed_cache_path(file_instance.content_hash, options)
+    # Concurrent reconciliations of the same file, such as the pairs of a batch, wait for the first one to parse it
+    with _parse_lock(path):
+        return _load_or_store(path, file_instance, read)
+
+
+def _load_or_store(path: str, file_instance: UploadedFile, read: Callable[[], pd.DataFrame]) -> pd.DataFrame:
+    """Load the parsed copy at path, or read the file and store its parsed copy there."""
+    try:
+        with timed('parsed_cache_load'):
+            dataframe = pd.read_pickle(path)
+        os.utime(path)
+        logger.info(f"Loaded the parsed copy of '{file_instance.original_filename}' from the cache.")
+        return dataframe
+    except FileNotFoundError:
+        pass
+
+    dataframe = read()
+    os.makedirs(parsed_cache_dir(), exist_ok=True)
+    handle, temp_path = tempfile.mkstemp(dir=parsed_cache_dir(), suffix='.tmp')
+    os.close(handle)
+    try:
+        with timed('parsed_cache_store'):
+            dataframe.to_pickle(temp_path)
+        os.replace(temp_path, path)
+    except Exception:
+        os.unlink(temp_path)
+        raise
+    evict_least_recently_used(parsed_cache_dir(), settings.RECONCILIATION_PARSED_CACHE_MAX_MB * 1024 * 1024, keep=path)
+    return dataframe
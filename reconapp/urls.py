@@ -1,5 +1,6 @@
 from django.urls import path
-from .views import FileUploadAndReconcileView, ReconciliationReportDetailView,ReconiliationReportListView
+from .async_views import AsyncFileUploadAndReconcileView, AsyncReconciliationReportDetailView
+from .views import FileUploadAndReconcileView, ReconciliationReportDetailView,ReconiliationReportListView, ReconciliationJobDetailView, ReconciliationSchemaListView, ReconciliationMetricsView, ReconciliationBatchView, ReconciliationBatchDetailView
 
 
 urlpatterns = [
@@ -12,4 +13,21 @@ urlpatterns = [
     # This is the endpoint for retrieving all reconciliation reports
     path('reports', ReconiliationReportListView.as_view(), name='reportlist'),
 
+    # These are the async variants of the reconcile and report endpoints, for ASGI servers
+    path('async/reconcile/', AsyncFileUploadAndReconcileView.as_view(), name='reconcile-async'),
+    path('async/reports/<int:id>', AsyncReconciliationReportDetailView.as_view(), name='reconciliation-report-detail-async'),
+
+    # This is the endpoint for polling the status of a background reconciliation job
+    path('jobs/<int:id>', ReconciliationJobDetailView.as_view(), name='reconciliation-job-detail'),
+
+    # These are the endpoints for reconciling many file pairs in one request and polling the batch
+    path('batches', ReconciliationBatchView.as_view(), name='reconciliation-batch'),
+    path('batches/<int:id>', ReconciliationBatchDetailView.as_view(), name='reconciliation-batch-detail'),
+
+    # This is the endpoint for listing and saving the schemas uploads can be parsed with
+    path('schemas', ReconciliationSchemaListView.as_view(), name='reconciliation-schema-list'),
+
+    # This is the endpoint for the per-stage timing and memory metrics of the latest reconciliations
+    path('metrics', ReconciliationMetricsView.as_view(), name='reconciliation-metrics'),
+
 ]
\ No newline at end of file
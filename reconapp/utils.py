@@ -1,20 +1,108 @@
 import pandas as pd
+import numpy as np
 import logging
 import io
+import os
+import threading
+import csv
+import html
+import itertools
+from concurrent.futures import ProcessPoolExecutor
 from bs4 import BeautifulSoup # type: ignore
-from typing import Union, List, Dict, Optional, Any
+from typing import Union, List, Dict, Optional, Any, Iterable, Iterator
+
+from .metrics import timed
 
 logger = logging.getLogger(__name__)
 
+# Storage for the normalized text columns: 'object' (Python strings), 'category' or 'pyarrow'
+STRING_STORAGES = ['object', 'category', 'pyarrow']
+# A text column is stored as a categorical when it has at most this many distinct values per row
+CATEGORY_MAX_UNIQUE_RATIO = 0.5
+
+
+def _take(values: np.ndarray, codes: np.ndarray, na_value: Any) -> np.ndarray:
+    """Expand the values of the distinct entries back to every row, using na_value for the missing ones (-1)."""
+    return np.append(values, np.array([na_value], dtype=values.dtype)).take(codes)
+
+
+def _parse_dates(values: pd.Series, date_fmt: str, declared: bool) -> Optional[pd.Series]:
+    """Parse distinct text values as dates, or return None for an undeclared column where some value is not a date."""
+    parsed = pd.to_datetime(values, format=date_fmt, errors='coerce')
+    if declared or (values.notna().any() and (parsed.notna() | values.isna()).all()):
+        return parsed
+    return None
+
+
+def _normalize_text(
+    values: pd.Series,
+    ignore_case: bool,
+    strip_whitespace: bool,
+    date_fmt: Optional[str],
+    date_column: Optional[bool],
+    string_storage: str
+) -> pd.Series:
+    """
+    _Normalize one text column and store it with the requested string storage.
+    _The column is factorized first, so the string operations and date parsing run once per distinct value instead
+     of once per row. date_column is True for declared date columns, None when the column is a date column only if
+     every value matches date_fmt, and False when it is never parsed.
+    """
+    if string_storage == 'pyarrow':
+        text = values.astype('string[pyarrow]')
+        if strip_whitespace:
+            text = text.str.strip()
+        if ignore_case:
+            text = text.str.lower()
+        if date_fmt and date_column is not False:
+            uniques = pd.Series(text.dropna().unique(), dtype=object)
+            if _parse_dates(uniques, date_fmt, bool(date_column)) is not None:
+                return pd.to_datetime(text, format=date_fmt, errors='coerce')
+        return text
+
+    codes, uniques = pd.factorize(values)
+    normalized = pd.Series(uniques, dtype=object)
+    if strip_whitespace:
+        normalized = normalized.str.strip()
+    if ignore_case:
+        normalized = normalized.str.lower()
+
+    if date_fmt and date_column is not False:
+        parsed = _parse_dates(normalized, date_fmt, bool(date_column))
+        if parsed is not None:
+            return pd.Series(_take(parsed.to_numpy(), codes, np.datetime64('NaT')), index=values.index)
+
+    if string_storage == 'category':
+        # Distinct values can become equal once normalized, so the categories are factorized again
+        category_codes, categories = pd.factorize(normalized)
+        if len(categories) <= CATEGORY_MAX_UNIQUE_RATIO * len(values):
+            return pd.Series(
+                pd.Categorical.from_codes(_take(category_codes, codes, -1), categories=categories),
+                index=values.index
+            )
+    return pd.Series(_take(normalized.to_numpy(dtype=object), codes, np.nan), index=values.index)
+
+
 def normalize_dataframe(
     dataframe: pd.DataFrame,
     date_fmt: Optional[str] = None,
     ignore_case: bool = True,
     strip_whitespace: bool = True,
-    fill_na_value: Optional[Any] = None
+    fill_na_value: Optional[Any] = None,
+    date_columns: Optional[List[str]] = None,
+    string_storage: str = 'object',
+    inplace: bool = False
 ) -> pd.DataFrame:
-    """Normalize a pandas DataFrame, including column names."""
-    df = dataframe.copy()
+    """
+    _Normalize a pandas DataFrame, including column names.
+    _With a date_fmt, the date_columns are parsed as dates. Without declared date_columns, a text column is parsed
+     only when all of its values match date_fmt, so free-text columns are left alone.
+    _Text columns are stored as Python strings, as categoricals when they are repetitive, or as pyarrow strings,
+     depending on string_storage. With inplace the frame is normalized without copying it first.
+    """
+    if string_storage not in STRING_STORAGES:
+        raise ValueError(f"Unknown string storage '{string_storage}'. Expected one of: {', '.join(STRING_STORAGES)}")
+    df = dataframe if inplace else dataframe.copy()
 
     # Normalize column names
     if ignore_case:
@@ -22,24 +110,98 @@ def normalize_dataframe(
     if strip_whitespace:
         df.columns = [col.strip() for col in df.columns]
 
-    # Normalize data within object columns
-    for column in df.select_dtypes(include='object').columns:
-        if strip_whitespace:
-            df[column] = df[column].str.strip()
-        if ignore_case:
-            df[column] = df[column].str.lower()
+    declared = None
+    if date_columns:
+        declared = [col.lower() if ignore_case else col for col in date_columns]
+        declared = {col.strip() for col in declared} if strip_whitespace else set(declared)
 
-        if date_fmt:
-            try:
-                df[column] = pd.to_datetime(df[column], format=date_fmt, errors='coerce')
-            except Exception as e:
-                logger.warning(f"Date conversion failed for column '{column}': {e}")
+    # Normalize data within text columns
+    for column in df.select_dtypes(include=['object', 'string', 'category']).columns:
+        date_column = None if declared is None else column in declared
+        try:
+            df[column] = _normalize_text(df[column], ignore_case, strip_whitespace, date_fmt, date_column, string_storage)
+        except Exception as e:
+            logger.warning(f"Normalization failed for column '{column}': {e}")
 
     if fill_na_value is not None:
         df = df.fillna(fill_na_value)
 
     return df
 
+def scan_date_columns(dataframe: pd.DataFrame, date_fmt: str, seen: set, rejected: set) -> None:
+    """
+    _Record the text columns of a frame that hold values in seen, and the ones holding a value that is not a date in
+     date_fmt in rejected.
+    _Scanning every input, or every chunk of them, before detect_date_columns makes one decision for all of them.
+    """
+    for column in dataframe.select_dtypes(include=['object', 'string', 'category']).columns:
+        uniques = pd.Series(_comparable(dataframe[column]).dropna().unique(), dtype=object)
+        if uniques.empty:
+            continue
+        seen.add(column)
+        if column not in rejected and _parse_dates(uniques, date_fmt, False) is None:
+            rejected.add(column)
+
+
+def detect_date_columns(dataframes: Iterable[pd.DataFrame], date_fmt: str) -> List[str]:
+    """
+    _Return the text columns where every value of every frame is a date in date_fmt.
+    _Both inputs of a reconciliation are scanned together, so a column is a date column on both sides or on neither,
+     and a single value that is not a date (such as 'pending') leaves it as text everywhere.
+    """
+    seen, rejected = set(), set()
+    for dataframe in dataframes:
+        scan_date_columns(dataframe, date_fmt, seen, rejected)
+    return sorted(seen - rejected)
+
+
+def parse_date_columns(dataframe: pd.DataFrame, date_columns: List[str], date_fmt: str) -> pd.DataFrame:
+    """Parse the given text columns of a frame as dates in place, once per distinct value."""
+    for column in date_columns:
+        if column in dataframe.columns:
+            codes, uniques = pd.factorize(_comparable(dataframe[column]))
+            parsed = pd.to_datetime(pd.Series(uniques, dtype=object), format=date_fmt, errors='coerce')
+            dataframe[column] = pd.Series(_take(parsed.to_numpy(), codes, np.datetime64('NaT')), index=dataframe.index)
+    return dataframe
+
+
+def validate_file_columns(df: pd.DataFrame, required_columns: List[str]):
+    """Validates if a DataFrame contains all the required columns (case-insensitive)."""
+    df_lower_columns = {col.lower() for col in df.columns}
+    missing_columns = []
+    for req_col in required_columns:
+        found = False
+        for df_col_lower in df_lower_columns:
+            if req_col.lower() == df_col_lower:
+                found = True
+                break
+        if not found:
+            missing_columns.append(req_col)
+    if missing_columns:
+        raise ValueError(f"Missing required columns (case-insensitive): {', '.join(missing_columns)}")
+
+def prepare_dataframe(
+    dataframe: pd.DataFrame,
+    required_columns: List[str],
+    numeric_columns: List[str],
+    date_fmt: Optional[str] = None,
+    ignore_case: bool = True,
+    strip_whitespace: bool = True,
+    date_columns: Optional[List[str]] = None,
+    string_storage: str = 'object'
+) -> pd.DataFrame:
+    """Validate the required columns, coerce the amount columns to numbers and normalize a raw upload in place."""
+    validate_file_columns(dataframe, required_columns)
+    with timed('numeric_coercion'):
+        for col in numeric_columns:
+            if col in dataframe.columns:
+                dataframe[col] = pd.to_numeric(dataframe[col], errors='coerce')
+            else:
+                logger.warning(f"Column '{col}' not found for numeric conversion.")
+    with timed('normalization'):
+        return normalize_dataframe(dataframe, date_fmt, ignore_case, strip_whitespace,
+                                   date_columns=date_columns, string_storage=string_storage, inplace=True)
+
 def safe_dataframe(data: Union[pd.DataFrame, List[Dict], Dict, None]) -> pd.DataFrame:
     """Convert data safely to a DataFrame."""
     if isinstance(data, pd.DataFrame):
@@ -109,6 +271,482 @@ class ReportFormatter:
             return f"<p>Error generating HTML: {e}</p>"
 
 
+class _EchoBuffer:
+    """A file-like object whose write returns the text, so csv.writer can format a row without buffering it."""
+    def write(self, value: str) -> str:
+        return value
+
+
+class StreamingReportFormatter:
+    """
+        _This is the streaming counterpart of ReportFormatter._
+        _Each section is a title, its column names and an iterable of records. The records are formatted one at a
+         time as they are pulled from the iterable, so memory stays flat however large the report is.
+    """
+    def __init__(self, sections: List[tuple[str, List[str], Iterable[dict]]]):
+        self.sections = sections
+
+    def iter_csv(self) -> Iterator[str]:
+        """Yield the CSV report row by row: a Section column followed by the columns of every section."""
+        columns = ["Section"]
+        for _, section_columns, _ in self.sections:
+            columns.extend(col for col in section_columns if col not in columns)
+        writer = csv.writer(_EchoBuffer(), lineterminator='\n')
+        yield writer.writerow(columns)
+        for title, _, records in self.sections:
+            for record in records:
+                yield writer.writerow([title] + [_csv_value(record.get(col)) for col in columns[1:]])
+
+    def iter_html(self) -> Iterator[str]:
+        """Yield the HTML report section by section and row by row, one table per non-empty section."""
+        for title, columns, records in self.sections:
+            records = iter(records)
+            first = next(records, None)
+            if first is None:
+                continue
+            yield f"<h3>{html.escape(title)}</h3>\n<table border=\"1\" class=\"dataframe\">\n<thead>\n<tr>"
+            yield "".join(f"<th>{html.escape(str(col))}</th>" for col in columns)
+            yield "</tr>\n</thead>\n<tbody>\n"
+            for record in itertools.chain([first], records):
+                cells = "".join(f"<td>{html.escape(_html_value(record.get(col)))}</td>" for col in columns)
+                yield f"<tr>{cells}</tr>\n"
+            yield "</tbody>\n</table>\n"
+
+
+def _csv_value(value: Any) -> Any:
+    return "" if value is None else value
+
+
+def _html_value(value: Any) -> str:
+    return "None" if value is None else str(value)
+
+
+DEBIT_CREDIT_MISMATCHES = (
+    "Source is Debit, Target is not Credit",
+    "Source is Credit, Target is not Debit",
+    "Source has no amount, Target has amount",
+    "Source has amount, Target has no amount",
+)
+
+
+def _column_or_default(frame: pd.DataFrame, column: str, default: Any) -> pd.Series:
+    """Return a column of the merged frame, or a constant series if it is absent."""
+    if column in frame.columns:
+        return frame[column]
+    return pd.Series(default, index=frame.index)
+
+
+def _comparable(values: pd.Series) -> pd.Series:
+    """Return text stored as categoricals or pyarrow strings as Python strings, so it compares like object columns."""
+    if isinstance(values.dtype, (pd.CategoricalDtype, pd.StringDtype)):
+        return pd.Series(values.to_numpy(dtype=object, na_value=np.nan), index=values.index)
+    return values
+
+
+def json_values(values: pd.Series) -> pd.Series:
+    """
+    _Prepare one column for JSON, for the whole column at once instead of value by value.
+    _inf becomes missing, timestamps become ISO strings and every missing value (NaN, NaT, pd.NA) becomes None.
+     Numeric columns without missing values keep their dtype, so they convert straight to Python numbers.
+    """
+    if pd.api.types.is_float_dtype(values.dtype):
+        values = values.where(np.isfinite(values.to_numpy(dtype=float, na_value=np.nan)))
+    elif pd.api.types.is_datetime64_dtype(values.dtype):
+        present = values.notna().to_numpy()
+        stamps = values.to_numpy()
+        if (stamps[present].astype('int64') % 10**9 == 0).all():
+            iso = np.datetime_as_string(stamps, unit='s')
+        else:
+            # Sub-second timestamps keep the precision isoformat gives each of them
+            iso = np.array([stamp.isoformat() for stamp in values], dtype=object)
+        values = pd.Series(np.where(present, iso, None), index=values.index, dtype=object)
+    elif isinstance(values.dtype, pd.DatetimeTZDtype):
+        values = pd.Series([None if pd.isna(stamp) else stamp.isoformat() for stamp in values],
+                           index=values.index, dtype=object)
+    missing = values.isna()
+    if missing.any():
+        values = _comparable(values).astype(object).where(~missing.to_numpy(), None)
+    return values
+
+
+def json_records(frame: pd.DataFrame) -> List[dict]:
+    """Convert a frame to records that can be serialized to JSON as they are, cleaning it column by column."""
+    if frame.empty:
+        return frame.to_dict('records')
+    return pd.DataFrame({name: json_values(values) for name, values in frame.items()}, index=frame.index).to_dict('records')
+
+
+def _amount_values(values: List[Any], present: np.ndarray) -> List[Any]:
+    """Convert amount values to plain Python values, using None where no amount is present."""
+    return [value if has_amount else None for value, has_amount in zip(values, present)]
+
+
+def locate_discrepancies(
+    common_records: pd.DataFrame,
+    join_column: str,
+    compare_columns: List[str],
+    debit_column: str = 'debit',
+    credit_column: str = 'credit'
+) -> tuple[np.ndarray, List[dict]]:
+    """
+    _Find debit/credit, amount and other column discrepancies in merged records, and the positions of the differing
+     rows in common_records.
+    _Every check is evaluated for all rows at once as a boolean mask, and a record is only
+     built for the rows where at least one of the masks is set.
+    """
+    if common_records.empty:
+        return np.empty(0, dtype=np.intp), []
+
+    source_debit = _column_or_default(common_records, f"{debit_column}_source", 0.0)
+    source_credit = _column_or_default(common_records, f"{credit_column}_source", 0.0)
+    target_debit = _column_or_default(common_records, f"{debit_column}_target", 0.0)
+    target_credit = _column_or_default(common_records, f"{credit_column}_target", 0.0)
+
+    source_is_debit = (source_debit.notna() & source_debit.ne(0)).to_numpy()
+    source_is_credit = (source_credit.notna() & source_credit.ne(0)).to_numpy()
+    target_is_debit = (target_debit.notna() & target_debit.ne(0)).to_numpy()
+    target_is_credit = (target_credit.notna() & target_credit.ne(0)).to_numpy()
+    source_has_amount = source_is_debit | source_credit.notna().to_numpy()
+    target_has_amount = target_is_debit | target_credit.notna().to_numpy()
+
+    # The four debit/credit classes are mutually exclusive and checked in this order
+    debit_credit_conditions = [
+        source_is_debit & ~target_is_credit,
+        source_is_credit & ~target_is_debit,
+        ~source_is_debit & ~source_is_credit & (target_is_debit | target_is_credit),
+        (source_is_debit | source_is_credit) & ~target_is_debit & ~target_is_credit,
+    ]
+    debit_credit_class = np.select(debit_credit_conditions, range(len(DEBIT_CREDIT_MISMATCHES)), default=-1)
+
+    source_amount = source_debit.where(source_is_debit, source_credit)
+    target_amount = target_debit.where(target_is_debit, target_credit)
+    amount_mismatch = (
+        (source_has_amount & target_has_amount & source_amount.ne(target_amount).to_numpy())
+        | (source_has_amount != target_has_amount)
+    )
+
+    column_masks = {}
+    for col in compare_columns:
+        source_col, target_col = f"{col}_source", f"{col}_target"
+        if source_col in common_records.columns and target_col in common_records.columns:
+            column_masks[col] = _comparable(common_records[source_col]).ne(_comparable(common_records[target_col])).to_numpy()
+
+    any_discrepancy = (debit_credit_class >= 0) | amount_mismatch
+    for mask in column_masks.values():
+        any_discrepancy |= mask
+
+    rows = np.flatnonzero(any_discrepancy)
+    if rows.size == 0:
+        return rows, []
+
+    # Only the differing rows are converted to Python values
+    transaction_numbers = json_values(_comparable(common_records[join_column].iloc[rows])).tolist()
+    debit_credit_class = debit_credit_class[rows]
+    amount_mismatch = amount_mismatch[rows]
+    source_amounts = _amount_values(source_amount.iloc[rows].tolist(), source_has_amount[rows])
+    target_amounts = _amount_values(target_amount.iloc[rows].tolist(), target_has_amount[rows])
+    column_values = {
+        col: (
+            mask[rows],
+            json_values(_comparable(common_records[f"{col}_source"].iloc[rows])).tolist(),
+            json_values(_comparable(common_records[f"{col}_target"].iloc[rows])).tolist(),
+        )
+        for col, mask in column_masks.items()
+    }
+
+    discrepancies = []
+    for i, transaction_number in enumerate(transaction_numbers):
+        discrepancy_details = {}
+        if debit_credit_class[i] >= 0:
+            discrepancy_details["debit_credit_mismatch"] = DEBIT_CREDIT_MISMATCHES[debit_credit_class[i]]
+        if amount_mismatch[i]:
+            discrepancy_details["amount_mismatch"] = {"source": source_amounts[i], "target": target_amounts[i]}
+        for col, (mask, source_values, target_values) in column_values.items():
+            if mask[i]:
+                discrepancy_details.setdefault("other_discrepancies", {})[col] = {
+                    "source": source_values[i], "target": target_values[i]
+                }
+        discrepancies.append({join_column: transaction_number, "discrepancies": discrepancy_details})
+
+    return rows, discrepancies
+
+
+def find_duplicates(
+    source_df: pd.DataFrame,
+    target_df: pd.DataFrame,
+    join_column: str
+) -> List[dict]:
+    """
+    _Find transaction numbers that occur more than once in the source or the target.
+    _Occurrences are counted once per side with a hash-based value count, so the cost does not
+     depend on how many times a key is repeated. Each record also reports the occurrence counts.
+    """
+    source_counts = _comparable(source_df[join_column]).value_counts(sort=False, dropna=False)
+    target_counts = _comparable(target_df[join_column]).value_counts(sort=False, dropna=False)
+
+    source_duplicates = source_counts.index[source_counts.to_numpy() > 1]
+    target_duplicates = target_counts.index[target_counts.to_numpy() > 1]
+    duplicate_keys = source_duplicates.append(target_duplicates[~target_duplicates.isin(source_duplicates)])
+    if duplicate_keys.empty:
+        return []
+
+    source_occurrences = source_counts.reindex(duplicate_keys, fill_value=0).tolist()
+    target_occurrences = target_counts.reindex(duplicate_keys, fill_value=0).tolist()
+
+    discrepancies = []
+    for txn, source_count, target_count in zip(duplicate_keys.tolist(), source_occurrences, target_occurrences):
+        discrepancy_details = {}
+        if source_count > 1:
+            discrepancy_details["duplicate_in_source"] = True
+        if target_count > 1:
+            discrepancy_details["duplicate_in_target"] = True
+        discrepancy_details["occurrences"] = {"source": source_count, "target": target_count}
+        discrepancies.append({join_column: txn, "discrepancies": discrepancy_details})
+
+    return discrepancies
+
+
+def _side_totals(frame: pd.DataFrame, codes: np.ndarray, rows: np.ndarray, column: str, key_count: int) -> np.ndarray:
+    """Add up an amount column per key code over the given rows, counting missing amounts as zero."""
+    values = np.nan_to_num(frame[column].to_numpy(dtype=float, na_value=np.nan)[rows])
+    return np.bincount(codes[rows], weights=values, minlength=key_count)
+
+
+def aggregate_split_keys(
+    source_df: pd.DataFrame,
+    target_df: pd.DataFrame,
+    join_column: str,
+    debit_column: str = 'debit',
+    credit_column: str = 'credit'
+) -> tuple[np.ndarray, np.ndarray, List[dict], np.ndarray, int]:
+    """
+    _Match the keys that occur on both sides with more than one row on at least one of them, such as a target
+     settlement paid by several source entries, on their totals instead of row by row.
+    _The debits and credits of each side are added up per key with a single bincount over the shared key codes, so
+     the cost is linear in the number of rows however many rows share a key, and no row is ever paired with another.
+     As double entry requires, the source debits must add up to the target credits and the source credits to the
+     target debits.
+    _Returns the masks of the source and target rows that are left for row by row reconciliation, an
+     aggregate_mismatch record for every key whose totals differ, their order keys (the label of the first source
+     row of the key) and the number of keys matched on their totals.
+    """
+    codes, uniques = pd.factorize(
+        pd.concat([source_df[join_column], target_df[join_column]], ignore_index=True), use_na_sentinel=False
+    )
+    source_codes, target_codes = codes[:len(source_df)], codes[len(source_df):]
+    source_counts = np.bincount(source_codes, minlength=len(uniques))
+    target_counts = np.bincount(target_codes, minlength=len(uniques))
+    aggregated = (source_counts > 0) & (target_counts > 0) & ((source_counts > 1) | (target_counts > 1))
+    source_rows = np.flatnonzero(aggregated[source_codes])
+    target_rows = np.flatnonzero(aggregated[target_codes])
+    if source_rows.size == 0:
+        return np.ones(len(source_df), dtype=bool), np.ones(len(target_df), dtype=bool), [], np.empty(0, dtype=np.int64), 0
+
+    source_debit = _side_totals(source_df, source_codes, source_rows, debit_column, len(uniques))
+    source_credit = _side_totals(source_df, source_codes, source_rows, credit_column, len(uniques))
+    target_debit = _side_totals(target_df, target_codes, target_rows, debit_column, len(uniques))
+    target_credit = _side_totals(target_df, target_codes, target_rows, credit_column, len(uniques))
+    mismatched = aggregated & ~(
+        np.isclose(source_debit, target_credit, rtol=0, atol=1e-9) & np.isclose(source_credit, target_debit, rtol=0, atol=1e-9)
+    )
+
+    # Keys are reported in the order of the label of their first source row
+    keys, first_rows = np.unique(source_codes[source_rows], return_index=True)
+    first_labels = np.asarray(source_df.index, dtype=np.int64)[source_rows[first_rows]]
+    order = np.argsort(first_labels, kind='stable')
+    keys, first_labels = keys[order], first_labels[order]
+    keep = mismatched[keys]
+    keys, first_labels = keys[keep], first_labels[keep]
+
+    key_values = pd.Index(uniques)[keys].tolist()
+    totals = [np.round(values[keys], 9).tolist() for values in (source_debit, source_credit, target_debit, target_credit)]
+    records = [
+        {join_column: key, "discrepancies": {"aggregate_mismatch": {
+            "source": {"debit": s_debit, "credit": s_credit, "rows": int(s_rows)},
+            "target": {"debit": t_debit, "credit": t_credit, "rows": int(t_rows)},
+        }}}
+        for key, s_debit, s_credit, t_debit, t_credit, s_rows, t_rows in zip(
+            key_values, *totals, source_counts[keys], target_counts[keys]
+        )
+    ]
+    return ~aggregated[source_codes], ~aggregated[target_codes], records, first_labels, int(aggregated.sum())
+
+
+def _suffixed_columns(frame: pd.DataFrame, join_column: str, overlap: set, suffix: str) -> Dict[str, str]:
+    """Map the columns of one side to the names they get in the merged frame."""
+    return {col: f"{col}{suffix}" if col in overlap else col for col in frame.columns if col != join_column}
+
+
+def _unmatched_records(
+    frame: pd.DataFrame,
+    rows: np.ndarray,
+    other: pd.DataFrame,
+    join_column: str,
+    overlap: set,
+    suffixes: tuple[str, str]
+) -> pd.DataFrame:
+    """
+    _Build the records of one side that have no match on the other side.
+    _The layout is the one of a left merge: the side's own columns followed by the other side's columns,
+     which are left empty with the same dtypes a merge would give them.
+    """
+    own = frame.iloc[rows].rename(columns=_suffixed_columns(frame, join_column, overlap, suffixes[0]))
+    empty = other.drop(columns=[join_column]).iloc[:0].reindex(range(len(rows)))
+    empty.columns = list(_suffixed_columns(other, join_column, overlap, suffixes[1]).values())
+    empty.index = own.index
+    return pd.concat([own, empty], axis=1)
+
+
+def split_by_key(
+    source_df: pd.DataFrame,
+    target_df: pd.DataFrame,
+    join_column: str
+) -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """
+    _Split the source and target into records missing in target, records missing in source and common records.
+    _The join keys of both sides are factorized together once, and that shared key index is used for the
+     membership checks and for pairing the common records, instead of running a separate merge for each split.
+    _The common records have the layout of an inner merge with ('_source', '_target') suffixes, and keep the
+     index labels of the source rows they come from, as the missing records do.
+    """
+    codes, uniques = pd.factorize(
+        pd.concat([source_df[join_column], target_df[join_column]], ignore_index=True), use_na_sentinel=False
+    )
+    source_codes, target_codes = codes[:len(source_df)], codes[len(source_df):]
+
+    in_source = np.zeros(len(uniques), dtype=bool)
+    in_source[source_codes] = True
+    in_target = np.zeros(len(uniques), dtype=bool)
+    in_target[target_codes] = True
+    source_matched = in_target[source_codes]
+    target_matched = in_source[target_codes]
+
+    overlap = (set(source_df.columns) & set(target_df.columns)) - {join_column}
+    missing_in_target = _unmatched_records(
+        source_df, np.flatnonzero(~source_matched), target_df, join_column, overlap, ('_source', '_target')
+    )
+    missing_in_source = _unmatched_records(
+        target_df, np.flatnonzero(~target_matched), source_df, join_column, overlap, ('_target', '_source')
+    )
+
+    # Pair every matched source row with its matching target rows, in source order then target order
+    source_rows = np.flatnonzero(source_matched)
+    target_rows = np.flatnonzero(target_matched)
+    order = np.argsort(target_codes[target_rows], kind='stable')
+    sorted_codes = target_codes[target_rows][order]
+    matched_codes = source_codes[source_rows]
+    first = np.searchsorted(sorted_codes, matched_codes, side='left')
+    counts = np.searchsorted(sorted_codes, matched_codes, side='right') - first
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    source_pairs = np.repeat(source_rows, counts)
+    target_pairs = target_rows[order[np.repeat(first, counts) + offsets]]
+
+    common_source = source_df.iloc[source_pairs].rename(
+        columns=_suffixed_columns(source_df, join_column, overlap, '_source')
+    ).reset_index(drop=True)
+    common_target = target_df.drop(columns=[join_column]).iloc[target_pairs].rename(
+        columns=_suffixed_columns(target_df, join_column, overlap, '_target')
+    ).reset_index(drop=True)
+    common_records = pd.concat([common_source, common_target], axis=1)
+    common_records.index = source_df.index[source_pairs]
+
+    return missing_in_target, missing_in_source, common_records
+
+
+# The hashed key column that stands in for the join columns when a reconciliation joins on several of them
+JOIN_KEY_COLUMN = '__join_key__'
+
+
+def reconciliation_columns(
+    source_df: pd.DataFrame,
+    target_df: pd.DataFrame,
+    join_columns: List[str],
+    ignore_columns: Optional[List[str]] = None,
+    debit_column: str = 'debit',
+    credit_column: str = 'credit'
+) -> tuple[str, List[str]]:
+    """
+    _Check the join and amount columns of both frames and return the column to join on with the columns to compare.
+    _A single join column is joined on directly. Several join columns are joined on through JOIN_KEY_COLUMN, see
+     keyed_frame.
+    """
+    if not join_columns:
+        raise ValueError("Join columns (unique transaction number) must be specified.")
+
+    for col in [*join_columns, debit_column, credit_column]:
+        if col not in source_df.columns or col not in target_df.columns:
+            raise ValueError(f"Required column '{col}' not found in both DataFrames after normalization.")
+
+    compare_columns = [
+        col for col in source_df.columns
+        if col not in join_columns and col not in [debit_column, credit_column]
+        and (ignore_columns is None or col not in ignore_columns)
+    ]
+    return (join_columns[0] if len(join_columns) == 1 else JOIN_KEY_COLUMN), compare_columns
+
+
+def join_key_values(frame: pd.DataFrame, join_columns: List[str]) -> pd.Series:
+    """
+    _Return the join key of every row: the join column itself, or a 64-bit hash of the join columns when there are
+     several. Text hashes by value whatever its storage, and numbers are hashed as floats so that an integer column
+     on one side still matches a float column on the other, as it would in a single-column join.
+    """
+    if len(join_columns) == 1:
+        return frame[join_columns[0]]
+    columns = {
+        col: frame[col].astype('float64')
+        if pd.api.types.is_numeric_dtype(frame[col].dtype) and not pd.api.types.is_bool_dtype(frame[col].dtype)
+        else frame[col]
+        for col in join_columns
+    }
+    hashes = pd.util.hash_pandas_object(pd.DataFrame(columns, index=frame.index, copy=False), index=False)
+    return pd.Series(hashes.to_numpy(), index=frame.index, name=JOIN_KEY_COLUMN)
+
+
+def keyed_frame(frame: pd.DataFrame, join_columns: List[str]) -> pd.DataFrame:
+    """
+    _Replace the join columns of a frame with their hashed key, a single column that joins, groups and partitions
+     at the cost of one integer column however many columns make up the key.
+    _The other columns are not copied.
+    """
+    columns = {JOIN_KEY_COLUMN: join_key_values(frame, join_columns)}
+    columns.update((col, values) for col, values in frame.items() if col not in join_columns)
+    return pd.DataFrame(columns, index=frame.index, copy=False)
+
+
+def restore_join_columns(
+    result: tuple[List[dict], List[dict], List[dict], dict],
+    keyed_source: pd.DataFrame,
+    keyed_target: pd.DataFrame,
+    source_df: pd.DataFrame,
+    target_df: pd.DataFrame,
+    join_columns: List[str]
+) -> tuple[List[dict], List[dict], List[dict], dict]:
+    """
+    _Put the values of the join columns back in the records of a reconciliation on a hashed key, first in every
+     record and in place of the key. The keyed frames share the index of the frames they were built from.
+    _The values of a key are read from the first source row that holds it, or from the first target row otherwise,
+     so only the rows of keys that appear in the report are converted.
+    """
+    hashes = np.array(sorted({record[JOIN_KEY_COLUMN] for records in result[:3] for record in records}), dtype=np.uint64)
+    if hashes.size == 0:
+        return result
+    source_rows = _first_positions(keyed_source, JOIN_KEY_COLUMN, hashes.tolist())
+    target_rows = _first_positions(keyed_target, JOIN_KEY_COLUMN, hashes.tolist())
+    in_source = source_rows >= 0
+    key_values = pd.concat([
+        source_df[join_columns].loc[source_rows[in_source]],
+        target_df[join_columns].loc[target_rows[~in_source]],
+    ], ignore_index=True)
+    keys = dict(zip(np.concatenate([hashes[in_source], hashes[~in_source]]).tolist(), json_records(key_values)))
+
+    sections = [
+        [{**keys[record[JOIN_KEY_COLUMN]], **{name: value for name, value in record.items() if name != JOIN_KEY_COLUMN}}
+         for record in records]
+        for records in result[:3]
+    ]
+    return sections[0], sections[1], sections[2], result[3]
+
 
 def reconcile_data(
     source_df: pd.DataFrame,
@@ -116,7 +754,9 @@ def reconcile_data(
     join_columns: List[str],
     ignore_columns: Optional[List[str]] = None,
     debit_column: str = 'debit',  
-    credit_column: str = 'credit'
+    credit_column: str = 'credit',
+    workers: int = 1,
+    aggregate_duplicates: bool = False
 ) -> tuple[List[dict], List[dict], List[dict], dict]:
     """
     _This is the function that does the reconciliation.
@@ -128,104 +768,268 @@ def reconcile_data(
             debit in source,it should be a credit in target and vice versa.
         2: We check for duplicates in both source and target.
         3: We check for any inconsistency of the transaction, be it date, amount, etc in both source and target.
+    _With more than one worker the frames are hash-partitioned on the join column and reconciled in a process pool.
+    _With several join columns, the rows are joined on a hash of them. The records then hold the value of every join
+     column, and the duplicate and discrepancy records identify their key by these values.
+    _With aggregate_duplicates, a key with several rows on either side, like a settlement split into several
+     payments, is matched on its debit and credit totals instead of being flagged as a duplicate, see
+     aggregate_split_keys.
    """
-    if not join_columns:
-        raise ValueError("Join columns (unique transaction number) must be specified.")
-    if len(join_columns) != 1:
-        raise ValueError("Only one join column (unique transaction number) should be specified for this type of reconciliation.")
-    join_column = join_columns[0]
+    result, _ = reconcile_ordered(
+        _positional(source_df), _positional(target_df), join_columns, ignore_columns, debit_column, credit_column,
+        workers, aggregate_duplicates
+    )
+    return result
 
-    for col in [join_column, debit_column, credit_column]:
-        if col not in source_df.columns or col not in target_df.columns:
-            raise ValueError(f"Required column '{col}' not found in both DataFrames after normalization.")
 
-    # Missing in target
-    merged_left = pd.merge(source_df, target_df, on=join_column, how='left', indicator=True, suffixes=('_source', '_target'))
-    missing_in_target_df = merged_left[merged_left['_merge'] == 'left_only'].drop(columns=['_merge'])
-    missing_in_target = missing_in_target_df.to_dict('records')
+def reconcile_ordered(
+    source_df: pd.DataFrame,
+    target_df: pd.DataFrame,
+    join_columns: List[str],
+    ignore_columns: Optional[List[str]] = None,
+    debit_column: str = 'debit',
+    credit_column: str = 'credit',
+    workers: int = 1,
+    aggregate_duplicates: bool = False
+) -> tuple[tuple[List[dict], List[dict], List[dict], dict], tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    _This is reconcile_data for frames indexed by the position of their rows in the whole files, such as the
+     buckets of a streaming run, where positions are not contiguous.
+    _It also returns the order key of every record, as reconcile_partition does, so the results of disjoint key
+     partitions can be merged back in the order of the files.
+    """
+    join_column, compare_columns = reconciliation_columns(
+        source_df, target_df, join_columns, ignore_columns, debit_column, credit_column
+    )
+    keyed_source, keyed_target = source_df, target_df
+    if join_column == JOIN_KEY_COLUMN:
+        with timed('key_hashing'):
+            keyed_source, keyed_target = keyed_frame(source_df, join_columns), keyed_frame(target_df, join_columns)
+
+    if workers > 1:
+        # The stages run in the worker processes, so the pool is timed as a whole
+        with timed('parallel_reconcile'):
+            result, order = reconcile_data_parallel(
+                keyed_source, keyed_target, join_column, compare_columns, debit_column, credit_column, workers,
+                aggregate_duplicates
+            )
+    else:
+        result, order = reconcile_partition(
+            keyed_source, keyed_target, join_column, compare_columns, debit_column, credit_column, aggregate_duplicates
+        )
 
+    if join_column == JOIN_KEY_COLUMN:
+        result = restore_join_columns(result, keyed_source, keyed_target, source_df, target_df, join_columns)
+    return result, order
 
-    #Missing in source
-    merged_right = pd.merge(target_df, source_df, on=join_column, how='left', indicator=True, suffixes=('_target', '_source'))
-    missing_in_source_df = merged_right[merged_right['_merge'] == 'left_only'].drop(columns=['_merge'])
-    missing_in_source = missing_in_source_df.to_dict('records')
 
-    common_records = pd.merge(source_df, target_df, on=join_columns, suffixes=('_source', '_target'))
-    discrepancies = []
+def reconcile_partition(
+    source_df: pd.DataFrame,
+    target_df: pd.DataFrame,
+    join_column: str,
+    compare_columns: List[str],
+    debit_column: str = 'debit',
+    credit_column: str = 'credit',
+    aggregate_duplicates: bool = False
+) -> tuple[tuple[List[dict], List[dict], List[dict], dict], tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    _Reconcile a source and a target that have been validated by reconcile_data.
+    _Besides the usual result, this returns an order key for every missing and discrepancy record, built
+     from the positional index labels of the rows they come from. The keys give the position each record
+     has in a serial run, which is what lets partitioned results be merged back in the same order.
+    _With aggregate_duplicates, the keys with several rows on either side are matched on their totals by
+     aggregate_split_keys, and only the other rows are reconciled row by row.
+    """
+    aggregate_records, aggregate_order, aggregated_count = [], np.empty(0, dtype=np.int64), 0
+    if aggregate_duplicates:
+        with timed('aggregation'):
+            source_rest, target_rest, aggregate_records, aggregate_order, aggregated_count = aggregate_split_keys(
+                source_df, target_df, join_column, debit_column, credit_column
+            )
+        if aggregated_count:
+            source_df, target_df = source_df[source_rest], target_df[target_rest]
+
+    # Split both sides into missing and common records using one shared key index
+    with timed('merge'):
+        missing_in_target_df, missing_in_source_df, common_records = split_by_key(source_df, target_df, join_column)
+
+    with timed('serialization'):
+        # Missing in target, cleaned for JSON column by column
+        missing_in_target = json_records(missing_in_target_df)
+
+        #Missing in source
+        missing_in_source = json_records(missing_in_source_df)
+
     # Identify duplicate transaction numbers within each DataFrame
-    source_duplicates = source_df[source_df.duplicated(subset=join_columns, keep=False)][join_columns[0]].tolist()
-    target_duplicates = target_df[target_df.duplicated(subset=join_columns, keep=False)][join_columns[0]].tolist()
+    with timed('duplicate_detection'):
+        duplicates = find_duplicates(source_df, target_df, join_column)
+    discrepancies = aggregate_records + duplicates
+
+    # Check debit/credit, amount and other columns for every matched record
+    with timed('discrepancy_scan'):
+        rows, row_discrepancies = locate_discrepancies(
+            common_records, join_column, compare_columns, debit_column, credit_column
+        )
+    discrepancies.extend(row_discrepancies)
 
-    # Add duplicate transaction numbers as a discrepancy
-    for txn in set(source_duplicates + target_duplicates):
-        discrepancy_record = {join_columns[0]: txn}
-        discrepancy_details = {}
-        if txn in source_duplicates:
-            discrepancy_details["duplicate_in_source"] = True
-        if txn in target_duplicates:
-            discrepancy_details["duplicate_in_target"] = True
-        discrepancy_record["discrepancies"] = discrepancy_details
-        discrepancies.append(discrepancy_record)
-        for _, row in common_records.iterrows():
-            transaction_number = row[join_columns[0]]
-            discrepancy_details = {}
-            is_discrepancy = False
-
-        source_debit = row.get(f"{debit_column}_source", 0.0)
-        source_credit = row.get(f"{credit_column}_source", 0.0)
-        target_debit = row.get(f"{debit_column}_target", 0.0)
-        target_credit = row.get(f"{credit_column}_target", 0.0)
-
-        source_amount = source_debit if pd.notna(source_debit) and source_debit != 0 else source_credit if pd.notna(source_credit) else None
-        target_amount = target_debit if pd.notna(target_debit) and target_debit != 0 else target_credit if pd.notna(target_credit) else None
-
-        source_is_debit = pd.notna(source_debit) and source_debit != 0
-        source_is_credit = pd.notna(source_credit) and source_credit != 0
-        target_is_debit = pd.notna(target_debit) and target_debit != 0
-        target_is_credit = pd.notna(target_credit) and target_credit != 0
-
-        # Check Debit/Credit rule
-        if source_is_debit and not target_is_credit:
-            discrepancy_details["debit_credit_mismatch"] = "Source is Debit, Target is not Credit"
-            is_discrepancy = True
-        elif source_is_credit and not target_is_debit:
-            discrepancy_details["debit_credit_mismatch"] = "Source is Credit, Target is not Debit"
-            is_discrepancy = True
-        elif not source_is_debit and not source_is_credit and (target_is_debit or target_is_credit):
-            discrepancy_details["debit_credit_mismatch"] = "Source has no amount, Target has amount"
-            is_discrepancy = True
-        elif (source_is_debit or source_is_credit) and not target_is_debit and not target_is_credit:
-            discrepancy_details["debit_credit_mismatch"] = "Source has amount, Target has no amount"
-            is_discrepancy = True
-
-        # Check Amount discrepancy
-        if source_amount is not None and target_amount is not None and source_amount != target_amount:
-            discrepancy_details["amount_mismatch"] = {"source": source_amount, "target": target_amount}
-            is_discrepancy = True
-        elif (source_amount is None and target_amount is not None) or (source_amount is not None and target_amount is None):
-            # This case should ideally be caught by the debit/credit mismatch check,
-            # but adding it for robustness.
-            discrepancy_details["amount_mismatch"] = {"source": source_amount, "target": target_amount}
-            is_discrepancy = True
-
-        # Check for other column discrepancies
-        for col in source_df.columns:
-            if col not in join_columns and col not in [debit_column, credit_column] and (ignore_columns is None or col not in ignore_columns):
-                source_value = row.get(f"{col}_source")
-                target_value = row.get(f"{col}_target")
-                if source_value != target_value:
-                    discrepancy_details.setdefault("other_discrepancies", {})[col] = {"source": source_value, "target": target_value}
-                    is_discrepancy = True
-
-        if is_discrepancy:
-            discrepancy_record = {join_columns[0]: transaction_number}
-            discrepancy_record["discrepancies"] = discrepancy_details
-            discrepancies.append(discrepancy_record)
     summary = {
         'missing_in_target_count': len(missing_in_target),
         'missing_in_source_count': len(missing_in_source),
         'discrepancy_count': len(discrepancies),
+        'duplicate_in_source_count': sum(1 for d in duplicates if d['discrepancies'].get('duplicate_in_source')),
+        'duplicate_in_target_count': sum(1 for d in duplicates if d['discrepancies'].get('duplicate_in_target')),
     }
+    if aggregate_duplicates:
+        summary['aggregated_key_count'] = aggregated_count
+        summary['aggregate_mismatch_count'] = len(aggregate_records)
+
+    # Duplicates come first, source duplicates by first source row, then target-only ones by first target row
+    duplicate_keys = [record[join_column] for record in duplicates]
+    in_source = np.array([bool(record['discrepancies'].get('duplicate_in_source')) for record in duplicates], dtype=bool)
+    source_first = _first_positions(source_df, join_column, duplicate_keys)
+    target_first = _first_positions(target_df, join_column, duplicate_keys) + POSITION_STRIDE
+    discrepancy_order = np.concatenate([
+        aggregate_order,
+        np.where(in_source, source_first, target_first),
+        np.asarray(common_records.index[rows], dtype=np.int64) + 2 * POSITION_STRIDE,
+    ])
+    if aggregate_records and duplicates:
+        # Aggregated keys rank with the source duplicates, by their first source row
+        interleaved = np.argsort(discrepancy_order, kind='stable')
+        discrepancies = [discrepancies[i] for i in interleaved]
+        discrepancy_order = discrepancy_order[interleaved]
+    order = (
+        np.asarray(missing_in_source_df.index, dtype=np.int64),
+        np.asarray(missing_in_target_df.index, dtype=np.int64),
+        discrepancy_order,
+    )
+
+    # A missing join key is reported as None, once the keys are no longer needed for ordering
+    for record in aggregate_records + duplicates:
+        if pd.isna(record[join_column]):
+            record[join_column] = None
+
+    return (missing_in_source, missing_in_target, discrepancies, summary), order
+
+
+# Offset separating the order keys of source duplicates, target duplicates and matched rows
+POSITION_STRIDE = 1 << 40
+
+
+def _first_positions(frame: pd.DataFrame, join_column: str, keys: List[Any]) -> np.ndarray:
+    """Return the index label of the first row holding each key, or -1 when the key is absent."""
+    if not keys:
+        return np.empty(0, dtype=np.int64)
+    firsts = _comparable(frame[join_column]).drop_duplicates()
+    located = pd.Index(firsts.to_numpy()).get_indexer(keys)
+    labels = np.asarray(firsts.index, dtype=np.int64)
+    return np.where(located >= 0, labels[located], -1)
 
-    return missing_in_source, missing_in_target, discrepancies, summary
-    
\ No newline at end of file
+
+def bucket_of(keys: pd.Series, bucket_count: int) -> pd.Series:
+    """
+    _Assign each join key to a bucket with a stable hash, so equal keys always share a bucket.
+    _Text is hashed as Python strings whatever its storage, and numbers as floats, the way join_key_values hashes
+     them, so an integer key on one side and the same key read as a float on the other (a column with a blank
+     reference) land in the same bucket.
+    """
+    if pd.api.types.is_numeric_dtype(keys.dtype) and not pd.api.types.is_bool_dtype(keys.dtype):
+        keys = keys.astype('float64')
+    return pd.Series(
+        pd.util.hash_pandas_object(_comparable(keys), index=False).to_numpy() % bucket_count,
+        index=keys.index
+    )
+
+
+def _positional(frame: pd.DataFrame) -> pd.DataFrame:
+    """Make sure the frame is indexed by row position, which the order keys are built from."""
+    if isinstance(frame.index, pd.RangeIndex) and frame.index.start == 0 and frame.index.step == 1:
+        return frame
+    return frame.reset_index(drop=True)
+
+
+def _split_by_bucket(frame: pd.DataFrame, buckets: np.ndarray, bucket_count: int) -> List[pd.DataFrame]:
+    """Split a frame into one part per bucket, keeping the original row order within each part."""
+    order = np.argsort(buckets, kind='stable')
+    bounds = np.searchsorted(buckets[order], np.arange(bucket_count + 1))
+    return [frame.iloc[order[bounds[i]:bounds[i + 1]]] for i in range(bucket_count)]
+
+
+def reconcile_data_parallel(
+    source_df: pd.DataFrame,
+    target_df: pd.DataFrame,
+    join_column: str,
+    compare_columns: List[str],
+    debit_column: str,
+    credit_column: str,
+    workers: int,
+    aggregate_duplicates: bool = False
+) -> tuple[tuple[List[dict], List[dict], List[dict], dict], tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    _This is the multi-core mode of reconcile_ordered, which returns the order keys along with the result.
+    _Both frames are hash-partitioned on the join column with bucket_of, which hashes integer and float keys alike,
+     so every key lands in exactly one partition whatever dtype each side read it as, and each partition is reconciled by reconcile_partition in a process pool worker.
+    _The partial lists are put back in serial order with merge_partitions, so the result is identical to the
+     serial path.
+    """
+    source_parts = _split_by_bucket(source_df, bucket_of(source_df[join_column], workers).to_numpy(), workers)
+    target_parts = _split_by_bucket(target_df, bucket_of(target_df[join_column], workers).to_numpy(), workers)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(reconcile_partition, source_part, target_part, join_column,
+                            compare_columns, debit_column, credit_column, aggregate_duplicates)
+            for source_part, target_part in zip(source_parts, target_parts)
+        ]
+        partials = [future.result() for future in futures]
+    return merge_partitions(partials)
+
+
+def merge_partitions(
+    partials: List[tuple[tuple[List[dict], List[dict], List[dict], dict], tuple[np.ndarray, np.ndarray, np.ndarray]]]
+) -> tuple[tuple[List[dict], List[dict], List[dict], dict], tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    _Combine the results of reconciling disjoint key partitions into a single result, with their order keys.
+    _Every section is put back in the order of its keys, which is the order a serial run gives, and the summary
+     counts are summed.
+    """
+    merged, orders = [], []
+    for section in range(3):
+        records = [record for result, _ in partials for record in result[section]]
+        order = np.concatenate([np.empty(0, dtype=np.int64)] + [partial[section] for _, partial in partials])
+        ranks = np.argsort(order, kind='stable')
+        merged.append([records[i] for i in ranks])
+        orders.append(order[ranks])
+
+    summary = {}
+    for result, _ in partials:
+        for key, value in result[3].items():
+            summary[key] = summary.get(key, 0) + value
+
+    return (merged[0], merged[1], merged[2], summary), tuple(orders)
+
+
+_eviction_lock = threading.Lock()
+
+
+def evict_least_recently_used(directory: str, max_bytes: int, keep: Optional[str] = None):
+    """
+    _Remove the least recently accessed files of a cache directory, except keep, until it fits in max_bytes.
+    _Files still being written (*.tmp) are left alone.
+    """
+    with _eviction_lock:
+        entries = []
+        with os.scandir(directory) as scan:
+            for entry in scan:
+                if entry.is_file() and not entry.name.endswith('.tmp') and entry.path != keep:
+                    stat = entry.stat()
+                    entries.append((stat.st_atime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries) + (os.path.getsize(keep) if keep else 0)
+        for _, size, path in sorted(entries):
+            if total <= max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
@@ -1,21 +1,31 @@
-from typing import List
+from typing import Any, Iterator, List, Optional
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status,viewsets
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework import generics
-from .serializers import FileUploadSerializer, ReconciliationReportSerializer
-from .models import UploadedFile, ReconciliationReport
-from .utils import normalize_dataframe, reconcile_data, ReportFormatter
+from rest_framework.utils.urls import replace_query_param
+from rest_framework.pagination import CursorPagination
+from rest_framework.exceptions import ValidationError
+from .serializers import FileUploadSerializer, ReconciliationReportSerializer, ReconciliationReportListSerializer, ReconciliationJobSerializer, ReconciliationSchemaSerializer, BatchUploadSerializer, ReconciliationBatchSerializer
+from .models import ReconciliationReport, ReconciliationJob, ReconciliationSchema, ReconciliationBatch
+from .services import run_reconciliation, filter_results, results_page, REPORT_SECTIONS
+from .exports import open_export, stream_export, EXPORT_FORMATS
+from .jobs import submit_job
+from .batches import create_batch_from_request
+from .uploads import save_upload
+from .metrics import StageMetrics, timed, summarize
 from django.conf import settings
-from django.http import HttpResponse
-from django.template.loader import render_to_string
+from django.db.models import Prefetch, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.http import HttpResponse, FileResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date
 import pandas as pd
-import math
+import datetime
 import logging
-import json
-import math
-import numpy as np
+import os
 from drf_spectacular.utils import extend_schema # type: ignore
 
 
@@ -23,6 +33,24 @@ logger = logging.getLogger(__name__)
 
 
 
+def reconciliation_options(validated_data: dict) -> dict:
+    """Collect the reconciliation options of a validated upload or batch, as run_reconciliation takes them."""
+    return {
+        'date_format': validated_data.get('date_format'),
+        'ignore_case': validated_data.get('ignore_case', True),
+        'strip_whitespace': validated_data.get('strip_whitespace', True),
+        'ignore_columns': validated_data.get('ignore_columns') or None,
+        'streaming': validated_data.get('streaming', False),
+        'date_columns': validated_data.get('date_columns') or None,
+        'schema': validated_data.get('schema') or None,
+        'join_columns': validated_data.get('join_columns') or None,
+        'amount_tolerance': validated_data.get('amount_tolerance'),
+        'date_window_days': validated_data.get('date_window_days'),
+        'match_date_column': validated_data.get('match_date_column') or None,
+        'aggregate_duplicates': validated_data.get('aggregate_duplicates', False),
+    }
+
+
 class FileUploadAndReconcileView(APIView):
     parser_classes = (MultiPartParser, FormParser)
     @extend_schema(
@@ -33,12 +61,12 @@ class FileUploadAndReconcileView(APIView):
                     'source_file': {
                         'type': 'string',
                         'format': 'binary',
-                        'description': 'The source CSV file to upload.'
+                        'description': 'The source CSV (plain, .gz, .zst or .zip), Parquet, Arrow IPC or Feather file to upload.'
                     },
                     'target_file': {
                         'type': 'string',
                         'format': 'binary',
-                        'description': 'The target CSV file to upload.'
+                        'description': 'The target CSV (plain, .gz, .zst or .zip), Parquet, Arrow IPC or Feather file to upload.'
                     },
                     
                 },
@@ -55,22 +83,50 @@ class FileUploadAndReconcileView(APIView):
     def post(self, request, *args, **kwargs):
         
         """
-        Uploads two CSV files (source and target) and performs reconciliation.
+        Uploads two files (source and target) and performs reconciliation.
 
         Request Data:
-            - source_file: The source CSV file.
-            - target_file: The target CSV file.
+            - source_file: The source CSV (plain, .gz, .zst or .zip), Parquet, Arrow IPC or Feather file.
+            - target_file: The target CSV (plain, .gz, .zst or .zip), Parquet, Arrow IPC or Feather file.
             - ignore_case (optional, default=True): Whether to ignore case in column names.
             - strip_whitespace (optional, default=True): Whether to strip whitespace from column names.
             - ignore_columns (optional): Comma-separated list of columns to ignore during reconciliation.
+            - join_columns (optional, default=Txn RefNo): Comma-separated list of the columns that identify a
+              transaction. Several columns are joined on as one composite key. A saved schema can set them too.
+            - date_columns (optional): Comma-separated list of the columns to parse with date_format. Without it, a
+              column is parsed only when all of its values in both files match date_format.
+            - schema (optional): JSON schema declaring the columns to load, their types (string, float, integer,
+              date) and an optional date_format. The summary then counts the values that failed to convert.
+            - schema_name (optional): Name of a schema saved at /api/schemas, used when no schema is sent.
+            - baseline_report_id (optional): A previous report of the same accounts, reconciled with the same options.
+              Only the keys whose rows changed since then are reconciled again, the result is still the full report.
+            - amount_tolerance (optional): Pair the rows left unmatched by their keys when their amounts differ by at
+              most this much. The pairs are reported as near_match discrepancies.
+            - date_window_days (optional): With match_date_column, also require the dates of a pair to be at most this
+              many days apart. Without amount_tolerance, amounts must then be equal.
+            - match_date_column (optional): The date column compared for near matches.
+            - aggregate_duplicates (optional, default=False): Match keys with several rows on either side (split or
+              batched payments) on their summed debits and credits. Totals that differ are reported as
+              aggregate_mismatch discrepancies.
+            - streaming (optional, default=False): Reconcile out of core in hash-partitioned buckets. Large files
+              that would not fit in RECONCILIATION_MEMORY_BUDGET_MB are always reconciled this way.
+            - run_in_background (optional, default=False): Queue the reconciliation as a job instead of waiting for it.
+
+        Response (when run_in_background is set - status 202):
+            - message: "Reconciliation queued."
+            - job_id: The ID of the job, to poll at /api/jobs/<job_id>.
+            - status: The job status.
 
         Response (on success - status 200):
             - message: "Reconciliation successful."
             - report_id: The ID of the generated reconciliation report.
             - summary: A summary of the reconciliation.
+            - metrics: Time and memory spent in each stage, also stored on the report and aggregated at /api/metrics.
             - missing_in_target: List of records missing in the target file.
             - missing_in_source: List of records missing in the source file.
             - discrepancies: List of identified discrepancies.
+            - delta (with baseline_report_id): The records that were added and resolved since the baseline report,
+              per section, and how many keys were added, removed, modified or reused.
 
         Response (on error - status 400 or 500):
             - error: A description of the error.
@@ -79,105 +135,48 @@ class FileUploadAndReconcileView(APIView):
         if serializer.is_valid():
             source_file_uploaded = serializer.validated_data['source_file']
             target_file_uploaded = serializer.validated_data['target_file']
-            date_format = serializer.validated_data.get('date_format')
-            ignore_case = serializer.validated_data.get('ignore_case', True)
-            strip_whitespace = serializer.validated_data.get('strip_whitespace', True)
-            ignore_columns = [col.strip() for col in serializer.validated_data.get('ignore_columns', '').split(',')] if serializer.validated_data.get('ignore_columns') else None
-
-            required_columns = ['Txn RefNo', 'Debit', 'Credit']
-            join_columns = ['txn refno']  # We have hardcoded the column we will use to join the two data sources
+            options = reconciliation_options(serializer.validated_data)
+            options['baseline_report_id'] = serializer.validated_data.get('baseline_report_id')
+            run_in_background = serializer.validated_data.get('run_in_background', False)
 
             try:
-                # Save uploaded files
-                source_file_instance = UploadedFile.objects.create(
-                    file=source_file_uploaded,
-                    original_filename=source_file_uploaded.name
-                )
-
-                target_file_instance = UploadedFile.objects.create(
-                    file=target_file_uploaded,
-                    original_filename=target_file_uploaded.name
-                )
+                # Save uploaded files, once per content hash
+                metrics = StageMetrics()
+                with metrics.active(), timed('upload_save'):
+                    source_file_instance = save_upload(source_file_uploaded)
+                    target_file_instance = save_upload(target_file_uploaded)
 
-                # Read CSV files into pandas DataFrames
-                source_df = pd.read_csv(source_file_instance.file.path)
-                target_df = pd.read_csv(target_file_instance.file.path)
-
-                logger.info(f"Source DataFrame Columns (Original): {source_df.columns.tolist()}")
-                logger.info(f"Target DataFrame Columns (Original): {target_df.columns.tolist()}")
-
-                # Validate required columns
-                validate_file_columns(source_df, required_columns)
-                validate_file_columns(target_df, required_columns)
-
-                for df in [source_df, target_df]:
-                    for col in ['Debit', 'Credit']:
-                        if col in df.columns:
-                            df[col] = pd.to_numeric(df[col], errors='coerce')
-                            logger.info(f"Successfully converted column '{col}' to numeric with errors='coerce'.")
-                        else:
-                            logger.warning(f"Column '{col}' not found for numeric conversion.")
-                # Data normalization
-                normalized_source_df = normalize_dataframe(source_df.copy(), date_format, ignore_case, strip_whitespace)
-                normalized_target_df = normalize_dataframe(target_df.copy(), date_format, ignore_case, strip_whitespace)
-
-                logger.info(f"Source DataFrame Columns (Normalized): {normalized_source_df.columns.tolist()}")
-                logger.info(f"Target DataFrame Columns (Normalized): {normalized_target_df.columns.tolist()}")
-                logger.info(f"Join Columns (Hardcoded): {join_columns}")
-                logger.info(f"Ignore Columns Received: {ignore_columns}")
-
-                # Perform reconciliation
-                missing_in_source, missing_in_target, discrepancies, summary = reconcile_data(
-                    normalized_source_df,
-                    normalized_target_df,
-                    join_columns=join_columns,
-                    ignore_columns=ignore_columns,
-                    debit_column='debit',
-                    credit_column='credit'
-                )
+                if run_in_background:
+                    # Hand the reconciliation to the local job pool and return straight away
+                    job = ReconciliationJob.objects.create(
+                        source_file=source_file_instance,
+                        target_file=target_file_instance,
+                        options=options,
+                    )
+                    submit_job(job)
+                    return Response({
+                        'message': 'Reconciliation queued.',
+                        'job_id': job.id,
+                        'status': job.status,
+                    }, status=status.HTTP_202_ACCEPTED)
 
-                logger.info(f"Type of missing_in_source: {type(missing_in_source)}")
-                logger.info(f"Content of missing_in_source: {missing_in_source}")
-
-                def clean_floats(obj):
-                    if isinstance(obj, dict):
-                        return {k: clean_floats(v) for k, v in obj.items()}
-                    elif isinstance(obj, list):
-                        return [clean_floats(item) for item in obj]
-                    elif isinstance(obj, float):
-                        if math.isnan(obj) or math.isinf(obj):
-                            return None
-                    elif isinstance(obj, (pd.Timestamp, pd.NaT.__class__)):
-                        if pd.isnull(obj):
-                            return None
-                        return obj.isoformat()  # convert Timestamp to ISO string
-                    elif isinstance(obj, np.generic):
-                        return obj.item()
-                    return obj
-
-                missing_in_source = clean_floats(missing_in_source)
-                missing_in_target = clean_floats(missing_in_target)
-                
-                # Save reconciliation report
-                report = ReconciliationReport.objects.create(
-                    source_file=source_file_instance,
-                    target_file=target_file_instance,
-                    join_columns=','.join(join_columns),
-                    ignore_columns=','.join(ignore_columns) if ignore_columns else None,
-                    summary_json=summary,
-                    missing_in_source_json=json.dumps(missing_in_source),
-                    missing_in_target_json=json.dumps(missing_in_target),
-                    discrepancies_json=discrepancies,
+                # Perform reconciliation and save the report
+                report, missing_in_source, missing_in_target, discrepancies, summary = run_reconciliation(
+                    source_file_instance, target_file_instance, metrics=metrics, **options
                 )
 
-                return Response({
+                response = {
                     'message': 'Reconciliation successful.',
                     'report_id': report.id,
                     'summary': summary,
+                    'metrics': report.metrics_json,
                     'missing_in_target': missing_in_target,
                     'missing_in_source': missing_in_source,
                     'discrepancies': discrepancies,
-                }, status=status.HTTP_200_OK)
+                }
+                if report.delta_json is not None:
+                    response['delta'] = report.delta_json
+                return Response(response, status=status.HTTP_200_OK)
 
             except FileNotFoundError:
                 return Response({'error': 'One or both of the uploaded files could not be found.'}, status=status.HTTP_400_BAD_REQUEST)
@@ -187,15 +186,142 @@ class FileUploadAndReconcileView(APIView):
                 return Response({'error': 'Error parsing one or both of the CSV files. Please ensure they are valid CSV.'}, status=status.HTTP_400_BAD_REQUEST)
             except ValueError as e:
                 return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
-            except Exception as e:
+            except Exception:
                 logger.exception("An unexpected error occurred during reconciliation.")
                 return Response({'error': 'An unexpected error occurred during reconciliation.'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+class ReconciliationBatchView(APIView):
+    parser_classes = (MultiPartParser, FormParser)
+
+    def post(self, request, *args, **kwargs):
+        """
+        Uploads the files of many source/target pairs and reconciles every pair in the background.
+
+        Request Data:
+            - files: The files of every pair, or
+            - archive: A zip archive of the files, with a manifest.json unless the manifest is sent.
+            - manifest: JSON list of the pairs, each naming its "source" and "target" file and optionally its "name"
+              and the "baseline_report_id" it is reconciled incrementally against.
+            - The reconciliation options of /api/reconcile (date_format, join_columns, schema...), shared by all pairs.
+
+        Each file is stored once however many pairs use it, and parsed once per set of options. The pairs run as jobs
+        on the job pool, RECONCILIATION_JOB_WORKERS at a time.
+
+        Response (status 202):
+            - batch_id: The ID of the batch, to poll at /api/batches/<batch_id>.
+            - status: The batch status.
+            - pairs: The job of every pair.
+        """
+        serializer = BatchUploadSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            batch = create_batch_from_request(
+                serializer.validated_data.get('files'),
+                serializer.validated_data.get('archive'),
+                serializer.validated_data.get('manifest') or None,
+                reconciliation_options(serializer.validated_data),
+            )
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception:
+            logger.exception("An unexpected error occurred while creating a reconciliation batch.")
+            return Response({'error': 'An unexpected error occurred while creating the batch.'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        batch = ReconciliationBatchDetailView.queryset.get(id=batch.id)
+        return Response(ReconciliationBatchSerializer(batch).data, status=status.HTTP_202_ACCEPTED)
+
+class ReconciliationBatchDetailView(generics.RetrieveAPIView):
+    """Reports the status of a batch, the job and report of each of its pairs and the summary rolled up over them."""
+    queryset = ReconciliationBatch.objects.prefetch_related(
+        Prefetch('jobs', queryset=ReconciliationJob.objects.select_related('report').order_by('id'))
+    )
+    serializer_class = ReconciliationBatchSerializer
+    lookup_field = 'id'
+
+class ReconciliationMetricsView(APIView):
+    """
+    _Aggregates the stage metrics of the latest reports: runs, total, mean and max seconds per stage.
+    _?limit= sets how many of the latest reports are included (default 100).
+    """
+    def get(self, request, *args, **kwargs):
+        try:
+            limit = int(request.query_params.get('limit', 100))
+        except ValueError:
+            return Response({'error': "'limit' must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+        runs = ReconciliationReport.objects.exclude(metrics_json=None).order_by('-id').values_list('metrics_json', flat=True)[:max(limit, 1)]
+        return Response(summarize(runs))
+
+class ReconciliationSchemaListView(generics.ListCreateAPIView):
+    """Lists the saved schemas and saves new ones, which uploads can then use through schema_name."""
+    queryset = ReconciliationSchema.objects.all()
+    serializer_class = ReconciliationSchemaSerializer
+
+class ReconciliationJobDetailView(generics.RetrieveAPIView):
+    """Reports the status of a background reconciliation job and, once it is done, its report_id."""
+    queryset = ReconciliationJob.objects.all()
+    serializer_class = ReconciliationJobSerializer
+    lookup_field = 'id'
+
+class ReportListPagination(CursorPagination):
+    """Pages the report list newest first, seeking on the timestamp so deep pages cost the same as the first one."""
+    ordering = ('-reconciliation_timestamp', '-id')
+    page_size_query_param = 'limit'
+
+    def get_page_size(self, request):
+        self.page_size = settings.RECONCILIATION_REPORT_PAGE_SIZE
+        self.max_page_size = settings.RECONCILIATION_REPORT_MAX_PAGE_SIZE
+        return super().get_page_size(request)
+
 class ReconiliationReportListView(generics.ListAPIView):
-    queryset = ReconciliationReport.objects.all()
-    serializer_class = ReconciliationReportSerializer 
+    """
+    _Lists the reports, newest first, without their records.
+    _Only the columns of the listing are loaded, with the names of both files in the same query.
+    _Filters: date_from and date_to (ISO dates or datetimes, a date_to date includes that whole day) and filename,
+     which matches part of the source or target file name.
+    """
+    queryset = ReconciliationReport.objects.select_related('source_file', 'target_file').only(
+        'id', 'reconciliation_timestamp', 'join_columns', 'ignore_columns', 'summary_json', 'baseline_report_id',
+        'source_file__original_filename', 'target_file__original_filename',
+    )
+    serializer_class = ReconciliationReportListSerializer
+    pagination_class = ReportListPagination
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        params = self.request.query_params
+        if params.get('date_from'):
+            queryset = queryset.filter(reconciliation_timestamp__gte=self.parse_date_param(params, 'date_from'))
+        if params.get('date_to'):
+            date_to = self.parse_date_param(params, 'date_to', end_of_day=True)
+            queryset = queryset.filter(reconciliation_timestamp__lt=date_to)
+        if params.get('filename'):
+            queryset = queryset.filter(
+                Q(source_file__original_filename__icontains=params['filename'])
+                | Q(target_file__original_filename__icontains=params['filename'])
+            )
+        return queryset
+
+    @staticmethod
+    def parse_date_param(params, name: str, end_of_day: bool = False) -> datetime.datetime:
+        """Read a date or datetime parameter. A date starts its day, or ends it with end_of_day."""
+        value = params[name]
+        try:
+            day = parse_date(value)
+            if day is not None:
+                moment = datetime.datetime.combine(day + datetime.timedelta(days=int(end_of_day)), datetime.time.min)
+            else:
+                moment = parse_datetime(value)
+                if moment is None:
+                    raise ValueError
+                if end_of_day:
+                    # A datetime bound is inclusive
+                    moment += datetime.timedelta(microseconds=1)
+        except ValueError:
+            raise ValidationError({name: "Expected an ISO date (YYYY-MM-DD) or datetime."})
+        return timezone.make_aware(moment) if timezone.is_naive(moment) else moment
+
 class ReconciliationReportDetailView(viewsets.ViewSet):
     queryset = ReconciliationReport.objects.all()
     serializer_class = ReconciliationReportSerializer 
@@ -207,18 +333,6 @@ class ReconciliationReportDetailView(viewsets.ViewSet):
             return Response({'error': 'Reconciliation report not found.'}, status=status.HTTP_404_NOT_FOUND)
       
         summary = instance.summary_json or {}
-        missing_in_source = instance.missing_in_source_json or []
-        missing_in_target = instance.missing_in_target_json or []
-        discrepancies = instance.discrepancies_json or []
-        
- 
-        #print(type(json.loads(missing_in_source)))
-        formatter = ReportFormatter(
-             summary=summary,
-             missing_source=json.loads(missing_in_source),
-             missing_target=json.loads(missing_in_target),
-             discrepancies=discrepancies
-        )
      
         
          #format_type = request.query_params.get('format', 'json').lower()
@@ -230,52 +344,111 @@ class ReconciliationReportDetailView(viewsets.ViewSet):
 
         #print(request.query_params.get('format', 'json').lower(),"The request format parameter")
         
-        if format_type == "csv":
+        if format_type in EXPORT_FORMATS:
+            report_id = kwargs.get('id')  # Get the ID from the URL parameters
+            filename = f"Reconciliation_Report_Idno_{report_id}.{format_type}"
+            content_type = 'text/csv' if format_type == 'csv' else 'text/html'
             try:
-                csv_data = formatter.to_csv()
-                response = HttpResponse(csv_data, content_type='text/csv')
-                report_id = kwargs.get('id')  # Get the ID from the URL parameters
-                filename = f"Reconciliation_Report_Idno_{report_id}.csv"
-                response['Content-Disposition'] = f'attachment; filename="{filename}"'
-                return response
+                export_file = open_export(instance, format_type)
+                if export_file is None:
+                    # Not cached yet: send the export as it renders, the first chunk surfaces early errors
+                    chunks = stream_export(instance, format_type)
+                    first_chunk = next(chunks, b'')
             except Exception as e:
-                logger.error(f"Error generating CSV: {e}")
-                return HttpResponse(f"Error generating CSV: {e}", status=500)
-
-            #return HttpResponse(csv_data, content_type='text/csv')
+                logger.error(f"Error generating {format_type.upper()}: {e}")
+                return HttpResponse(f"Error generating {format_type.upper()}: {e}", status=500)
 
-        elif format_type == "html":
-            try:
-                html_data = formatter.to_html()
-                report_id = kwargs.get('id') 
-                response = HttpResponse(html_data, content_type='text/html')
-                filename = f"Reconciliation_Report_Idno_{report_id}.html"
-                response['Content-Disposition'] = f'attachment; filename="{filename}"'
+            if export_file is None:
+                response = StreamingHttpResponse(rendered_chunks(first_chunk, chunks), content_type=content_type)
+                response['Content-Disposition'] = content_disposition_header(True, filename)
                 return response
-            except Exception as e:
-                logger.error(f"Error generating HTML: {e}")
-                return HttpResponse(f"<p>Error generating HTML: {e}</p>", status=500)
 
+            etag, last_modified = export_validators(instance, format_type, export_file)
+            not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if not_modified is not None:
+                export_file.close()
+                return not_modified
+
+            response = FileResponse(export_file, as_attachment=True, filename=filename, content_type=content_type)
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+            return response
 
         else:
-            return Response({
-                    "summary": summary,
-                    "missing_in_source": missing_in_source,
-                    "missing_in_target": missing_in_target,
-                    "discrepancies": discrepancies,
-                })
-
-def validate_file_columns(df: pd.DataFrame, required_columns: List[str]):
-    """Validates if a DataFrame contains all the required columns (case-insensitive)."""
-    df_lower_columns = {col.lower() for col in df.columns}
-    missing_columns = []
-    for req_col in required_columns:
-        found = False
-        for df_col_lower in df_lower_columns:
-            if req_col.lower() == df_col_lower:
-                found = True
-                break
-        if not found:
-            missing_columns.append(req_col)
-    if missing_columns:
-        raise ValueError(f"Missing required columns (case-insensitive): {', '.join(missing_columns)}")
\ No newline at end of file
+            try:
+                return Response(self.report_pages(request, instance, summary))
+            except ValueError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    def report_pages(self, request, instance, summary) -> dict:
+        """
+        _Build the JSON report one page at a time.
+        _Without a section, the first page of every section is returned with the summary. With ?section=, only that
+         section is returned. Each section carries a "next" link to its following page, seeked with ?after=.
+        _Filters: discrepancy_type, column (a column listed in other_discrepancies), key_from and key_to (join key range,
+         compared by value when both bounds are numbers, as text otherwise).
+        """
+        section, limit, after = page_params(request.query_params)
+        pages = {}
+        for name, queryset in section_querysets(instance, request.query_params, section):
+            results, next_after = results_page(queryset, after if section else None, limit)
+            pages[name] = {'next': section_link(request.build_absolute_uri(), name, next_after), 'results': results}
+
+        if section is not None:
+            return {'section': section, **pages[section]}
+        return {'summary': summary, **pages}
+
+
+def rendered_chunks(first_chunk: bytes, chunks: Iterator[bytes]) -> Iterator[bytes]:
+    """Send an export while stream_export renders it, closing the rendering, and its temporary file, if the client went away."""
+    try:
+        yield first_chunk
+        yield from chunks
+    finally:
+        chunks.close()
+
+
+def export_validators(instance: ReconciliationReport, format_type: str, export_file) -> tuple[str, int]:
+    """Return the ETag and Last-Modified time of an export file."""
+    # The export is a file that only changes if it is rendered again, so its stat makes a stable validator
+    stat = os.fstat(export_file.fileno())
+    etag = f'"{instance.id}-{format_type}-{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+    return etag, int(stat.st_mtime)
+
+
+def page_params(params) -> tuple[Optional[str], int, Optional[int]]:
+    """Check the section, limit and after parameters of a JSON report request."""
+    section = params.get('section')
+    if section is not None and section not in REPORT_SECTIONS:
+        raise ValueError(f"Unknown section '{section}'. Expected one of: {', '.join(REPORT_SECTIONS)}")
+    try:
+        limit = int(params.get('limit', settings.RECONCILIATION_REPORT_PAGE_SIZE))
+        after = int(params['after']) if params.get('after') else None
+    except ValueError:
+        raise ValueError("'limit' and 'after' must be integers.")
+    if not 0 < limit <= settings.RECONCILIATION_REPORT_MAX_PAGE_SIZE:
+        raise ValueError(f"'limit' must be between 1 and {settings.RECONCILIATION_REPORT_MAX_PAGE_SIZE}.")
+    return section, limit, after
+
+
+def section_querysets(instance: ReconciliationReport, params, section: Optional[str]) -> List[tuple[str, Any]]:
+    """Return the filtered result rows of the requested section, or of every section, without querying them yet."""
+    return [
+        (name, filter_results(
+            instance,
+            category,
+            discrepancy_type=params.get('discrepancy_type') or None,
+            column=params.get('column') or None,
+            key_from=params.get('key_from'),
+            key_to=params.get('key_to'),
+        ))
+        for name, category in REPORT_SECTIONS.items()
+        if section is None or name == section
+    ]
+
+
+def section_link(uri: str, name: str, next_after: Optional[int]) -> Optional[str]:
+    """Return the link to the next page of a section, or None on its last page."""
+    if next_after is None:
+        return None
+    return replace_query_param(replace_query_param(uri, 'section', name), 'after', next_after)
@@ -46,6 +46,15 @@ REST_FRAMEWORK = {
     'STRICT_JSON': False,
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
     'DEFAULT_PAGINATION_CLASS': None,  # No pagination for this assessment
+    'DEFAULT_RENDERER_CLASSES': [
+        'reconapp.renderers.ORJSONRenderer',  # orjson when it is installed, the DRF JSON renderer otherwise
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'reconapp.renderers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny'  # For simplicity in this assessment
     ]
@@ -60,6 +69,29 @@ SPECTACULAR_SETTINGS = {
 }
 MEDIA_URL = '/recon_uploads/' #The path where the files will be uploaded
 MEDIA_ROOT = os.path.join(BASE_DIR, 'recon_uploads')
+RECONCILIATION_MEMORY_BUDGET_MB = 512  # Files expected to need more than this are reconciled out of core
+RECONCILIATION_SPILL_DIR = None  # Directory for the on-disk spill buckets, defaults to the system temp directory
+RECONCILIATION_WORKERS = 1  # Worker processes used to reconcile hash partitions in parallel, 1 keeps it serial
+RECONCILIATION_PARALLEL_MIN_ROWS = 100000  # Smaller reconciliations stay serial, a process pool would only add overhead
+RECONCILIATION_CSV_ENGINE = 'c'  # Engine for CSV files parsed with a schema: 'c' or 'pyarrow'
+RECONCILIATION_STRING_STORAGE = 'object'  # Normalized text columns: 'object', or opt in to 'category' (repetitive columns) or 'pyarrow'
+RECONCILIATION_RESULT_BATCH_SIZE = 1000  # Report records inserted per bulk_create batch
+RECONCILIATION_REPORT_PAGE_SIZE = 100  # Records per section page of the JSON report
+RECONCILIATION_REPORT_MAX_PAGE_SIZE = 1000  # Largest page a client can ask for with ?limit=
+RECONCILIATION_PARSED_CACHE_DIR = None  # Normalized copies of uploaded files, defaults to MEDIA_ROOT/parsed_uploads
+RECONCILIATION_PARSED_CACHE_MAX_MB = 4096  # Least recently used parsed copies are evicted beyond this size
+RECONCILIATION_EXPORT_CACHE_DIR = None  # Rendered CSV/HTML downloads, defaults to MEDIA_ROOT/report_exports
+RECONCILIATION_EXPORT_CACHE_MAX_MB = 1024  # Least recently downloaded exports are evicted beyond this size
+RECONCILIATION_EAGER_EXPORT_FORMATS = []  # Export formats rendered right after reconciliation, e.g. ['csv', 'html']
+RECONCILIATION_JOB_WORKERS = 2  # Threads running background reconciliation jobs, 0 runs them inside the request
+RECONCILIATION_ASYNC_WORKERS = 2  # Threads running the reconciliations of the async endpoints, 0 runs them in the request's thread
+RECONCILIATION_BENCHMARK_BASELINE = os.path.join(BASE_DIR, 'benchmarks', 'baseline.json')  # Timings the benchmark_reconciliation command compares with
+RECONCILIATION_BENCHMARK_TOLERANCE = 0.2  # Slowdown or memory growth, relative to the baseline, reported as a regression
+FILE_UPLOAD_HANDLERS = [
+    # Same as Django's defaults, but they also hash the uploads as they stream in
+    'reconapp.uploads.ContentHashMemoryFileUploadHandler',
+    'reconapp.uploads.ContentHashTemporaryFileUploadHandler',
+]
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',